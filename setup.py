@@ -24,6 +24,7 @@ requires = [
     'jsonschema_serialize_fork',
     'loremipsum',
     'netaddr',
+    'openpyxl',
     'passlib',
     'psutil',
     'pyramid_retry',
@@ -40,7 +41,6 @@ requires = [
     'simplejson',
     'strict_rfc3339',
     'subprocess_middleware',
-    'xlrd',
     'zope.sqlalchemy',
     'bcrypt',
 ]
@@ -84,8 +84,10 @@ setup(
         create-mapping = snovault.elasticsearch.create_mapping:main
         dev-servers = snovault.dev_servers:main
         es-index-listener = snovault.elasticsearch.es_index_listener:main
+        upgrade-benchmark = snovault.commands.upgrade_benchmark:main
 
         add-date-created = snowflakes.commands.add_date_created:main
+        bulk-import = snowflakes.commands.bulk_import:main
         check-rendering = snowflakes.commands.check_rendering:main
         deploy = snowflakes.commands.deploy:main
         extract_test_data = snowflakes.commands.extract_test_data:main
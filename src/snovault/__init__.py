@@ -47,6 +47,7 @@ def includeme(config):
     config.include('pyramid_tm')
     config.include('.util')
     config.include('.stats')
+    config.include('.replicas')
     config.include('.batchupgrade')
     config.include('.calculated')
     config.include('.config')
@@ -13,6 +13,7 @@ from webob.cookies import JSONSerializer
 from .json_renderer import json_renderer
 from pyramid.settings import (
     asbool,
+    aslist,
 )
 
 STATIC_MAX_AGE = 0
@@ -51,8 +52,10 @@ def changelogs(config):
         'profiles/changelogs', 'schemas/changelogs', cache_max_age=STATIC_MAX_AGE)
 
 
-def configure_engine(settings):
-    engine_url = settings['sqlalchemy.url']
+def configure_engine(settings, url=None):
+    """ Engine from the sqlalchemy.* settings, optionally for another url
+    """
+    engine_url = url or settings['sqlalchemy.url']
     engine_opts = {}
     if engine_url.startswith('postgresql'):
         if settings.get('indexer_worker'):
@@ -66,6 +69,8 @@ def configure_engine(settings):
             json_serializer=json_renderer.dumps,
             connect_args={'application_name': application_name}
         )
+    if url is not None:
+        engine_opts['url'] = url
     engine = engine_from_config(settings, 'sqlalchemy.', **engine_opts)
     if engine.url.drivername == 'postgresql':
         timeout = settings.get('postgresql.statement_timeout')
@@ -113,8 +118,17 @@ def configure_dbsession(config):
         import snovault.storage
         import zope.sqlalchemy
         from sqlalchemy import orm
+        from snovault.replicas import (
+            REPLICA_URLS,
+            RoutingSession,
+        )
 
-        DBSession = orm.scoped_session(orm.sessionmaker(bind=engine))
+        replicas = [
+            configure_engine(settings, url)
+            for url in aslist(settings.get(REPLICA_URLS, ''))
+        ]
+        DBSession = orm.scoped_session(orm.sessionmaker(
+            bind=engine, class_=RoutingSession, replicas=replicas))
         zope.sqlalchemy.register(DBSession)
         snovault.storage.register(DBSession)
 
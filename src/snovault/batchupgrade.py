@@ -9,33 +9,65 @@ Production or Release Candidate
     bin/batchupgrade production.ini --app-name app --processes 16 --batchsize 1000
 
 """
+import atexit
 import logging
+import queue
+import threading
 import time
 import transaction
 
 from copy import deepcopy
-from itertools import groupby
+from itertools import (
+    groupby,
+    islice,
+)
+from multiprocessing import get_context
+from multiprocessing.pool import Pool
 
 from pyramid import paster
+from pyramid.events import ApplicationCreated
+from pyramid.scripting import prepare
+from pyramid.settings import asbool
 from pyramid.traversal import find_resource
 from pyramid.view import view_config
 
 from snovault import (
-    CONNECTION,
+    COLLECTIONS,
     STORAGE,
+    TYPES,
     UPGRADER,
 )
+from snovault.cache import LRUCache
+from snovault.interfaces import UPGRADE_WRITE_BACK
 from snovault.schema_utils import validate
 
 
 BATCH_UPGRADE_LOG = logging.getLogger('snovault.batchupgrade')
 EPILOG = __doc__
-testapp = None
+app = None
+# Passed to the app of the batchupgrade command and its workers
+APP_OPTIONS = {'batchupgrade': 'true'}
 
 
 def includeme(config):
     config.add_route('batch_upgrade', '/batch_upgrade')
     config.scan(__name__)
+    settings = config.registry.settings
+    # Indexer workers are read only and batchupgrade writes items itself
+    if settings.get('indexer_worker') or asbool(settings.get('batchupgrade', False)):
+        return
+    if asbool(settings.get('upgrader.write_back', False)):
+        config.registry[UPGRADE_WRITE_BACK] = UpgradeWriteBack(
+            config.registry,
+            interval=float(settings.get('upgrader.write_back_interval', 60)),
+            batchsize=int(settings.get('upgrader.write_back_batchsize', 100)),
+            max_pending=int(settings.get('upgrader.write_back_max_pending', 100000)),
+        )
+        config.add_subscriber(start_write_back, ApplicationCreated)
+
+
+def start_write_back(event):
+    event.app.registry[UPGRADE_WRITE_BACK].start()
 
 
 def update_item(storage, context):
@@ -70,13 +102,11 @@ def update_item(storage, context):
     return update, errors
 
 
-@view_config(route_name='batch_upgrade', request_method='POST', permission='import_items')
-def batch_upgrade(request):
-    request.datastore = 'database'
-    transaction.get().setExtendedInfo('upgrade', True)
-    batch = request.json['batch']
-    root = request.root
-    storage = request.registry[STORAGE].write
+def upgrade_uuids(root, storage, batch):
+    """ Upgrade the items of batch, each within its own savepoint
+
+    Returns (item_type, uuid, update, error, error_msg) for each uuid.
+    """
     session = storage.DBSession()
     results = []
     for uuid in batch:
@@ -114,70 +144,206 @@ def batch_upgrade(request):
             else:
                 sp.commit()
         results.append((item_type, uuid, update, error, error_msg))
-    return {'results': results}
+    return results
 
 
-def _pool_batch_results(iterable, n=1):
-    l = len(iterable)
-    for ndx in range(0, l, n):
-        yield iterable[ndx:min(ndx+n, l)]
+@view_config(route_name='batch_upgrade', request_method='POST', permission='import_items')
+def batch_upgrade(request):
+    request.datastore = 'database'
+    transaction.get().setExtendedInfo('upgrade', True)
+    batch = request.json['batch']
+    storage = request.registry[STORAGE].write
+    return {'results': upgrade_uuids(request.root, storage, batch)}
 
 
-def _pool_initializer(*args, **kw):
-    global testapp
-    testapp = _internal_app(*args, **kw)
+def upgrade_batch(registry, batch):
+    """ Upgrade batch in its own transaction, outside of any request
+    """
+    env = prepare(registry=registry)
+    env['request'].datastore = 'database'
+    try:
+        txn = transaction.begin()
+        txn.setExtendedInfo('upgrade', True)
+        results = upgrade_uuids(env['root'], registry[STORAGE].write, batch)
+        transaction.commit()
+    except Exception:
+        transaction.abort()
+        raise
+    finally:
+        env['closer']()
+    return results
+
+
+class UpgradeWriteBack(object):
+    """ Persist upgrades of items found out of date when read
+
+    Items are upgraded on every read until they are written back, so
+    upgrade_properties records the uuids of out of date items here. A
+    daemon thread, started once the app is created and stopped at exit,
+    wakes every interval seconds and writes the batchsize items recorded
+    first in one transaction with update_item, as the batch upgrade does:
+    no modification events are sent and the items are not reindexed.
+
+    The web process writes to the database, so upgrader.write_back must
+    stay off in read only deployments and on read replicas.
+    """
+    def __init__(self, registry, interval=60, batchsize=100, max_pending=100000):
+        self.registry = registry
+        self.interval = interval
+        self.batchsize = batchsize
+        self.max_pending = max_pending
+        # Ordered, the items recorded first are written first
+        self.pending = {}
+        # Items that failed to validate are not retried in this process,
+        # the most recent max_pending of them are remembered
+        self.failed = LRUCache(max_pending, threshold=0)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def record(self, uuid):
+        with self.lock:
+            if uuid in self.failed or len(self.pending) >= self.max_pending:
+                return
+            self.pending[uuid] = None
+
+    def pop_batch(self):
+        with self.lock:
+            batch = list(islice(self.pending, self.batchsize))
+            for uuid in batch:
+                del self.pending[uuid]
+            return batch
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self.run, name='upgrade_write_back', daemon=True)
+            self.thread.start()
+        # Let a write in progress finish before the interpreter exits
+        atexit.register(self.stop)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write_back()
+            except Exception:
+                BATCH_UPGRADE_LOG.exception('Upgrade write back failed')
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def write_back(self):
+        batch = self.pop_batch()
+        if not batch:
+            return []
+        results = upgrade_batch(self.registry, batch)
+        for item_type, uuid, update, error, error_msg in results:
+            if error:
+                BATCH_UPGRADE_LOG.warning('Unable to write back upgrade: %s', error_msg)
+                with self.lock:
+                    self.failed[uuid] = True
+        BATCH_UPGRADE_LOG.info(
+            'Wrote back upgrades of %d of %d items',
+            sum(update and not error for _, _, update, error, _ in results), len(results))
+        return results
+
+
+def _iter_batches(uuids, batchsize):
+    batch = []
+    for uuid in uuids:
+        batch.append(str(uuid))
+        if len(batch) >= batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _pool_initializer(config_uri, app_name=None):
+    global app
+    app = paster.get_app(config_uri, app_name, options=APP_OPTIONS)
 
 
 def _pool_worker(batch):
-    res = testapp.post_json('/batch_upgrade', {'batch': batch})
-    return res.json
+    return upgrade_batch(app.registry, batch)
 
 
-def _pool_chunksize(uuid_count, chunksize, processes):
-    chunkiness = int((uuid_count - 1) / processes) + 1
-    if chunkiness > chunksize:
-        return chunksize
-    return chunkiness
+def _run_pool(registry, item_types, args):
+    """ Upgrade item_types on a process pool
 
-
-def _run_pool(uuids, args):
-    from multiprocessing import get_context
-    from multiprocessing.pool import Pool
+    uuids are streamed from the database in this thread, not the pool's
+    task handler thread, and at most two batches per process are queued.
+    """
+    collections = registry[COLLECTIONS]
     transaction.abort()
     pool = Pool(
         processes=args.processes,
         initializer=_pool_initializer,
-        initargs=(args.config_uri, args.app_name, args.username),
+        initargs=(args.config_uri, args.app_name),
         context=get_context('forkserver'),
         maxtasksperchild=args.maxtasksperchild,
     )
-    est_loops = int(len(uuids) / args.batchsize)
+    max_in_flight = args.processes * 2
+    # Results or exceptions, put by the pool's result handler thread
+    done = queue.Queue()
     all_results = []
     try:
-        pool_gen = pool.imap_unordered(
-            _pool_worker,
-            _pool_batch_results(uuids, args.batchsize),
-            chunksize=args.chunksize,
-        )
-        for loop, result in enumerate(pool_gen, 1):
-            results = result['results']
-            error_msgs = [
-                error_msg
-                for _, _, _, _, error_msg in results
-                if error_msg
-            ]
-            updated_cnt = sum(update for _, _, update, _, _ in results)
-            log_msg = "{} of ~{} Batch: Updated {} of {} (errors {})".format(
-                loop,
-                est_loops,
-                updated_cnt,
-                len(results),
-                len(error_msgs),
-            )
-            BATCH_UPGRADE_LOG.info(log_msg)
-            for error_msg in error_msgs:
-                BATCH_UPGRADE_LOG.error("\t%s", error_msg)
-            all_results.extend(results)
+        for item_type in item_types:
+            collection = collections.by_item_type[item_type]
+            item_count = len(collection)
+            if not item_count:
+                continue
+            est_loops = int((item_count - 1) / args.batchsize) + 1
+            type_start = time.time()
+            type_count = 0
+            loop = 0
+            in_flight = 0
+            batches = _iter_batches(collection, args.batchsize)
+            while True:
+                batch = None
+                if in_flight < max_in_flight:
+                    batch = next(batches, None)
+                if batch is not None:
+                    pool.apply_async(
+                        _pool_worker, (batch,), callback=done.put, error_callback=done.put)
+                    in_flight += 1
+                    continue
+                if not in_flight:
+                    break
+                results = done.get()
+                in_flight -= 1
+                if isinstance(results, Exception):
+                    raise results
+                loop += 1
+                error_msgs = [
+                    error_msg
+                    for _, _, _, _, error_msg in results
+                    if error_msg
+                ]
+                updated_cnt = sum(update for _, _, update, _, _ in results)
+                type_count += len(results)
+                log_msg = "{} {} of {} Batch: Updated {} of {} (errors {}) {:0.1f} items/s".format(
+                    item_type,
+                    loop,
+                    est_loops,
+                    updated_cnt,
+                    len(results),
+                    len(error_msgs),
+                    type_count / max(time.time() - type_start, 1e-6),
+                )
+                BATCH_UPGRADE_LOG.info(log_msg)
+                for error_msg in error_msgs:
+                    BATCH_UPGRADE_LOG.error("\t%s", error_msg)
+                all_results.extend(results)
+            transaction.abort()
+            BATCH_UPGRADE_LOG.info(
+                "Collection %s: %d items in %0.1f seconds", item_type, type_count,
+                time.time() - type_start)
     finally:
         pool.terminate()
         pool.join()
@@ -224,43 +390,33 @@ def _summarize_results(all_results, runtime_str=None, verbose=False):
         BATCH_UPGRADE_LOG.info("Run Time: %s" % runtime_str)
 
 
-def _internal_app(configfile, app_name=None, username=None):
-    from webtest import TestApp
-    from pyramid import paster
-    app = paster.get_app(configfile, app_name)
-    if not username:
-        username = 'UPGRADE'
-    environ = {
-        'HTTP_ACCEPT': 'application/json',
-        'REMOTE_USER': username,
-    }
-    return TestApp(app, environ)
-
-
 def main():
     args = _parse_args()
     # Setup Logger
     paster.setup_logging(args.config_uri)
     logging.getLogger('snovault').setLevel(logging.INFO)
-    # Get Uuids
-    testapp = _internal_app(args.config_uri, app_name=args.app_name, username=args.username)
-    connection = testapp.app.registry[CONNECTION]
-    uuids = [str(uuid) for uuid in connection.__iter__(*args.item_types)]
-    if uuids:
-        log_msg = "Start Upgrade with {} items: {}, {}, {}, {}".format(
-            len(uuids),
-            args.batchsize,
-            args.chunksize,
-            args.processes,
-            args.maxtasksperchild,
-        )
-        BATCH_UPGRADE_LOG.info(log_msg)
-        pool_start = time.time()
-        all_results = _run_pool(uuids, args)
-        runtime_mins_str = "{:0.2f} minutes".format(
-            (time.time() - pool_start) / 60
-        )
-        BATCH_UPGRADE_LOG.info('End Upgrade')
+    if args.chunksize is not None or args.username is not None:
+        BATCH_UPGRADE_LOG.warning('--chunksize and --username are no longer used')
+    app = paster.get_app(args.config_uri, args.app_name, options=APP_OPTIONS)
+    types = app.registry[TYPES]
+    if args.item_types:
+        item_types = [types[name].item_type for name in args.item_types]
+    else:
+        item_types = sorted(types.by_item_type)
+    log_msg = "Start Upgrade of {} types: {}, {}, {}".format(
+        len(item_types),
+        args.batchsize,
+        args.processes,
+        args.maxtasksperchild,
+    )
+    BATCH_UPGRADE_LOG.info(log_msg)
+    pool_start = time.time()
+    all_results = _run_pool(app.registry, item_types, args)
+    runtime_mins_str = "{:0.2f} minutes".format(
+        (time.time() - pool_start) / 60
+    )
+    BATCH_UPGRADE_LOG.info('End Upgrade')
+    if all_results:
         _summarize_results(all_results, runtime_str=runtime_mins_str, verbose=args.verbose)
     else:
         BATCH_UPGRADE_LOG.warning('No uuids to upgrade.')
@@ -275,11 +431,13 @@ def _parse_args():
     parser.add_argument('config_uri', help="path to configfile")
     parser.add_argument('--app-name', help="Pyramid app name in configfile")
     parser.add_argument('--batchsize', type=int, default=50)
-    parser.add_argument('--chunksize', type=int, default=1)
+    parser.add_argument('--chunksize', type=int, help="Ignored, batches are sent one by one")
     parser.add_argument('--item-types', action='append', default=[])
-    parser.add_argument('--maxtasksperchild', type=int, default=1)
+    parser.add_argument('--maxtasksperchild', type=int, default=None,
+                        help="Batches a worker process upgrades before it is replaced, "
+                        "by default workers are kept (previously 1)")
     parser.add_argument('--processes', type=int, default=2)
-    parser.add_argument('--username')
+    parser.add_argument('--username', help="Ignored, batches are upgraded without a user")
     parser.add_argument('-v', '--verbose', action='store_true')
     args = parser.parse_args()
     return args
@@ -0,0 +1,343 @@
+"""\
+Load many new items at once with Postgres COPY
+
+Meant for bootstrapping a new database from seed data. Rows are read
+twice: the first pass records the uuid and unique keys of every row so
+that linkTo references can be resolved in memory, the second validates
+each row and writes it to temporary files which are copied into the
+resources, propsheets, current_propsheets, keys and links tables within a
+single transaction record. Rows whose uuid or unique keys are already in
+the database are reported as errors before anything is copied.
+
+Types that override Item._update (attachments, users) are still written
+through Item.create, after the resources have been copied.
+"""
+import csv
+import logging
+import tempfile
+import transaction
+import uuid
+
+from collections import deque
+from pyramid.threadlocal import get_current_request
+from sqlalchemy import (
+    text,
+    tuple_,
+)
+from jsonschema_serialize_fork.exceptions import ValidationError
+
+from .interfaces import (
+    COLLECTIONS,
+    DBSESSION,
+    TYPES,
+)
+from .json_renderer import json_renderer
+from .resources import Item
+from .schema_utils import (
+    NoRemoteResolver,
+    SchemaValidator,
+    format_checker,
+    linkTo as database_linkTo,
+    submits_for_error,
+)
+from .storage import (
+    Key,
+    Resource,
+    add_transaction_record,
+)
+from .util import (
+    ensurelist,
+    simple_path_ids,
+)
+
+
+log = logging.getLogger(__name__)
+
+TABLES = [
+    ('resources', ('rid', 'item_type')),
+    ('propsheets', ('rid', 'name', 'properties', 'tid')),
+    ('keys', ('name', 'value', 'rid')),
+    ('links', ('source', 'rel', 'target')),
+]
+
+_insert_current_propsheets = text("""
+    INSERT INTO current_propsheets (rid, name, sid)
+    SELECT rid, name, max(sid) FROM propsheets AS p
+    WHERE tid = :tid AND NOT EXISTS (
+        SELECT 1 FROM current_propsheets AS c
+        WHERE c.rid = p.rid AND c.name = p.name
+    )
+    GROUP BY rid, name
+""")
+
+
+class BulkLoadError(Exception):
+    pass
+
+
+def linkTo(validator, linkTo, instance, schema):
+    if not validator.is_type(instance, "string"):
+        return
+    loader = validator.loader
+    if validator.is_type(linkTo, "string"):
+        types = [linkTo] if linkTo else []
+    elif validator.is_type(linkTo, "array"):
+        types = linkTo
+    else:
+        raise Exception("Bad schema")  # raise some sort of schema error
+    rid = loader.resolve(instance, types)
+    if rid is None:
+        # Not part of this load, it may already be in the database
+        yield from database_linkTo(validator, linkTo, instance, schema)
+        return
+    type_info = loader.types[loader.uuids[rid]]
+    if types and not set([type_info.name] + type_info.base_types).intersection(set(types)):
+        reprs = (repr(it) for it in types)
+        error = "%r is not of type %s" % (instance, ", ".join(reprs))
+        yield ValidationError(error)
+        return
+
+    linkEnum = schema.get('linkEnum')
+    if linkEnum is not None:
+        if not any(uuid.UUID(enum_uuid) == uuid.UUID(rid) for enum_uuid in linkEnum):
+            error = "%r is not one of %s" % (instance, ', '.join(repr(it) for it in linkEnum))
+            yield ValidationError(error)
+            return
+
+    request = get_current_request()
+    if schema.get('linkSubmitsFor') and request is not None:
+        error = submits_for_error(request, instance, uuid.UUID(rid))
+        if error is not None:
+            yield ValidationError(error)
+            return
+
+    # And normalize the value to a uuid
+    if validator._serialize:
+        validator._validated[-1] = rid
+
+
+def allowed(validator, value, instance, schema):
+    # Bulk loads run with full access, as the IMPORT user does
+    return ()
+
+
+class LinkResolvingValidator(SchemaValidator):
+    """ Resolves linkTo against the rows of a BulkLoader first
+    """
+    VALIDATORS = SchemaValidator.VALIDATORS.copy()
+    VALIDATORS['linkTo'] = linkTo
+
+
+class BulkSchemaValidator(LinkResolvingValidator):
+    VALIDATORS = LinkResolvingValidator.VALIDATORS.copy()
+    VALIDATORS['permission'] = allowed
+    VALIDATORS['requestMethod'] = allowed
+
+
+def unique_keys(type_info, properties):
+    return {
+        (name, value)
+        for name, props in type_info.schema_keys.items()
+        for prop in props
+        for value in ensurelist(properties.get(prop, ()))
+    }
+
+
+def links(type_info, properties):
+    return {
+        (path, target)
+        for path in type_info.schema_links
+        for target in simple_path_ids(properties, path)
+    }
+
+
+class BulkLoader(object):
+    """ Load rows of new items, see the module docstring
+
+    Call register with the rows of every type, then add with the same rows
+    in the same order, then write within a transaction.
+    """
+    validator_class = BulkSchemaValidator
+    batchsize = 1000
+
+    def __init__(self, registry, validator_class=None):
+        self.registry = registry
+        if validator_class is not None:
+            self.validator_class = validator_class
+        self.types = registry[TYPES]
+        self.collections = registry[COLLECTIONS]
+        # uuid string: type name, for every registered row
+        self.uuids = {}
+        # (key name, value): uuid string
+        self.keys = {}
+        # type name: uuids generated for rows without one, in row order
+        self.generated = {}
+        self.written_keys = set()
+        self.written_uuids = set()
+        # (type name, uuid, message)
+        self.errors = []
+        # (type_info, uuid, properties) written with Item.create
+        self.deferred = []
+        self.counts = {}
+        self.files = {}
+        # Written into the propsheets files before the transaction is recorded
+        self.tid = str(uuid.uuid4())
+
+    def register(self, type_name, rows):
+        type_info = self.types[type_name]
+        generated = self.generated.setdefault(type_info.name, deque())
+        for row in rows:
+            rid = row.get('uuid')
+            if rid is None:
+                rid = str(uuid.uuid4())
+                generated.append(rid)
+            self.uuids[rid] = type_info.name
+            for key in unique_keys(type_info, row):
+                # Duplicates are reported when the rows are added
+                self.keys.setdefault(key, rid)
+
+    def resolve(self, value, types=()):
+        """ The uuid of the registered row value refers to, or None
+        """
+        if value in self.uuids:
+            return value
+        collection = None
+        parts = value.strip('/').split('/')
+        if value.startswith('/') and len(parts) == 2:
+            collection = self.collections.get(parts[0])
+            value = parts[1]
+            if value in self.uuids:
+                return value
+        elif len(types) == 1:
+            collection = self.collections.get(types[0])
+        unique_key = getattr(collection, 'unique_key', None)
+        if unique_key is None:
+            return None
+        return self.keys.get((unique_key, value))
+
+    def validate(self, type_info, row):
+        schema = type_info.schema
+        validator = self.validator_class(
+            schema, resolver=NoRemoteResolver.from_schema(schema),
+            serialize=True, format_checker=format_checker)
+        validator.loader = self
+        return validator.serialize(row)
+
+    def iter_valid(self, type_name, rows):
+        """ (type_info, uuid, validated) for each registered row that is valid
+
+        Errors are recorded in self.errors.
+        """
+        type_info = self.types[type_name]
+        generated = self.generated.get(type_info.name, ())
+        for row in rows:
+            rid = row.get('uuid')
+            validated, errors = self.validate(type_info, row)
+            if rid is None:
+                rid = validated['uuid'] = generated.popleft()
+            if errors:
+                for error in errors:
+                    path = '/'.join(str(x) or '<root>' for x in error.path)
+                    self._error(type_info, rid, '%s: %s' % (path, error.message))
+                continue
+            keys = unique_keys(type_info, validated)
+            taken = sorted(
+                key for key in keys
+                if key in self.written_keys or self.keys.get(key, rid) != rid
+            )
+            if taken:
+                self._error(type_info, rid, 'Keys conflict: %r' % taken)
+                continue
+            self.written_keys.update(keys)
+            self.written_uuids.add(rid)
+            yield type_info, rid, validated
+
+    def add(self, type_name, rows):
+        count = 0
+        for type_info, rid, validated in self.iter_valid(type_name, rows):
+            count += 1
+            self.counts[type_info.name] = self.counts.get(type_info.name, 0) + 1
+            # Types that do more than store their properties
+            if type_info.factory._update is not Item._update:
+                self.deferred.append((type_info, rid, validated))
+                continue
+            properties = {k: v for k, v in validated.items() if k != 'uuid'}
+            self._writer('resources').writerow([rid, type_info.item_type])
+            self._writer('propsheets').writerow(
+                [rid, '', json_renderer.dumps(properties), self.tid])
+            for name, value in unique_keys(type_info, validated):
+                self._writer('keys').writerow([name, value, rid])
+            for rel, target in links(type_info, validated):
+                self._writer('links').writerow([rid, rel, target])
+        return count
+
+    def check_existing(self, session):
+        """ Record errors for added rows whose uuid or keys are in the database
+        """
+        rids = {uuid.UUID(rid): rid for rid in self.written_uuids}
+        uuids = sorted(rids)
+        for start in range(0, len(uuids), self.batchsize):
+            query = session.query(Resource.rid).filter(
+                Resource.rid.in_(uuids[start:start + self.batchsize]))
+            for found, in query:
+                rid = rids[found]
+                self._error(self.types[self.uuids[rid]], rid, 'UUID conflict')
+        taken = {}
+        keys = sorted(self.written_keys)
+        for start in range(0, len(keys), self.batchsize):
+            query = session.query(Key.name, Key.value).filter(
+                tuple_(Key.name, Key.value).in_(keys[start:start + self.batchsize]))
+            for name, value in query:
+                taken.setdefault(self.keys[name, value], []).append((name, value))
+        for rid, keys in sorted(taken.items()):
+            self._error(self.types[self.uuids[rid]], rid, 'Keys conflict: %r' % sorted(keys))
+
+    def _error(self, type_info, rid, message):
+        log.error('/%s/%s %s', type_info.item_type, rid, message)
+        self.errors.append((type_info.name, rid, message))
+
+    def _writer(self, table):
+        if table not in self.files:
+            self.files[table] = tempfile.TemporaryFile(mode='w+', newline='')
+        return csv.writer(self.files[table])
+
+    def write(self):
+        """ Copy the added rows into the database in the current transaction
+        """
+        session = self.registry[DBSESSION]()
+        if session.bind.dialect.name != 'postgresql':
+            raise BulkLoadError('Bulk loading requires postgresql')
+        self.check_existing(session)
+        if self.errors:
+            raise BulkLoadError('%d rows failed to validate' % len(self.errors))
+        txn = transaction.get()
+        if '_snovault_transaction_record' in txn._extension:
+            raise BulkLoadError('Bulk loading must start a new transaction')
+        txn.setExtendedInfo('tid', uuid.UUID(self.tid))
+        txn.setExtendedInfo('bulk_load', True)
+        add_transaction_record(session, None, None)
+        session.flush()
+
+        # Resources first, the items created through the ORM may link to them
+        self._copy(session, 'resources')
+        for type_info, rid, properties in self.deferred:
+            type_info.factory.create(self.registry, rid, properties)
+        session.flush()
+        for table, _ in TABLES[1:]:
+            self._copy(session, table)
+            if table == 'propsheets':
+                session.execute(_insert_current_propsheets, {'tid': self.tid})
+        return self.counts
+
+    def _copy(self, session, table):
+        stream = self.files.pop(table, None)
+        if stream is None:
+            return
+        columns = dict(TABLES)[table]
+        stream.seek(0)
+        cursor = session.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table, ', '.join(columns)),
+            stream)
+        cursor.close()
+
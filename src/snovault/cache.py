@@ -1,17 +1,114 @@
+from collections import OrderedDict
+from pyramid.settings import asbool
 from pyramid.threadlocal import manager
-from sqlalchemy.util import LRUCache
 import transaction.interfaces
 from zope.interface import implementer
+from .util import get_root_request
+
+
+def estimated_size(value):
+    """ Rough size in bytes of value serialized as JSON.
+
+    Cheaper than serializing, and close enough to budget cache memory.
+    """
+    if isinstance(value, dict):
+        return 2 + sum(
+            len(key) + 4 + estimated_size(item)
+            for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return 2 + sum(estimated_size(item) + 1 for item in value)
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, bytes):
+        return len(value)
+    return 8
+
+
+class LRUCache(object):
+    """ Least recently used cache bounded by entry count and optionally bytes.
+
+    As with sqlalchemy's LRUCache, entries are only dropped once the count
+    passes capacity * (1 + threshold), and then down to capacity. Once the
+    estimated size of the entries passes max_bytes, the least recently
+    used entries are dropped until it fits again.
+
+    Sizes are only estimated with max_bytes or track_bytes set, otherwise
+    bytes stays 0.
+    """
+    def __init__(self, capacity=100, threshold=.5, max_bytes=None, sizeof=estimated_size,
+                 track_bytes=False):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.track_bytes = track_bytes or bool(max_bytes)
+        self.bytes = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        value, size = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.bytes -= entry[1]
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        size = self.sizeof(value) if self.track_bytes else 0
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._data[key] = (value, size)
+        self.bytes += size
+        self._manage_size()
+        return size
+
+    def _manage_size(self):
+        if len(self._data) > self.capacity * (1 + self.threshold):
+            while len(self._data) > self.capacity:
+                self._evict()
+        if self.max_bytes:
+            while self.bytes > self.max_bytes and self._data:
+                self._evict()
+
+    def _evict(self):
+        key, (value, size) = self._data.popitem(last=False)
+        self.bytes -= size
+        self.evictions += 1
 
 
 @implementer(transaction.interfaces.ISynchronizer)
 class ManagerLRUCache(object):
-    """ Override capacity in settings.
+    """ Override capacity, max_bytes and track_bytes in settings.
+
+    With stats_prefix set, lookups are also counted in the root request's
+    stats, reported in the X-Stats header.
     """
-    def __init__(self, name, default_capacity=100, threshold=.5):
+    def __init__(self, name, default_capacity=100, threshold=.5,
+                 default_max_bytes=None, stats_prefix=None, default_track_bytes=False):
         self.name = name
         self.default_capacity = default_capacity
         self.threshold = threshold
+        self.default_max_bytes = default_max_bytes
+        self.default_track_bytes = default_track_bytes
+        self.stats_prefix = stats_prefix
+        # Process lifetime counts, see stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_stored = 0
         transaction.manager.registerSynch(self)
 
     @property
@@ -22,17 +119,52 @@ class ManagerLRUCache(object):
         if self.name not in threadlocals:
             registry = threadlocals['registry']
             capacity = int(registry.settings.get(self.name + '.capacity', self.default_capacity))
-            threadlocals[self.name] = LRUCache(capacity, self.threshold)
+            max_bytes = int(
+                registry.settings.get(self.name + '.max_bytes', self.default_max_bytes) or 0
+            )
+            track_bytes = asbool(
+                registry.settings.get(self.name + '.track_bytes', self.default_track_bytes)
+            )
+            threadlocals[self.name] = LRUCache(
+                capacity, self.threshold, max_bytes or None, track_bytes=track_bytes,
+            )
         return threadlocals[self.name]
 
+    def _count(self, name, value=1):
+        if self.stats_prefix is None:
+            return
+        request = get_root_request()
+        stats = getattr(request, '_stats', None)
+        if stats is None:
+            return
+        key = self.stats_prefix + '_' + name
+        stats[key] = stats.get(key, 0) + value
+
     def get(self, key, default=None):
         cache = self.cache
         if cache is None:
             return default
         try:
-            return cache[key]
+            value = cache[key]
         except KeyError:
+            self.misses += 1
+            self._count('misses')
             return default
+        self.hits += 1
+        self._count('hits')
+        return value
+
+    def stats(self):
+        """ Lookup counts, plus the bytes held by the current cache
+        """
+        cache = self.cache
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes_stored': self.bytes_stored,
+            'bytes': cache.bytes if cache is not None else 0,
+        }
 
     def __contains__(self, key):
         cache = self.cache
@@ -44,7 +176,20 @@ class ManagerLRUCache(object):
         cache = self.cache
         if cache is None:
             return
-        self.cache[key] = value
+        evictions = cache.evictions
+        size = cache.__setitem__(key, value)
+        evicted = cache.evictions - evictions
+        self.evictions += evicted
+        self.bytes_stored += size
+        if evicted:
+            self._count('evictions', evicted)
+        if size:
+            self._count('bytes', size)
+
+    def clear(self):
+        if manager.stack:
+            threadlocals = manager.stack[0]
+            threadlocals.pop(self.name, None)
 
     # ISynchronizer
 
@@ -53,9 +198,7 @@ class ManagerLRUCache(object):
 
     def afterCompletion(self, transaction):
         # Ensure cache is cleared for retried transactions
-        if manager.stack:
-            threadlocals = manager.stack[0]
-            threadlocals.pop(self.name, None)
+        self.clear()
 
     def newTransaction(self, transaction):
         pass
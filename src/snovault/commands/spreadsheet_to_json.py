@@ -8,6 +8,7 @@ Example:
 from .. import loadxl
 import json
 import os.path
+import textwrap
 
 EPILOG = __doc__
 
@@ -36,11 +37,21 @@ def convert(filename, sheetname=None, outputdir=None, skip_blanks=False):
         rename_test_with_underscore,
         remove_empty,
     ]
-    data = list(loadxl.combine(source, pipeline))
     if sheetname is None:
         sheetname, ext = os.path.splitext(os.path.basename(filename))
-    out = open(os.path.join(outputdir, sheetname + '.json'), 'w')
-    json.dump(data, out, sort_keys=True, indent=4, separators=(',', ': '))
+    with open(os.path.join(outputdir, sheetname + '.json'), 'w') as out:
+        write_json_list(loadxl.combine(source, pipeline), out)
+
+
+def write_json_list(rows, out):
+    """ Write rows as json.dump(list(rows), out, indent=4) would, a row at a time
+    """
+    separator = '['
+    for row in rows:
+        text = json.dumps(row, sort_keys=True, indent=4, separators=(',', ': '))
+        out.write(separator + '\n' + textwrap.indent(text, '    ', lambda line: True))
+        separator = ','
+    out.write('[]' if separator == '[' else '\n]')
 
 
 
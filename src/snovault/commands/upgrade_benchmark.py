@@ -0,0 +1,125 @@
+"""\
+Time the upgrade steps applied to a sample of stored items
+
+Examples
+
+To sample 100 items of each type on the production server:
+
+    %(prog)s production.ini --sample 100
+
+For the development.ini you must supply the paster app name:
+
+    %(prog)s development.ini --app-name app --item-type experiment
+
+"""
+import logging
+import random
+import time
+
+from collections import defaultdict
+from pyramid.paster import get_app
+from pyramid.scripting import prepare
+
+from snovault import (
+    CONNECTION,
+    TYPES,
+    UPGRADER,
+)
+from snovault.util import quick_deepcopy
+
+EPILOG = __doc__
+
+logger = logging.getLogger(__name__)
+
+
+def sample_uuids(connection, item_type, sample):
+    uuids = [str(uuid) for uuid in connection.__iter__(item_type)]
+    if sample and len(uuids) > sample:
+        uuids = random.sample(uuids, sample)
+    return uuids
+
+
+def time_item(item, timings):
+    """ Apply the upgrade steps of item one by one, adding to timings
+
+    Returns the number of steps applied.
+    """
+    type_info = item.type_info
+    target_version = type_info.schema_version
+    current_version = item.properties.get('schema_version', '')
+    if target_version is None or current_version == target_version:
+        return 0
+    upgrader = item.registry[UPGRADER]
+    schema_upgrader = upgrader[type_info.name]
+    steps, version = schema_upgrader.steps(current_version, target_version)
+    system = {'context': item, 'registry': item.registry}
+    value = quick_deepcopy(item.properties)
+    for step in steps:
+        start = time.time()
+        next_value = step(value, system)
+        timings[type_info.name, step.source, step.dest].append(time.time() - start)
+        if next_value is not None:
+            value = next_value
+    return len(steps)
+
+
+def run(app, item_types=None, sample=100):
+    env = prepare(registry=app.registry)
+    env['request'].datastore = 'database'
+    try:
+        connection = app.registry[CONNECTION]
+        if not item_types:
+            item_types = sorted(app.registry[TYPES].by_item_type)
+        timings = defaultdict(list)
+        for item_type in item_types:
+            upgraded = 0
+            uuids = sample_uuids(connection, item_type, sample)
+            for item in connection.get_by_uuids(uuids):
+                try:
+                    if time_item(item, timings):
+                        upgraded += 1
+                except Exception:
+                    logger.exception('Upgrade failed: %s', item.uuid)
+            logger.info('Collection %s: %d of %d sampled items need upgrade',
+                        item_type, upgraded, len(uuids))
+    finally:
+        env['closer']()
+    return timings
+
+
+def report(timings):
+    rows = sorted(
+        ((sum(times), schema_name, source, dest, len(times))
+         for (schema_name, source, dest), times in timings.items()),
+        reverse=True,
+    )
+    print('%-30s %10s %8s %12s %12s' % ('step', 'versions', 'count', 'total ms', 'mean ms'))
+    for total, schema_name, source, dest, count in rows:
+        print('%-30s %10s %8d %12.2f %12.3f' % (
+            schema_name, '%s-%s' % (source or "''", dest), count,
+            total * 1000, total * 1000 / count))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Benchmark upgrade steps", epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--item-type', action='append', help="Item type")
+    parser.add_argument('--sample', type=int, default=100,
+                        help="Items sampled per type, 0 for all")
+    parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument('config_uri', help="path to configfile")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    app = get_app(args.config_uri, args.app_name)
+
+    # Loading app will have configured from config file. Reconfigure here:
+    logging.getLogger('snovault').setLevel(logging.INFO)
+    report(run(app, args.item_type, args.sample))
+
+
+if __name__ == '__main__':
+    main()
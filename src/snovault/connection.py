@@ -1,5 +1,6 @@
 from past.builtins import basestring
 from pyramid.decorator import reify
+from pyramid.settings import asbool
 from uuid import UUID
 from .cache import ManagerLRUCache
 from .interfaces import (
@@ -7,6 +8,7 @@ from .interfaces import (
     STORAGE,
     TYPES,
 )
+from .util import simple_path_ids
 
 def includeme(config):
     registry = config.registry
@@ -24,8 +26,18 @@ class Connection(object):
         self.registry = registry
         self.item_cache = ManagerLRUCache('snovault.connection.item_cache', 1000)
         self.unique_key_cache = ManagerLRUCache('snovault.connection.key_cache', 1000)
+        self.rev_links_cache = ManagerLRUCache('snovault.connection.rev_links_cache', 10000)
         embed_cache_capacity = int(registry.settings.get('embed_cache.capacity', 5000))
-        self.embed_cache = ManagerLRUCache('snovault.connection.embed_cache', embed_cache_capacity)
+        # Estimated bytes of rendered frames, unbounded when unset
+        embed_cache_max_bytes = int(registry.settings.get('embed_cache.max_bytes') or 0)
+        self.embed_cache = ManagerLRUCache(
+            'snovault.connection.embed_cache',
+            embed_cache_capacity,
+            default_max_bytes=embed_cache_max_bytes or None,
+            stats_prefix='embed_cache',
+            # Byte stats without a limit cost a walk of every stored frame
+            default_track_bytes=asbool(registry.settings.get('embed_cache.track_bytes', False)),
+        )
     @reify
     def storage(self):
         return self.registry[STORAGE]
@@ -52,6 +64,40 @@ class Connection(object):
         if model is None:
             return default
 
+        return self._cache_item(uuid, model)
+
+    def get_by_uuids(self, uuids):
+        '''Items for uuids, in order, leaving out missing ones
+
+        Items not in the item cache are loaded with one storage call.
+        '''
+        found = {}
+        todo = []
+        keys = []
+        for uuid in uuids:
+            try:
+                uuid = str(UUID(str(uuid)))
+            except ValueError:
+                continue
+            keys.append(uuid)
+            if uuid in found:
+                continue
+            cached = self.item_cache.get(uuid)
+            if cached is not None:
+                found[uuid] = cached
+            else:
+                found[uuid] = None
+                todo.append(uuid)
+        if todo:
+            for model in self.storage.get_by_uuids(todo):
+                uuid = str(model.uuid)
+                found[uuid] = self._cache_item(uuid, model)
+        return [
+            item for item in (found[uuid] for uuid in keys)
+            if item is not None
+        ]
+
+    def _cache_item(self, uuid, model):
         try:
             Item = self.types.by_item_type[model.item_type].factory
         except KeyError:
@@ -62,6 +108,53 @@ class Connection(object):
         self.item_cache[uuid] = item
         return item
 
+    def prefetch(self, uuids, depth=1):
+        '''Load uuids, and up to depth levels of items they link to, into the item cache
+
+        Used when rendering a batch of items, e.g. when indexing, so each
+        item is not loaded with its own queries.  Returns the number of
+        items loaded.
+        '''
+        loaded = 0
+        seen = set()
+        todo = {str(uuid) for uuid in uuids}
+        for level in range(depth + 1):
+            todo = {uuid for uuid in todo - seen if uuid not in self.item_cache}
+            if not todo:
+                break
+            seen.update(todo)
+            targets = set()
+            for model in self.storage.get_by_uuids(todo):
+                self._cache_item(str(model.uuid), model)
+                loaded += 1
+                if level < depth:
+                    # Only database models carry their links
+                    targets.update(
+                        str(link.target_rid) for link in getattr(model, 'rels', ())
+                    )
+            todo = targets
+        return loaded
+
+    def prefetch_link_targets(self, source_rels):
+        '''Load the targets of links for (source uuid, rel) pairs into the item cache
+
+        The links of sources already in the item cache are read from their
+        properties, only the others are looked up in storage.  Returns the
+        number of items loaded.
+        '''
+        targets = set()
+        todo_rels = []
+        for source, rel in source_rels:
+            item = self.item_cache.get(str(source))
+            if item is None:
+                todo_rels.append((source, rel))
+            elif rel in item.type_info.schema_links:
+                targets.update(simple_path_ids(item.properties, rel))
+        if todo_rels:
+            targets.update(self.storage.get_link_targets(todo_rels))
+        todo = [str(uuid) for uuid in targets if str(uuid) not in self.item_cache]
+        return len(self.get_by_uuids(todo)) if todo else 0
+
     def get_by_unique_key(self, unique_key, name, default=None, index=None):
         pkey = (unique_key, name)
 
@@ -79,20 +172,35 @@ class Connection(object):
         if cached is not None:
             return cached
 
-        try:
-            Item = self.types.by_item_type[model.item_type].factory
-        except KeyError:
-            raise UnknownItemTypeError(model.item_type)
-
-        item = Item(self.registry, model)
-        model.used_for(item)
-        self.item_cache[uuid] = item
-        return item
+        return self._cache_item(uuid, model)
 
     def get_rev_links(self, model, rel, *types):
         item_types = [self.types[t].item_type for t in types]
+        cached = self.rev_links_cache.get((str(model.uuid), rel, tuple(item_types)))
+        if cached is not None:
+            return cached
         return self.storage.get_rev_links(model, rel, *item_types)
 
+    def prefetch_rev_links(self, uuids):
+        '''Load the reverse links of items into the rev links cache
+
+        One query per distinct (rel, types) among the items' rev properties
+        instead of one per item and property.  Returns the number of
+        queries made.
+        '''
+        targets = {}
+        for item in self.get_by_uuids(uuids):
+            for type_name, rel in item.rev.values():
+                item_types = tuple(
+                    self.types[t].item_type for t in self.types[type_name].subtypes
+                )
+                targets.setdefault((rel, item_types), set()).add(str(item.uuid))
+        for (rel, item_types), rids in targets.items():
+            rev_links = self.storage.get_rev_links_by_targets(rids, rel, *item_types)
+            for rid, sources in rev_links.items():
+                self.rev_links_cache[(rid, rel, item_types)] = sources
+        return len(targets)
+
     def __iter__(self, *types):
         if not types:
             item_types = self.types.by_item_type.keys()
@@ -116,7 +224,14 @@ class Connection(object):
 
     def create(self, type_, uuid):
         ti = self.types[type_]
+        # A new item may be the source of cached reverse links
+        self.rev_links_cache.clear()
         return self.storage.create(ti.item_type, uuid)
 
     def update(self, model, properties, sheets=None, unique_keys=None, links=None):
+        self.rev_links_cache.clear()
         self.storage.update(model, properties, sheets, unique_keys, links)
+
+    def bulk_update(self, updates):
+        self.rev_links_cache.clear()
+        return self.storage.bulk_update(updates)
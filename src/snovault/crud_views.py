@@ -1,4 +1,8 @@
 from past.builtins import basestring
+from pyramid.httpexceptions import (
+    HTTPConflict,
+    HTTPForbidden,
+)
 from pyramid.settings import asbool
 from pyramid.traversal import (
     find_resource,
@@ -8,6 +12,10 @@ from uuid import (
     UUID,
     uuid4,
 )
+from .bulk_load import (
+    BulkLoader,
+    LinkResolvingValidator,
+)
 from .etag import if_match_tid
 from .interfaces import (
     COLLECTIONS,
@@ -32,6 +40,7 @@ from .validators import (
 
 
 def includeme(config):
+    config.add_route('batch', '/batch')
     config.scan(__name__)
 
 
@@ -179,6 +188,126 @@ def collection_add(context, request, render=None):
     return result
 
 
+@view_config(route_name='batch', request_method='POST')
+def batch_add(context, request):
+    """ Create the items of @graph, possibly of several types, together
+
+    Each item names its collection in @type. Items may link to others of
+    the batch by uuid or unique key before they exist. All are validated
+    first and then written in one transaction with bulk_update, so the
+    batch is indexed as a single invalidation.
+    """
+    registry = request.registry
+    collections = registry[COLLECTIONS]
+    graph = request.json.get('@graph')
+    if not isinstance(graph, list):
+        raise ValidationFailure('body', ['@graph'], 'Expected a list of items')
+
+    loader = BulkLoader(registry, validator_class=LinkResolvingValidator)
+    rows = []
+    for index, properties in enumerate(graph):
+        type_name = properties.get('@type') if isinstance(properties, dict) else None
+        if isinstance(type_name, list):
+            type_name = type_name[0] if type_name else None
+        collection = collections.get(type_name) if type_name else None
+        if not isinstance(collection, Collection):
+            msg = 'Unknown collection %r' % type_name
+            request.errors.add('body', [index, '@type'], msg)
+            continue
+        if not request.has_permission('add', collection):
+            msg = u'add forbidden to %s' % request.resource_path(collection)
+            raise HTTPForbidden(msg)
+        properties = {k: v for k, v in properties.items() if k != '@type'}
+        loader.register(collection.type_info.name, [properties])
+        rows.append((index, collection, properties))
+
+    valid = []
+    for index, collection, properties in rows:
+        error_count = len(loader.errors)
+        # Validated against the collection, as when POSTed to it
+        request.context = collection
+        try:
+            for type_info, rid, validated in loader.iter_valid(
+                    collection.type_info.name, [properties]):
+                valid.append((index, type_info, rid, validated))
+        finally:
+            request.context = context
+        for type_name, rid, msg in loader.errors[error_count:]:
+            request.errors.add('body', [index], msg)
+    if request.errors:
+        raise ValidationFailure()
+
+    conn = registry[CONNECTION]
+    items = []
+    claimed = {}
+    separate = set()
+    for index, type_info, rid, validated in valid:
+        item_properties, propname_children = split_child_props(type_info, validated)
+        model = conn.create(type_info.name, UUID(rid))
+        item = type_info.factory(registry, model)
+        properties = {k: v for k, v in item_properties.items() if k != 'uuid'}
+        unique_keys = item.unique_keys(properties)
+        for name, values in unique_keys.items():
+            if len(set(values)) != len(values):
+                msg = "Duplicate keys for %r: %r" % (name, values)
+                request.errors.add('body', [index], msg)
+            for value in values:
+                if claimed.setdefault((name, value), index) != index:
+                    msg = 'Keys conflict: %r' % [(name, value)]
+                    request.errors.add('body', [index], msg)
+        if type_info.factory.create.__func__ is not Item.create.__func__:
+            separate.add(model.rid)
+        items.append((index, type_info, item, validated, properties, propname_children))
+    for index, type_info, item, validated, properties, propname_children in items:
+        for rel, targets in item.links(properties).items():
+            for target in targets:
+                if UUID(target) in separate:
+                    msg = '%r is created on its own and may not be linked to in a batch' % target
+                    request.errors.add('body', [index], msg)
+    if request.errors:
+        raise ValidationFailure()
+
+    updates = []
+    created = []
+    deferred = []
+    for index, type_info, item, validated, properties, propname_children in items:
+        if item.model.rid in separate:
+            continue
+        # Types that do more than store their properties are written one by
+        # one, once the resources of the whole batch exist
+        if propname_children or type_info.factory._update is not Item._update:
+            updates.append((item.model, None, None, None, None))
+            deferred.append((index, item, properties, propname_children))
+            continue
+        updates.append((
+            item.model, properties, None, item.unique_keys(properties), item.links(properties)))
+        created.append((index, item))
+
+    conflicts = conn.bulk_update(updates)
+    if conflicts:
+        raise HTTPConflict('; '.join(
+            '%s %s' % (rid, msg) for rid, msg in sorted(conflicts.items())))
+    for index, item in created:
+        registry.notify(Created(item, request))
+    for index, item, properties, propname_children in deferred:
+        # As Item.create, on the resource added by bulk_update
+        item._update(properties)
+        registry.notify(Created(item, request))
+        if propname_children:
+            update_children(item, request, propname_children)
+        created.append((index, item))
+    for index, type_info, item, validated, properties, propname_children in items:
+        if item.model.rid in separate:
+            created.append((index, create_item(type_info, request, validated)))
+
+    request.response.status = 201
+    return {
+        'status': 'success',
+        '@type': ['result'],
+        '@graph': [request.resource_path(item) for index, item in sorted(created, key=lambda c: c[0])],
+    }
+
+
 @view_config(context=Item, permission='edit', request_method='PUT',
              validators=[validate_item_content_put], decorator=if_match_tid)
 @view_config(context=Item, permission='edit', request_method='PATCH',
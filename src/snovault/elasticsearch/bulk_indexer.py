@@ -0,0 +1,311 @@
+'''
+Bulk elasticsearch writer for the indexer
+
+Rendered @@index-data documents are buffered and shipped with the ES _bulk
+api instead of one index request per uuid.  Each document keeps the
+external_gte versioning of the single document path and failures are
+handled item by item from the bulk response.
+
+With indexer.pipeline the bulk indexer is owned by a writer thread fed
+through a bounded queue, so rendering never waits on es requests or
+retry sleeps and a slow cluster applies backpressure to the renderers.
+
+With indexer.skip_unchanged each document carries a content_hash and
+documents whose hash matches the one already in es are not written.
+'''
+import datetime
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+
+from elasticsearch.exceptions import (
+    ConnectionError,
+    TransportError,
+)
+from pyramid.settings import asbool
+from urllib3.exceptions import ReadTimeoutError
+
+from snovault.json_renderer import json_renderer
+
+
+log = logging.getLogger('snovault.elasticsearch.es_index_listener')
+BULK_BACKOFFS = [0, 10, 20, 40, 80]
+DEFAULT_BULK_MAX_DOCS = 500
+DEFAULT_BULK_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_PIPELINE_QUEUE_SIZE = 1000
+# Seconds the writer waits on an empty queue before flushing a partial batch
+PIPELINE_IDLE_FLUSH = 1.0
+# Item statuses in a bulk response that are worth sending again
+_RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+def get_bulk_options(settings):
+    '''Extract bulk indexing options from registry settings'''
+    pipeline = asbool(settings.get('indexer.pipeline', False))
+    skip_unchanged = asbool(settings.get('indexer.skip_unchanged', False))
+    return {
+        # The pipeline writer and unchanged checks ship through the bulk api
+        'enabled': (
+            pipeline or
+            skip_unchanged or
+            asbool(settings.get('indexer.bulk', False))
+        ),
+        'skip_unchanged': skip_unchanged,
+        'max_docs': int(settings.get('indexer.bulk_max_docs', DEFAULT_BULK_MAX_DOCS)),
+        'max_bytes': int(settings.get('indexer.bulk_max_bytes', DEFAULT_BULK_MAX_BYTES)),
+        'pipeline': pipeline,
+        'queue_size': int(
+            settings.get('indexer.pipeline_queue_size', DEFAULT_PIPELINE_QUEUE_SIZE)
+        ),
+    }
+
+
+def content_hash(doc):
+    '''Stable hash of an index document'''
+    doc_str = json.dumps(doc, sort_keys=True, default=str)
+    return hashlib.sha1(doc_str.encode('utf-8')).hexdigest()
+
+
+def finish_update_info(update_info, last_exc=None):
+    '''Close out an indexer update info, recording the last exception'''
+    if last_exc:
+        update_info['error'] = {
+            'error_message': last_exc,
+            'timestamp': datetime.datetime.now().isoformat(),
+            'uuid': str(update_info['uuid']),
+        }
+    end_time = time.time()
+    update_info['end_time'] = end_time
+    update_info['run_time'] = end_time - update_info['start_time']
+    return update_info
+
+
+class BulkIndexer(object):
+    '''Buffer index documents and flush them through the ES bulk api
+
+    A flush happens when either max_docs documents or max_bytes of
+    serialized request body are buffered, or when flush is called.
+    '''
+    backoffs = BULK_BACKOFFS
+
+    def __init__(
+            self,
+            es,
+            xmin,
+            max_docs=DEFAULT_BULK_MAX_DOCS,
+            max_bytes=DEFAULT_BULK_MAX_BYTES,
+            request_timeout=30,
+            skip_unchanged=False,
+        ):
+        # pylint: disable=too-many-arguments
+        self.es = es
+        self.xmin = xmin
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.request_timeout = request_timeout
+        self.skip_unchanged = skip_unchanged
+        self._items = []
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _action(self, uuid, doc):
+        action = {
+            '_index': doc['item_type'],
+            '_type': doc['item_type'],
+            '_id': str(uuid),
+        }
+        if self.xmin is not None:
+            action['_version'] = self.xmin
+            action['_version_type'] = 'external_gte'
+        return {'index': action}
+
+    def add(self, uuid, doc, update_info):
+        '''Buffer a rendered document, flushing if the buffer is full'''
+        if self.skip_unchanged:
+            doc['content_hash'] = content_hash(doc)
+        lines = '%s\n%s\n' % (
+            json_renderer.dumps(self._action(uuid, doc)),
+            json_renderer.dumps(doc),
+        )
+        es_info = update_info['es_info']
+        es_info['start_time'] = time.time()
+        es_info['item_type'] = doc['item_type']
+        item = {
+            'uuid': str(uuid),
+            'item_type': doc['item_type'],
+            'content_hash': doc.get('content_hash'),
+            'lines': lines,
+            'update_info': update_info,
+            'last_exc': None,
+        }
+        self._items.append(item)
+        self._bytes += len(lines.encode('utf-8'))
+        if len(self._items) >= self.max_docs or self._bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        '''Send all buffered documents, retrying retryable failures'''
+        items = self._items
+        self._items = []
+        self._bytes = 0
+        if not items:
+            return
+        done = []
+        if self.skip_unchanged:
+            items = self._skip_unchanged(items, done)
+        for backoff in self.backoffs:
+            if not items:
+                break
+            time.sleep(backoff)
+            items = self._send(items, backoff, done)
+        # Retries exhausted, last_exc is already set on these items
+        done.extend(items)
+        for item in done:
+            es_info = item['update_info']['es_info']
+            es_info['end_time'] = time.time()
+            es_info['run_time'] = es_info['end_time'] - es_info['start_time']
+            finish_update_info(item['update_info'], last_exc=item['last_exc'])
+
+    def _skip_unchanged(self, items, done):
+        '''Move items whose content hash is already in es to done'''
+        docs = [
+            {
+                '_index': item['item_type'],
+                '_type': item['item_type'],
+                '_id': item['uuid'],
+                '_source': ['content_hash'],
+            }
+            for item in items
+        ]
+        try:
+            res = self.es.mget(body={'docs': docs}, request_timeout=self.request_timeout)
+        except Exception:  # pylint: disable=broad-except
+            log.warning('Could not fetch content hashes, writing all documents', exc_info=True)
+            return items
+        changed = []
+        for item, found in zip(items, res['docs']):
+            previous = found.get('_source', {}).get('content_hash') if found.get('found') else None
+            if previous is not None and previous == item['content_hash']:
+                item['update_info']['es_info']['skipped'] = True
+                done.append(item)
+            else:
+                changed.append(item)
+        return changed
+
+    @staticmethod
+    def _record_backoff(item, backoff, start_time, msg=None, last_exc=None):
+        # pylint: disable=too-many-arguments
+        end_time = time.time()
+        backoff_info = {
+            'start_time': start_time,
+            'end_time': end_time,
+            'run_time': end_time - start_time,
+            'error': None,
+        }
+        if msg is not None:
+            backoff_info['error'] = {
+                'msg': msg,
+                'last_exc': last_exc,
+            }
+        item['update_info']['es_info']['backoffs'][str(backoff)] = backoff_info
+
+    def _send(self, items, backoff, done):
+        '''Send one bulk request, returning the items to retry'''
+        start_time = time.time()
+        body = ''.join(item['lines'] for item in items)
+        try:
+            res = self.es.bulk(body=body, request_timeout=self.request_timeout)
+        except (ConnectionError, ReadTimeoutError, TransportError) as ecp:
+            msg = 'Retryable error bulk indexing %d documents: %r' % (len(items), ecp)
+            log.warning(msg)
+            for item in items:
+                item['last_exc'] = repr(ecp)
+                self._record_backoff(item, backoff, start_time, msg, item['last_exc'])
+            return items
+        except Exception as ecp:  # pylint: disable=broad-except
+            msg = 'Error bulk indexing %d documents' % len(items)
+            log.error(msg, exc_info=True)
+            for item in items:
+                item['last_exc'] = repr(ecp)
+                self._record_backoff(item, backoff, start_time, msg)
+            done.extend(items)
+            return []
+        retry = []
+        for item, result in zip(items, res['items']):
+            result = result.get('index', result)
+            status = result.get('status', 500)
+            if status < 300:
+                item['last_exc'] = None
+                self._record_backoff(item, backoff, start_time)
+                done.append(item)
+            elif status == 409:
+                msg = 'Conflict indexing %s at version %s' % (item['uuid'], self.xmin)
+                log.warning(msg)
+                item['last_exc'] = None
+                self._record_backoff(item, backoff, start_time, msg)
+                done.append(item)
+            elif status in _RETRYABLE_STATUSES:
+                msg = 'Retryable error indexing %s: %r' % (item['uuid'], result.get('error'))
+                log.warning(msg)
+                item['last_exc'] = repr(result.get('error'))
+                self._record_backoff(item, backoff, start_time, msg, item['last_exc'])
+                retry.append(item)
+            else:
+                msg = 'Error indexing %s: %r' % (item['uuid'], result.get('error'))
+                log.error(msg)
+                item['last_exc'] = repr(result.get('error'))
+                self._record_backoff(item, backoff, start_time, msg)
+                done.append(item)
+        return retry
+
+
+class PipelinedBulkWriter(object):
+    '''Ship documents to es from a writer thread
+
+    Renderers call put, which blocks once queue_size documents are waiting.
+    The writer thread batches them through a BulkIndexer and owns retries.
+    close must be called to flush and wait for the outstanding documents.
+    '''
+    _stop = object()
+
+    def __init__(self, bulk_indexer, queue_size=DEFAULT_PIPELINE_QUEUE_SIZE):
+        self.bulk_indexer = bulk_indexer
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(
+            target=self._run,
+            name='indexer-bulk-writer',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def put(self, uuid, doc, update_info):
+        '''Queue a rendered document, blocking while the queue is full'''
+        self._queue.put((uuid, doc, update_info))
+
+    def close(self):
+        '''Flush outstanding documents and stop the writer thread'''
+        self._queue.put(self._stop)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=PIPELINE_IDLE_FLUSH)
+            except queue.Empty:
+                # Renderers are slower than es, ship what we have
+                self.bulk_indexer.flush()
+                continue
+            if item is self._stop:
+                self.bulk_indexer.flush()
+                return
+            uuid, doc, update_info = item
+            try:
+                self.bulk_indexer.add(uuid, doc, update_info)
+            except Exception as ecp:  # pylint: disable=broad-except
+                log.error('Error queueing %s for bulk indexing', uuid, exc_info=True)
+                finish_update_info(update_info, last_exc=repr(ecp))
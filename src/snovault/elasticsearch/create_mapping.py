@@ -336,6 +336,11 @@ def es_mapping(mapping):
                 'type': 'keyword',
                 'include_in_all': False,
             },
+            'content_hash': {
+                'type': 'keyword',
+                'index': False,
+                'include_in_all': False,
+            },
             'item_type': {
                 'type': 'keyword',
             },
@@ -96,6 +96,20 @@ class PickStorage(object):
                 return self.write.get_by_uuid(uuid)
         return model
 
+    def get_by_uuids(self, uuids):
+        storage = self.storage()
+        models = storage.get_by_uuids(uuids)
+        if storage is self.read:
+            models = [model for model in models if not model.invalidated()]
+            missing = {str(uuid) for uuid in uuids} - {str(model.uuid) for model in models}
+            if missing:
+                force_database_for_request()
+                models.extend(self.write.get_by_uuids(missing))
+        return models
+
+    def get_link_targets(self, source_rels):
+        return self.write.get_link_targets(source_rels)
+
     def get_by_unique_key(self, unique_key, name, index=None):
         storage = self.storage()
         model = storage.get_by_unique_key(unique_key, name, index=index)
@@ -106,10 +120,11 @@ class PickStorage(object):
         return model
 
     def get_rev_links(self, model, rel, *item_types):
-        storage = self.storage()
-        if isinstance(model, CachedModel) and storage is self.write:
-            model = storage.get_by_uuid(str(model.uuid))
-        return storage.get_rev_links(model, rel, *item_types)
+        return self.storage().get_rev_links(model, rel, *item_types)
+
+    def get_rev_links_by_targets(self, uuids, rel, *item_types):
+        # Only used when rendering from the database, e.g. when indexing
+        return self.write.get_rev_links_by_targets(uuids, rel, *item_types)
 
     def __iter__(self, *item_types):
         return self.storage().__iter__(*item_types)
@@ -123,9 +138,13 @@ class PickStorage(object):
     def update(self, model, properties=None, sheets=None, unique_keys=None, links=None):
         return self.write.update(model, properties, sheets, unique_keys, links)
 
+    def bulk_update(self, updates):
+        return self.write.bulk_update(updates)
+
 
 class ElasticSearchStorage(object):
     writeable = False
+    batchsize = 1000
 
     def __init__(self, es, index):
         self.es = es
@@ -156,6 +175,25 @@ class ElasticSearchStorage(object):
         hit = result['hits']['hits'][0]
         return CachedModel(hit)
 
+    def get_by_uuids(self, uuids):
+        # resources is an alias over every item type index, which mget
+        # cannot address, so search for a batch of uuids at once instead.
+        uuids = [str(uuid) for uuid in uuids]
+        models = []
+        for start in range(0, len(uuids), self.batchsize):
+            batch = uuids[start:start + self.batchsize]
+            query = {
+                'query': {
+                    'terms': {
+                        'uuid': batch
+                    }
+                },
+                'version': True
+            }
+            result = self.es.search(index=self.index, body=query, _source=True, size=len(batch))
+            models.extend(CachedModel(hit) for hit in result['hits']['hits'])
+        return models
+
     def get_by_unique_key(self, unique_key, name, index=None):
         term = 'unique_keys.' + unique_key
         query = {
@@ -14,6 +14,7 @@ from pyramid.settings import asbool
 from sqlalchemy.exc import StatementError
 from snovault import (
     COLLECTIONS,
+    CONNECTION,
     DBSESSION,
     STORAGE
 )
@@ -36,6 +37,20 @@ from .indexer_state import (
     INDEXING_NODE_INDEX,
     AWS_REGION,
 )
+from .bulk_indexer import (
+    BULK_BACKOFFS,
+    BulkIndexer,
+    PipelinedBulkWriter,
+    finish_update_info,
+    get_bulk_options,
+)
+from .reverse_embeds import (
+    embeds_table_enabled,
+    get_reverse_embeds,
+    has_reverse_embeds,
+    set_reverse_embeds_complete,
+    update_reverse_embeds,
+)
 from .simple_queue import SimpleUuidServer
 
 import datetime
@@ -92,15 +107,70 @@ def includeme(config):
             registry[INDEXER] = Indexer(registry)
 
 
+def get_prefetch_options(settings):
+    '''Extract batch prefetch options from registry settings
+
+    size is the number of uuids loaded together before rendering, 0 disables
+    prefetching.  depth is how many levels of linked items are loaded.
+    '''
+    return {
+        'size': int(settings.get('indexer.prefetch_size', 0)),
+        'depth': int(settings.get('indexer.prefetch_depth', 1)),
+    }
+
+
+CACHE_COUNTERS = ('hits', 'misses', 'evictions', 'bytes_stored')
+
+
+def get_cache_stats(registry):
+    if CONNECTION not in registry:
+        return {}
+    connection = registry[CONNECTION]
+    return {
+        'embed': connection.embed_cache.stats(),
+        'item': connection.item_cache.stats(),
+    }
+
+
+def _with_hit_ratio(stats):
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else None
+    return stats
+
+
+def cache_stats_delta(before, after):
+    '''Counts and hit ratio of each cache between two get_cache_stats
+
+    bytes is the estimated size held by the cache afterwards.
+    '''
+    delta = {}
+    for name, stats in after.items():
+        counts = {
+            counter: stats[counter] - before[name][counter]
+            for counter in CACHE_COUNTERS
+        }
+        counts['bytes'] = stats['bytes']
+        delta[name] = _with_hit_ratio(counts)
+    return delta
+
+
 def get_related_uuids(request, es, updated, renamed):
     '''Returns (set of uuids, False) or (list of all uuids, True) if full reindex triggered'''
 
     updated_count = len(updated)
     renamed_count = len(renamed)
+    if (updated_count + renamed_count) == 0:
+        return (set(), False)
+    if embeds_table_enabled(request.registry.settings):
+        session = request.registry[DBSESSION]()
+        if has_reverse_embeds(session):
+            return (get_reverse_embeds(session, updated, renamed), False)
+        log.warning('reverse_embeds table is incomplete until a full reindex, using elasticsearch')
+    elif has_reverse_embeds(request.registry[DBSESSION]()):
+        # The table goes stale while the setting is off
+        set_reverse_embeds_complete(request.registry, False)
     if (updated_count + renamed_count) > MAX_CLAUSES_FOR_ES:
         return (list(all_uuids(request.registry)), True)  # guaranteed unique
-    elif (updated_count + renamed_count) == 0:
-        return (set(), False)
 
     es.indices.refresh(RESOURCES_INDEX)
 
@@ -413,6 +483,7 @@ def index(request):
                 result['types'] = types = request.json.get('types', None)
                 invalidated = list(all_uuids(request.registry, types))
                 flush = True
+                result['full_reindex'] = types is None
             else:
                 txns = session.query(TransactionRecord).filter(
                     TransactionRecord.xid >= last_xmin,
@@ -452,6 +523,7 @@ def index(request):
                 if full_reindex:
                     invalidated = related_set
                     flush = True
+                    result['full_reindex'] = True
                 else:
                     invalidated = related_set | updated
                     result.update(
@@ -504,9 +576,15 @@ def index(request):
         if err_msg:
             log.warning('Could not start indexing: %s', err_msg)
         result = indexer_state.finish_cycle(result,errors)
+        doc_counts = request.registry[INDEXER].doc_counts
+        result['docs_written'] = doc_counts['written']
+        result['docs_skipped'] = doc_counts['skipped']
+        result['cache_stats'] = request.registry[INDEXER].get_cycle_cache_stats()
 
         if errors:
             result['errors'] = errors
+        elif result.get('full_reindex') and embeds_table_enabled(request.registry.settings):
+            set_reverse_embeds_complete(request.registry)
 
         if request.json.get('record', False):
             try:
@@ -652,6 +730,7 @@ def get_current_xmin(request):
 
 class Indexer(object):
     def __init__(self, registry):
+        self.registry = registry
         self.es = registry[ELASTIC_SEARCH]
         self.esstorage = registry[STORAGE]
         self.index = registry.settings['snovault.elasticsearch.index']
@@ -661,6 +740,11 @@ class Indexer(object):
         self.chunk_size = None
         self.batch_size = None
         self.worker_runs = []
+        self.doc_counts = {'written': 0, 'skipped': 0}
+        self.cache_counts = {}
+        self.bulk_options = get_bulk_options(registry.settings)
+        self.prefetch_options = get_prefetch_options(registry.settings)
+        self.embeds_table = embeds_table_enabled(registry.settings)
         if registry.settings.get('indexer'):
             self._setup_queues(registry)
 
@@ -842,6 +926,8 @@ class Indexer(object):
         # Run Process Loop
         start_time = time.time()
         self.worker_runs = []
+        self.doc_counts = {'written': 0, 'skipped': 0}
+        self.cache_counts = {}
         update_infos = []
         while self.queue_server.is_indexing(errs_cnt=len(errors)):
             if self.queue_worker and not self.queue_worker.is_running:
@@ -876,6 +962,7 @@ class Indexer(object):
         update_infos = []
         if batch_uuids:
             self.queue_worker.is_running = True
+            cache_stats = get_cache_stats(self.registry)
             batch_update_infos, batch_errors = self.update_objects(
                 request,
                 batch_uuids,
@@ -883,7 +970,15 @@ class Indexer(object):
                 snapshot_id=snapshot_id,
                 restart=restart,
             )
+            self._add_cache_counts(
+                batch_update_infos,
+                cache_stats_delta(cache_stats, get_cache_stats(self.registry)),
+            )
             update_infos.extend(batch_update_infos)
+            for update_info in batch_update_infos:
+                if update_info.get('error') is None:
+                    skipped = update_info['es_info'].get('skipped')
+                    self.doc_counts['skipped' if skipped else 'written'] += 1
             batch_results = {
                 'errors': batch_errors,
                 'successes': len(batch_uuids) - len(batch_errors),
@@ -897,6 +992,37 @@ class Indexer(object):
             log.warning('No uudis to run %d', self.queue_worker.get_cnt)
         return update_infos, None
 
+    def _add_cache_counts(self, update_infos, local_delta):
+        '''Accumulate cache counts for the cycle
+
+        Pool workers report their own counts in map_info, shared by every
+        update info of a chunk, otherwise the local caches were used.
+        '''
+        worker_deltas = {}
+        for update_info in update_infos:
+            map_info = update_info.get('map_info')
+            if map_info and 'cache' in map_info:
+                worker_deltas[id(map_info)] = map_info['cache']
+        deltas = list(worker_deltas.values()) or [local_delta]
+        for delta in deltas:
+            for name, stats in delta.items():
+                counts = self.cache_counts.setdefault(
+                    name, dict.fromkeys(CACHE_COUNTERS + ('bytes',), 0)
+                )
+                for counter in CACHE_COUNTERS:
+                    counts[counter] += stats[counter]
+                counts['bytes'] = max(counts['bytes'], stats['bytes'])
+
+    def get_cycle_cache_stats(self):
+        '''Cache counts and hit ratios of the last indexing cycle
+
+        bytes is the largest estimated size held by a cache.
+        '''
+        return {
+            name: _with_hit_ratio(dict(counts))
+            for name, counts in self.cache_counts.items()
+        }
+
     def update_objects(
             self,
             request,
@@ -909,8 +1035,24 @@ class Indexer(object):
         '''Run indexing process on uuids'''
         errors = []
         update_infos = []
-        for i, uuid in enumerate(uuids):
-            update_info = self.update_object(self.es, request, uuid, xmin)
+        if self.bulk_options['enabled']:
+            results = self.bulk_update_objects(
+                self.es,
+                request,
+                uuids,
+                xmin,
+                self.bulk_options,
+                prefetch_options=self.prefetch_options,
+                embeds_table=self.embeds_table,
+            )
+        else:
+            results = (
+                self.update_object(
+                    self.es, request, uuid, xmin, embeds_table=self.embeds_table
+                )
+                for uuid in self.iter_prefetched(request, uuids, self.prefetch_options)
+            )
+        for i, update_info in enumerate(results):
             update_info['return_time'] = time.time()
             update_infos.append(update_info)
             error = update_info.get('error')
@@ -922,7 +1064,34 @@ class Indexer(object):
         return update_infos, errors
 
     @staticmethod
-    def update_object(encoded_es, request, uuid, xmin, restart=False):
+    def iter_prefetched(request, uuids, prefetch_options):
+        '''Yield uuids, bulk loading each chunk of them before it is rendered
+
+        Resources, current propsheets, links and keys for the chunk and its
+        linked items are loaded with a few IN queries and seeded into the
+        connection item cache, so @@index-data rendering does not load them
+        one at a time.  Reverse links of the chunk are loaded the same way.
+        '''
+        size = prefetch_options['size'] if prefetch_options else 0
+        if not size:
+            yield from uuids
+            return
+        connection = request.registry[CONNECTION]
+        uuids = list(uuids)
+        for start in range(0, len(uuids), size):
+            chunk = uuids[start:start + size]
+            request.datastore = 'database'
+            connection.prefetch(chunk, depth=prefetch_options['depth'])
+            connection.prefetch_rev_links(chunk)
+            yield from chunk
+
+    @staticmethod
+    def render_object(request, uuid, xmin):
+        '''Render @@index-data for uuid, returning the update info and doc
+
+        doc is None if rendering failed, in which case the error is in
+        update_info['req_info']['errors'].
+        '''
         update_info = {
             'uuid': uuid,
             'xmin': xmin,
@@ -945,9 +1114,12 @@ class Indexer(object):
             'run_time': None,
             'backoffs': {},
             'item_type': None,
+            'skipped': False,
         }
+        update_info['req_info'] = req_info
+        update_info['es_info'] = es_info
         request.datastore = 'database'
-        last_exc = None
+        doc = None
         req_info['start_time'] = time.time()
         backoff = 0
         try:
@@ -959,21 +1131,33 @@ class Indexer(object):
         except Exception as e:
             msg = 'Error rendering /%s/@@index-data' % uuid
             log.error(msg, exc_info=True)
-            last_exc = repr(e)
+            doc = None
             req_info['errors'].append(
                 {
                     'backoff': backoff,
                     'msg': msg,
-                    'last_exc': last_exc,
+                    'last_exc': repr(e),
                 }
             )
         req_info['end_time'] = time.time()
         req_info['run_time'] = req_info['end_time'] - req_info['start_time']
-        if last_exc is None:
+        return update_info, doc
+
+    @staticmethod
+    def update_object(encoded_es, request, uuid, xmin, restart=False, embeds_table=False):
+        # pylint: disable=too-many-arguments
+        update_info, doc = Indexer.render_object(request, uuid, xmin)
+        es_info = update_info['es_info']
+        last_exc = None
+        if doc is None:
+            last_exc = update_info['req_info']['errors'][-1]['last_exc']
+        else:
+            if embeds_table:
+                update_reverse_embeds(request.registry, [doc])
             es_info['start_time'] = time.time()
             es_info['item_type'] = doc['item_type']
             do_break = False
-            for backoff in [0, 10, 20, 40, 80]:
+            for backoff in BULK_BACKOFFS:
                 time.sleep(backoff)
                 backoff_info = {
                     'start_time': time.time(),
@@ -1026,18 +1210,61 @@ class Indexer(object):
                     break
             es_info['end_time'] = time.time()
             es_info['run_time'] = es_info['end_time'] - es_info['start_time']
-        update_info['req_info'] = req_info
-        update_info['es_info'] = es_info
-        if last_exc:
-            update_info['error'] = {
-                'error_message': last_exc,
-                'timestamp': datetime.datetime.now().isoformat(),
-                'uuid': str(uuid)
-            }
-        end_time = time.time()
-        update_info['end_time'] = end_time
-        update_info['run_time'] = end_time - update_info['start_time']
-        return update_info
+        return finish_update_info(update_info, last_exc=last_exc)
+
+    @staticmethod
+    def bulk_update_objects(
+            encoded_es,
+            request,
+            uuids,
+            xmin,
+            bulk_options,
+            prefetch_options=None,
+            embeds_table=False,
+        ):
+        '''Render uuids and ship the documents with the ES bulk api
+
+        Returns the update infos in the order the uuids were given.
+        '''
+        # pylint: disable=too-many-arguments
+        bulk_indexer = BulkIndexer(
+            encoded_es,
+            xmin,
+            max_docs=bulk_options['max_docs'],
+            max_bytes=bulk_options['max_bytes'],
+            skip_unchanged=bulk_options.get('skip_unchanged', False),
+        )
+        writer = None
+        add_doc = bulk_indexer.add
+        if bulk_options.get('pipeline'):
+            writer = PipelinedBulkWriter(
+                bulk_indexer,
+                queue_size=bulk_options['queue_size'],
+            )
+            add_doc = writer.put
+        update_infos = []
+        rendered_docs = []
+        try:
+            for uuid in Indexer.iter_prefetched(request, uuids, prefetch_options):
+                update_info, doc = Indexer.render_object(request, uuid, xmin)
+                update_infos.append(update_info)
+                if doc is None:
+                    finish_update_info(
+                        update_info,
+                        last_exc=update_info['req_info']['errors'][-1]['last_exc'],
+                    )
+                else:
+                    add_doc(uuid, doc, update_info)
+                    if embeds_table:
+                        rendered_docs.append(doc)
+        finally:
+            if writer is None:
+                bulk_indexer.flush()
+            else:
+                writer.close()
+        if rendered_docs:
+            update_reverse_embeds(request.registry, rendered_docs)
+        return update_infos
 
     def shutdown(self):
         pass
@@ -1,5 +1,18 @@
 import os
-from snovault import DBSESSION
+import uuid as uuid_module
+from collections import (
+    Counter,
+    defaultdict,
+)
+from snovault import (
+    CONNECTION,
+    DBSESSION,
+    SHARED_EMBED_CACHE,
+)
+from snovault.storage import (
+    Link,
+    Resource,
+)
 from contextlib import contextmanager
 from multiprocessing import get_context
 from multiprocessing.pool import Pool
@@ -11,16 +24,24 @@ from pyramid.threadlocal import (
 )
 import atexit
 import logging
+import resource
 import time
 import transaction
 from .indexer import (
     INDEXER,
     Indexer,
+    cache_stats_delta,
+    get_cache_stats,
 )
 from .interfaces import (
     APP_FACTORY,
     ELASTIC_SEARCH,
 )
+from .reverse_embeds import embeds_table_enabled
+from .shared_embed_cache import (
+    SharedEmbedCache,
+    shared_embed_cache_enabled,
+)
 
 log = logging.getLogger('snovault.elasticsearch.es_index_listener')
 
@@ -41,18 +62,43 @@ def includeme(config):
 
 current_xmin_snapshot_id = None
 app = None
+worker_start_time = None
 
 
 def initializer(app_factory, settings):
     import signal
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-    global app
+    global app, worker_start_time
+    worker_start_time = time.time()
     atexit.register(clear_snapshot)
     app = app_factory(settings, indexer_worker=True, create_tables=False)
+    if shared_embed_cache_enabled(app.registry.settings):
+        app.registry[SHARED_EMBED_CACHE] = SharedEmbedCache.from_settings(
+            app.registry.settings
+        )
     signal.signal(signal.SIGALRM, clear_snapshot)
 
 
+def _map_info():
+    return {
+        'start_time': time.time(),
+        'end_time': None,
+        'run_time': None,
+        'pid':os.getpid(),
+        'worker_start_time': worker_start_time,
+    }
+
+
+def _end_map_info(map_info, registry, cache_stats):
+    map_info['end_time'] = time.time()
+    map_info['run_time'] = map_info['end_time'] - map_info['start_time']
+    # Peak resident set size of the worker, kilobytes on linux.  Sampled
+    # after the work so the limit is checked against the chunk just done.
+    map_info['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    map_info['cache'] = cache_stats_delta(cache_stats, get_cache_stats(registry))
+
+
 def set_snapshot(xmin, snapshot_id):
     global current_xmin_snapshot_id
     if current_xmin_snapshot_id == (xmin, snapshot_id):
@@ -65,6 +111,8 @@ def set_snapshot(xmin, snapshot_id):
         txn.doom()
         if snapshot_id is not None:
             txn.setExtendedInfo('snapshot_id', snapshot_id)
+        # Without a snapshot_id the doomed transaction may run on a read
+        # replica, so this also waits for the replica to replay up to xmin.
         session = app.registry[DBSESSION]()
         connection = session.connection()
         db_xmin = connection.execute(
@@ -72,7 +120,7 @@ def set_snapshot(xmin, snapshot_id):
         if db_xmin >= xmin:
             break
         transaction.abort()
-        log.info('Waiting for xmin %r to reach %r', db_xmin, xmin)
+        log.info('Waiting for xmin %r to reach %r on %s', db_xmin, xmin, connection.engine.url.host)
         time.sleep(0.1)
 
     registry = app.registry
@@ -84,6 +132,10 @@ def set_snapshot(xmin, snapshot_id):
     request.root = app.root_factory(request)
     request._stats = {}
     manager.push({'request': request, 'registry': registry})
+    shared_embed_cache = registry.get(SHARED_EMBED_CACHE)
+    if shared_embed_cache is not None and snapshot_id is not None:
+        # Only an exported snapshot guarantees every worker sees the same data
+        shared_embed_cache.set_snapshot(xmin, snapshot_id)
 
 
 def clear_snapshot(signum=None, frame=None):
@@ -91,6 +143,12 @@ def clear_snapshot(signum=None, frame=None):
     if current_xmin_snapshot_id is None:
         return
     transaction.abort()
+    shared_embed_cache = app.registry.get(SHARED_EMBED_CACHE)
+    if shared_embed_cache is not None:
+        shared_embed_cache.clear_snapshot()
+    # The item, key and embed caches live in the threadlocals pushed by
+    # set_snapshot, so popping them drops every cache tied to the snapshot
+    # while the worker process itself stays warm.
     manager.pop()
     current_xmin_snapshot_id = None
 
@@ -109,34 +167,119 @@ def update_object_in_snapshot(args):
     with snapshot(xmin, snapshot_id):
         request = get_current_request()
         encoded_es = request.registry[ELASTIC_SEARCH]
-        map_info = {
-            'start_time': time.time(),
-            'end_time': None,
-            'run_time': None,
-            'pid':os.getpid(),
-        }
+        map_info = _map_info()
+        cache_stats = get_cache_stats(request.registry)
         update_info = Indexer.update_object(
             encoded_es,
             request,
             uuid,
             xmin,
             restart=restart,
+            embeds_table=embeds_table_enabled(request.registry.settings),
         )
         update_info['snapshot_id'] = snapshot_id
-        map_info['end_time'] = time.time()
-        map_info['run_time'] = map_info['end_time'] - map_info['start_time']
+        _end_map_info(map_info, request.registry, cache_stats)
         update_info['map_info'] = map_info
         return update_info
 
 
+def update_objects_in_snapshot(args):
+    uuids, xmin, snapshot_id, restart, bulk_options, prefetch_options = args
+    with snapshot(xmin, snapshot_id):
+        request = get_current_request()
+        encoded_es = request.registry[ELASTIC_SEARCH]
+        map_info = _map_info()
+        cache_stats = get_cache_stats(request.registry)
+        update_infos = Indexer.bulk_update_objects(
+            encoded_es,
+            request,
+            uuids,
+            xmin,
+            bulk_options,
+            prefetch_options=prefetch_options,
+            embeds_table=embeds_table_enabled(request.registry.settings),
+        )
+        _end_map_info(map_info, request.registry, cache_stats)
+        log.info(
+            'Indexed chunk of %d uuids, embed cache hit ratio %s',
+            len(uuids),
+            map_info['cache']['embed']['hit_ratio'],
+        )
+        for update_info in update_infos:
+            update_info['snapshot_id'] = snapshot_id
+            update_info['map_info'] = map_info
+        return update_infos
+
+
 # Running in main process
 
-class MPIndexer(Indexer):
-    maxtasks = 1  # pooled processes will exit and be replaced after this many tasks are completed.
+AFFINITY_BATCH_SIZE = 10000
 
+
+def affinity_order(session, uuids):
+    '''Order uuids so items likely to embed the same objects are adjacent
+
+    Groups by item type and then by the link target an item shares with the
+    most other uuids in the batch, e.g. a common lab or award, so each
+    chunk handed to a worker mostly re-renders objects already in its
+    embed cache.
+    '''
+    uuids = [str(uuid) for uuid in uuids]
+    item_types = {}
+    targets = defaultdict(list)
+    for start in range(0, len(uuids), AFFINITY_BATCH_SIZE):
+        rids = [uuid_module.UUID(uuid) for uuid in uuids[start:start + AFFINITY_BATCH_SIZE]]
+        query = session.query(Resource.rid, Resource.item_type).filter(
+            Resource.rid.in_(rids)
+        )
+        for rid, item_type in query:
+            item_types[str(rid)] = item_type
+        query = session.query(Link.source_rid, Link.target_rid).filter(
+            Link.source_rid.in_(rids)
+        )
+        for source, target in query:
+            targets[str(source)].append(str(target))
+    shared_counts = Counter(
+        target
+        for uuid_targets in targets.values()
+        for target in set(uuid_targets)
+    )
+
+    def affinity_key(uuid):
+        shared = max(
+            targets.get(uuid, ()),
+            key=lambda target: (shared_counts[target], target),
+            default='',
+        )
+        return (item_types.get(uuid, ''), shared, uuid)
+
+    return sorted(uuids, key=affinity_key)
+
+
+class MPIndexer(Indexer):
     def __init__(self, registry, processes=None):
         super(MPIndexer, self).__init__(registry)
         self.initargs = (registry[APP_FACTORY], registry.settings,)
+        worker_options = self._get_worker_options(registry)
+        # pooled processes will exit and be replaced after this many tasks are completed.
+        self.maxtasks = worker_options['max_tasks']
+        self.worker_max_rss = worker_options['max_rss']
+        self.worker_max_age = worker_options['max_age']
+        # 'arrival' keeps the queue order, 'affinity' groups by shared links
+        self.chunking = registry.settings.get('indexer.chunking', 'arrival')
+
+    @staticmethod
+    def _get_worker_options(registry):
+        '''Init helper - Extract pool worker recycling limits from registry settings
+
+        Workers are kept warm across chunks and indexing cycles.  A limit of
+        0 or unset disables it.  max_rss is in megabytes, max_age in seconds.
+        '''
+        options = {}
+        for name in ('max_tasks', 'max_rss', 'max_age'):
+            value = int(registry.settings.get('indexer.worker_' + name) or 0)
+            options[name] = value or None
+        return options
 
     @reify
     def pool(self):
@@ -148,6 +291,34 @@ class MPIndexer(Indexer):
             context=get_context('forkserver'),
         )
 
+    def _recycle_pool(self, update_infos):
+        '''Restart the pool when a worker passed its rss or age limit
+
+        The whole pool is restarted, not only the worker over its limit:
+        multiprocessing has no way to retire a single worker other than
+        maxtasksperchild (indexer.worker_max_tasks).  It runs once
+        update_objects has all its results, so no task is lost, and the
+        next cycle starts with cold workers.
+        '''
+        reason = None
+        now = time.time()
+        for update_info in update_infos:
+            map_info = update_info.get('map_info')
+            if not map_info:
+                continue
+            if self.worker_max_rss and map_info['max_rss'] > self.worker_max_rss * 1024:
+                reason = 'rss %dkB' % map_info['max_rss']
+            elif (
+                    self.worker_max_age and map_info['worker_start_time'] and
+                    now - map_info['worker_start_time'] > self.worker_max_age
+                ):
+                reason = 'age %ds' % (now - map_info['worker_start_time'])
+            if reason:
+                log.warning('Recycling indexer pool, worker %d %s', map_info['pid'], reason)
+                self.shutdown()
+                return True
+        return False
+
     def update_objects(
             self,
             request,
@@ -159,25 +330,22 @@ class MPIndexer(Indexer):
         # pylint: disable=too-many-arguments, unused-argument
         '''Run multiprocess indexing process on uuids'''
         # Ensure that we iterate over uuids in this thread not the pool task handler.
+        if self.chunking == 'affinity':
+            uuids = affinity_order(request.registry[DBSESSION](), uuids)
         processes = self.queue_worker.processes
         chunk_size = self.queue_worker.chunk_size
         uuid_count = len(uuids)
         chunkiness = int((uuid_count - 1) / processes) + 1
         if chunkiness > chunk_size:
             chunkiness = chunk_size
-        tasks = [
-            (uuid, xmin, snapshot_id, restart)
-            for uuid in uuids
-        ]
         errors = []
         update_infos = []
         start_time = time.time()
         try:
             for i, update_info in enumerate(
-                    self.pool.imap_unordered(
-                        update_object_in_snapshot,
-                        tasks,
-                        chunkiness)
+                    self._imap_update_infos(
+                        uuids, xmin, snapshot_id, restart, chunkiness
+                    )
                 ):
                 update_info['return_time'] = time.time()
                 update_infos.append(update_info)
@@ -190,8 +358,42 @@ class MPIndexer(Indexer):
         except:
             self.shutdown()
             raise
+        self._recycle_pool(update_infos)
         return update_infos, errors
 
+    def _imap_update_infos(self, uuids, xmin, snapshot_id, restart, chunkiness):
+        '''Yield update infos from the pool as workers finish uuids'''
+        # pylint: disable=too-many-arguments
+        if self.bulk_options['enabled']:
+            # Each task is a chunk of uuids shipped with one bulk indexer
+            uuids = list(uuids)
+            tasks = [
+                (
+                    uuids[start:start + chunkiness],
+                    xmin,
+                    snapshot_id,
+                    restart,
+                    self.bulk_options,
+                    self.prefetch_options,
+                )
+                for start in range(0, len(uuids), chunkiness)
+            ]
+            for chunk_update_infos in self.pool.imap_unordered(
+                    update_objects_in_snapshot,
+                    tasks,
+                ):
+                yield from chunk_update_infos
+            return
+        tasks = [
+            (uuid, xmin, snapshot_id, restart)
+            for uuid in uuids
+        ]
+        yield from self.pool.imap_unordered(
+            update_object_in_snapshot,
+            tasks,
+            chunkiness,
+        )
+
     def shutdown(self):
         if 'pool' in self.__dict__:
             self.pool.terminate()
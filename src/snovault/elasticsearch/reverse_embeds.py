@@ -0,0 +1,99 @@
+'''
+Postgres reverse embedding index used for indexer invalidation
+
+When indexer.embeds_table is set the indexer records the embedded_uuids and
+linked_uuids of every document it renders in the reverse_embeds table.  The
+uuids related to a set of updated and renamed uuids are then found with an
+indexed query instead of an ES terms query, so large edits no longer force
+a full reindex.  The table is filled as items are indexed, so it is only
+used once a full reindex has finished with the setting on, which writes a
+completeness marker row.  The marker is removed while the setting is off.
+'''
+import uuid
+
+from pyramid.settings import asbool
+from sqlalchemy import exists
+
+from snovault import DBSESSION
+from snovault.storage import ReverseEmbed
+
+
+BATCH_SIZE = 10000
+
+# Primary key of the row marking the table complete
+COMPLETE = 'complete'
+NIL_UUID = uuid.UUID(int=0)
+
+
+def embeds_table_enabled(settings):
+    return asbool(settings.get('indexer.embeds_table', False))
+
+
+def _batches(values):
+    values = [uuid.UUID(str(value)) for value in values]
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
+
+
+def update_reverse_embeds(registry, docs):
+    '''Replace the reverse embeds of the rendered index documents
+
+    Indexer transactions are read only so rows are written through a
+    separate connection and committed straight away.
+    '''
+    sources = []
+    rows = []
+    for doc in docs:
+        source = uuid.UUID(doc['uuid'])
+        sources.append(source)
+        for rel in ('embedded', 'linked'):
+            rows.extend(
+                {'source': source, 'rel': rel, 'target': uuid.UUID(target)}
+                for target in doc[rel + '_uuids']
+            )
+    if not sources:
+        return 0
+    table = ReverseEmbed.__table__
+    engine = registry[DBSESSION].bind
+    with engine.begin() as connection:
+        for batch in _batches(sources):
+            connection.execute(table.delete().where(table.c.source.in_(batch)))
+        for start in range(0, len(rows), BATCH_SIZE):
+            connection.execute(table.insert(), rows[start:start + BATCH_SIZE])
+    return len(rows)
+
+
+def _complete_marker(table):
+    return (
+        (table.c.source == NIL_UUID) & (table.c.rel == COMPLETE) & (table.c.target == NIL_UUID)
+    )
+
+
+def set_reverse_embeds_complete(registry, complete=True):
+    '''Mark the table complete after a full reindex, or incomplete'''
+    table = ReverseEmbed.__table__
+    engine = registry[DBSESSION].bind
+    with engine.begin() as connection:
+        connection.execute(table.delete().where(_complete_marker(table)))
+        if complete:
+            connection.execute(
+                table.insert(), {'source': NIL_UUID, 'rel': COMPLETE, 'target': NIL_UUID})
+
+
+def has_reverse_embeds(session):
+    '''Whether every document has its reverse embeds recorded'''
+    table = ReverseEmbed.__table__
+    return session.query(exists().where(_complete_marker(table))).scalar()
+
+
+def get_reverse_embeds(session, updated, renamed):
+    '''Return uuids of documents embedding updated or linking to renamed'''
+    related = set()
+    for rel, targets in (('embedded', updated), ('linked', renamed)):
+        for batch in _batches(targets):
+            query = session.query(ReverseEmbed.source_rid).filter(
+                ReverseEmbed.rel == rel,
+                ReverseEmbed.target_rid.in_(batch),
+            ).distinct()
+            related.update(str(source) for source, in query)
+    return related
@@ -0,0 +1,90 @@
+'''
+Redis embed cache shared by the indexer worker processes
+
+Each MPIndexer worker keeps its own embed cache, so popular frames are
+rendered once per worker.  With indexer.shared_embed_cache set, workers also
+share rendered frames through redis.  Keys include the indexing snapshot
+(xmin and snapshot id) so entries are only ever read within the snapshot
+they were rendered in and simply expire once the xmin moves on.
+'''
+import json
+import logging
+
+from pyramid.settings import asbool
+from redis import StrictRedis
+from redis.exceptions import RedisError
+
+from snovault.json_renderer import json_renderer
+
+
+log = logging.getLogger('snovault.elasticsearch.es_index_listener')
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+
+def shared_embed_cache_enabled(settings):
+    return asbool(settings.get('indexer.shared_embed_cache', False))
+
+
+class SharedEmbedCache(object):
+    '''Embed cache with the get/__setitem__ interface of ManagerLRUCache
+
+    Inactive, always missing, until set_snapshot is called.
+    '''
+    def __init__(self, client, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.client = client
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.prefix = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        '''Defaults to the local_storage redis connection settings'''
+        def setting(name, default=None):
+            return settings.get(
+                'indexer.shared_embed_cache_' + name,
+                settings.get('local_storage_' + name, default),
+            )
+        client = StrictRedis(
+            host=setting('host', 'localhost'),
+            port=int(setting('port', 6379)),
+            db=int(setting('redis_index', 0)),
+            socket_timeout=int(setting('timeout', 5)),
+        )
+        return cls(
+            client,
+            ttl=int(settings.get('indexer.shared_embed_cache_ttl', DEFAULT_TTL)),
+            max_bytes=int(
+                settings.get('indexer.shared_embed_cache_max_bytes', DEFAULT_MAX_BYTES)
+            ),
+        )
+
+    def set_snapshot(self, xmin, snapshot_id):
+        self.prefix = 'embed:%s:%s:' % (xmin, snapshot_id)
+
+    def clear_snapshot(self):
+        self.prefix = None
+
+    def get(self, path, default=None):
+        if self.prefix is None:
+            return default
+        try:
+            value = self.client.get(self.prefix + path)
+        except RedisError as ecp:
+            log.warning('Shared embed cache get failed: %r', ecp)
+            return default
+        if value is None:
+            return default
+        result, embedded, linked = json.loads(value.decode('utf-8'))
+        return result, set(embedded), set(linked)
+
+    def __setitem__(self, path, cached):
+        if self.prefix is None:
+            return
+        value = json_renderer.dumps(cached).encode('utf-8')
+        if len(value) > self.max_bytes:
+            return
+        try:
+            self.client.set(self.prefix + path, value, ex=self.ttl)
+        except RedisError as ecp:
+            log.warning('Shared embed cache set failed: %r', ecp)
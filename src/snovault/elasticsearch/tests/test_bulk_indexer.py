@@ -0,0 +1,174 @@
+"""Tests the bulk indexer with a mocked elasticsearch"""
+import json
+import time
+
+import pytest
+
+from snovault.elasticsearch.bulk_indexer import (
+    BulkIndexer,
+    PipelinedBulkWriter,
+    content_hash,
+    get_bulk_options,
+)
+
+
+class MockBulkES(object):
+    """Fake es recording bulk bodies and answering with canned statuses"""
+
+    def __init__(self, statuses=None, hashes=None):
+        self.bodies = []
+        self.statuses = statuses or []
+        self.responses = []
+        self.hashes = hashes or {}
+
+    def mget(self, body=None, request_timeout=None):  # pylint: disable=unused-argument
+        '''Fake mget of content hashes'''
+        docs = []
+        for doc in body['docs']:
+            found = doc['_id'] in self.hashes
+            res = {'_id': doc['_id'], 'found': found}
+            if found:
+                res['_source'] = {'content_hash': self.hashes[doc['_id']]}
+            docs.append(res)
+        return {'docs': docs}
+
+    def bulk(self, body=None, request_timeout=None):  # pylint: disable=unused-argument
+        '''Fake bulk, statuses are consumed one per item'''
+        self.bodies.append(body)
+        lines = body.splitlines()
+        items = []
+        statuses = []
+        for action in lines[::2]:
+            status = self.statuses.pop(0) if self.statuses else 201
+            statuses.append(status)
+            items.append({
+                'index': {
+                    '_id': json.loads(action)['index']['_id'],
+                    'status': status,
+                    'error': None if status < 300 else {'type': 'fake'},
+                }
+            })
+        response = {'errors': any(status >= 300 for status in statuses), 'items': items}
+        self.responses.append(response)
+        return response
+
+
+def _update_info(uuid):
+    return {
+        'uuid': uuid,
+        'start_time': time.time(),
+        'error': None,
+        'es_info': {'backoffs': {}},
+    }
+
+
+def _add_docs(add_doc, cnt):
+    update_infos = []
+    for num in range(cnt):
+        uuid = 'uuid-%d' % num
+        update_info = _update_info(uuid)
+        update_infos.append(update_info)
+        add_doc(uuid, {'item_type': 'item', 'uuid': uuid}, update_info)
+    return update_infos
+
+
+def test_get_bulk_options_defaults():
+    bulk_options = get_bulk_options({})
+    assert bulk_options['enabled'] is False
+    assert bulk_options['max_docs'] == 500
+    bulk_options = get_bulk_options({'indexer.bulk': 'true', 'indexer.bulk_max_docs': '10'})
+    assert bulk_options['enabled'] is True
+    assert bulk_options['max_docs'] == 10
+    bulk_options = get_bulk_options({'indexer.pipeline': 'true'})
+    assert bulk_options['enabled'] is True
+    assert bulk_options['pipeline'] is True
+
+
+def test_bulk_indexer_flushes_on_max_docs():
+    mock_es = MockBulkES()
+    bulk_indexer = BulkIndexer(mock_es, 7, max_docs=2)
+    _add_docs(bulk_indexer.add, 5)
+    assert len(mock_es.bodies) == 2
+    assert len(bulk_indexer) == 1
+    bulk_indexer.flush()
+    assert len(mock_es.bodies) == 3
+    action = json.loads(mock_es.bodies[0].splitlines()[0])['index']
+    assert action['_version'] == 7
+    assert action['_version_type'] == 'external_gte'
+    assert action['_index'] == 'item'
+
+
+def test_bulk_indexer_flushes_on_max_bytes():
+    mock_es = MockBulkES()
+    bulk_indexer = BulkIndexer(mock_es, 7, max_bytes=1)
+    _add_docs(bulk_indexer.add, 3)
+    assert len(mock_es.bodies) == 3
+
+
+def test_bulk_indexer_no_errors():
+    mock_es = MockBulkES(statuses=[200, 201])
+    bulk_indexer = BulkIndexer(mock_es, 7)
+    update_infos = _add_docs(bulk_indexer.add, 2)
+    bulk_indexer.flush()
+    assert [response['errors'] for response in mock_es.responses] == [False]
+    assert all(update_info['error'] is None for update_info in update_infos)
+
+
+def test_bulk_indexer_item_failures():
+    mock_es = MockBulkES(statuses=[201, 409, 400])
+    bulk_indexer = BulkIndexer(mock_es, 7)
+    update_infos = _add_docs(bulk_indexer.add, 3)
+    bulk_indexer.flush()
+    assert [response['errors'] for response in mock_es.responses] == [True]
+    assert update_infos[0]['error'] is None
+    assert update_infos[1]['error'] is None
+    assert update_infos[1]['es_info']['backoffs']['0']['error']['msg'].startswith('Conflict')
+    assert update_infos[2]['error']['uuid'] == 'uuid-2'
+    for update_info in update_infos:
+        assert update_info['run_time'] is not None
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_bulk_indexer_retries_only_failed_items(status):
+    mock_es = MockBulkES(statuses=[201, status, 201])
+    bulk_indexer = BulkIndexer(mock_es, 7)
+    bulk_indexer.backoffs = [0, 0]
+    update_infos = _add_docs(bulk_indexer.add, 2)
+    bulk_indexer.flush()
+    assert len(mock_es.bodies) == 2
+    assert len(mock_es.bodies[1].splitlines()) == 2
+    assert all(update_info['error'] is None for update_info in update_infos)
+
+
+def test_pipelined_writer_ships_all_docs():
+    mock_es = MockBulkES(statuses=[201, 400])
+    writer = PipelinedBulkWriter(BulkIndexer(mock_es, 7, max_docs=2), queue_size=1)
+    update_infos = _add_docs(writer.put, 5)
+    writer.close()
+    assert sum(len(body.splitlines()) // 2 for body in mock_es.bodies) == 5
+    assert update_infos[0]['error'] is None
+    assert update_infos[1]['error']['uuid'] == 'uuid-1'
+    assert all(update_info['run_time'] is not None for update_info in update_infos)
+
+
+def test_content_hash_is_stable():
+    assert content_hash({'a': 1, 'b': [1, 2]}) == content_hash({'b': [1, 2], 'a': 1})
+    assert content_hash({'a': 1}) != content_hash({'a': 2})
+
+
+def test_bulk_indexer_skips_unchanged():
+    unchanged = {'item_type': 'item', 'uuid': 'uuid-0'}
+    mock_es = MockBulkES(hashes={'uuid-0': content_hash(unchanged), 'uuid-1': 'stale'})
+    bulk_indexer = BulkIndexer(mock_es, 7, skip_unchanged=True)
+    update_infos = _add_docs(bulk_indexer.add, 3)
+    bulk_indexer.flush()
+    assert len(mock_es.bodies) == 1
+    assert [
+        json.loads(line)['index']['_id']
+        for line in mock_es.bodies[0].splitlines()[::2]
+    ] == ['uuid-1', 'uuid-2']
+    assert json.loads(mock_es.bodies[0].splitlines()[1])['content_hash']
+    assert [update_info['es_info'].get('skipped') for update_info in update_infos] == [
+        True, None, None
+    ]
+    assert all(update_info['error'] is None for update_info in update_infos)
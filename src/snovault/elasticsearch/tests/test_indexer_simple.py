@@ -60,6 +60,15 @@ class MockES(object):  # pylint: disable=too-few-public-methods
         if raise_ecp:
             raise raise_ecp('Fake es index exception.')
 
+    @staticmethod
+    def bulk(body=None, request_timeout=None):  # pylint: disable=unused-argument
+        '''Fake bulk, every item succeeds'''
+        items = [
+            {'index': {'status': 201}}
+            for _ in body.splitlines()[::2]
+        ]
+        return {'errors': False, 'items': items}
+
 
 class MockRegistry(dict):
     """
@@ -249,6 +258,72 @@ def test_simple_mpindexinit():
     assert True
 
 
+def test_simple_mpindexer_worker_limits():
+    """test mpindexer workers stay warm unless a limit is passed"""
+    registry = MockRegistry(SMALL_UUIDS_CNT)
+    mpindexer = MPIndexer(registry)
+    assert mpindexer.maxtasks is None
+    update_infos = [{
+        'map_info': {'pid': 1, 'max_rss': 2048, 'worker_start_time': time.time()},
+    }]
+    assert not mpindexer._recycle_pool(update_infos)  # pylint: disable=protected-access
+    registry.settings['indexer.worker_max_tasks'] = '10'
+    registry.settings['indexer.worker_max_rss'] = '1'
+    mpindexer = MPIndexer(registry)
+    assert mpindexer.maxtasks == 10
+    assert mpindexer._recycle_pool(update_infos)  # pylint: disable=protected-access
+
+
+def test_cache_stats_delta():
+    """test per chunk cache hit ratios"""
+    from snovault.elasticsearch.indexer import cache_stats_delta
+    before = {
+        'embed': {'hits': 2, 'misses': 2, 'evictions': 0, 'bytes_stored': 100, 'bytes': 100},
+        'item': {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_stored': 0, 'bytes': 0},
+    }
+    after = {
+        'embed': {'hits': 8, 'misses': 4, 'evictions': 1, 'bytes_stored': 300, 'bytes': 250},
+        'item': {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_stored': 0, 'bytes': 0},
+    }
+    delta = cache_stats_delta(before, after)
+    assert delta['embed'] == {
+        'hits': 6,
+        'misses': 2,
+        'evictions': 1,
+        'bytes_stored': 200,
+        'bytes': 250,
+        'hit_ratio': 0.75,
+    }
+    assert delta['item']['hit_ratio'] is None
+
+
+def test_cycle_cache_stats():
+    """test cycle cache counts are summed once per worker chunk"""
+    registry = MockRegistry(SMALL_UUIDS_CNT)
+    indexer = Indexer(registry)
+    chunk = {
+        'cache': {
+            'embed': {'hits': 3, 'misses': 1, 'evictions': 2, 'bytes_stored': 10, 'bytes': 8},
+        },
+    }
+    other_chunk = {
+        'cache': {
+            'embed': {'hits': 1, 'misses': 3, 'evictions': 0, 'bytes_stored': 5, 'bytes': 5},
+        },
+    }
+    update_infos = [{'map_info': chunk}, {'map_info': chunk}, {'map_info': other_chunk}]
+    indexer._add_cache_counts(update_infos, {})  # pylint: disable=protected-access
+    stats = indexer.get_cycle_cache_stats()
+    assert stats['embed'] == {
+        'hits': 4,
+        'misses': 4,
+        'evictions': 2,
+        'bytes_stored': 15,
+        'bytes': 8,
+        'hit_ratio': 0.5,
+    }
+
+
 class TestIndexer(TestCase):
     """Test Indexer in indexer.py"""
     @classmethod
@@ -505,3 +580,43 @@ class TestIndexer(TestCase):
         )
         self.assertListEqual(errors, [])
         self.assertIsNone(err_msg)
+
+
+def test_smsimp_indexbulk(small_index_objs):
+    """test simple indexer serve with bulk es writes"""
+    indexer, request, invalidated = small_index_objs
+    indexer.bulk_options['enabled'] = True
+    indexer.bulk_options['max_docs'] = 2
+    update_infos, errors, err_msg = indexer.serve_objects(
+        request,
+        invalidated,
+        None,  # xmin
+        snapshot_id=None,
+        restart=False,
+        timeout=SMALL_SERVE_TIMEOUT,
+    )
+    assert err_msg is None
+    assert not errors
+    assert len(request.embeded_uuids) == len(invalidated)
+    for update_info in update_infos:
+        assert update_info['es_info']['backoffs']['0']['error'] is None
+
+
+def test_smsimp_indexpipeline(small_index_objs):
+    """test simple indexer serve with the pipelined es writer"""
+    indexer, request, invalidated = small_index_objs
+    indexer.bulk_options['enabled'] = True
+    indexer.bulk_options['pipeline'] = True
+    indexer.bulk_options['queue_size'] = 2
+    update_infos, errors, err_msg = indexer.serve_objects(
+        request,
+        invalidated,
+        None,  # xmin
+        snapshot_id=None,
+        restart=False,
+        timeout=SMALL_SERVE_TIMEOUT,
+    )
+    assert err_msg is None
+    assert not errors
+    assert len(request.embeded_uuids) == len(invalidated)
+    assert all(update_info['run_time'] is not None for update_info in update_infos)
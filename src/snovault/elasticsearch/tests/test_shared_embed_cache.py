@@ -0,0 +1,57 @@
+"""Tests the shared embed cache with a mocked redis client"""
+from redis.exceptions import RedisError
+
+from snovault.elasticsearch.shared_embed_cache import SharedEmbedCache
+
+
+class MockRedis(dict):
+    """Dict backed stand in for the few redis calls used"""
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.fail = fail
+
+    def get(self, key):  # pylint: disable=arguments-differ
+        if self.fail:
+            raise RedisError('Fake redis failure')
+        return super().get(key)
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        if self.fail:
+            raise RedisError('Fake redis failure')
+        self[key] = value
+
+
+CACHED = ({'@id': '/items/one/', 'title': 'one'}, {'uuid-1'}, {'uuid-1', 'uuid-2'})
+
+
+def test_shared_embed_cache_inactive_without_snapshot():
+    cache = SharedEmbedCache(MockRedis())
+    cache['/items/one/@@object'] = CACHED
+    assert not cache.client
+    assert cache.get('/items/one/@@object') is None
+
+
+def test_shared_embed_cache_keyed_by_snapshot():
+    cache = SharedEmbedCache(MockRedis())
+    cache.set_snapshot(10, 'snapshot-a')
+    cache['/items/one/@@object'] = CACHED
+    assert cache.get('/items/one/@@object') == CACHED
+    cache.set_snapshot(11, 'snapshot-b')
+    assert cache.get('/items/one/@@object') is None
+    cache.clear_snapshot()
+    assert cache.get('/items/one/@@object') is None
+
+
+def test_shared_embed_cache_max_bytes():
+    cache = SharedEmbedCache(MockRedis(), max_bytes=10)
+    cache.set_snapshot(10, 'snapshot-a')
+    cache['/items/one/@@object'] = CACHED
+    assert cache.get('/items/one/@@object') is None
+
+
+def test_shared_embed_cache_redis_errors_are_misses():
+    cache = SharedEmbedCache(MockRedis(fail=True))
+    cache.set_snapshot(10, 'snapshot-a')
+    cache['/items/one/@@object'] = CACHED
+    assert cache.get('/items/one/@@object') is None
@@ -1,11 +1,31 @@
-from .util import quick_deepcopy
+from inspect import isfunction
 from posixpath import join
+from urllib.parse import parse_qsl
 from pyramid.compat import (
     native_,
     unquote_bytes_to_wsgi,
 )
+from pyramid.exceptions import PredicateMismatch
 from pyramid.httpexceptions import HTTPNotFound
-from .interfaces import CONNECTION
+from pyramid.interfaces import (
+    IAuthorizationPolicy,
+    IRequest,
+    IView,
+    IViewClassifier,
+)
+from pyramid.settings import asbool
+from pyramid.url import URLMethodsMixin
+from webob.multidict import MultiDict
+from zope.interface import providedBy
+from .cache import ManagerLRUCache
+from .frame_cache import PersistentFrameCache
+from .interfaces import (
+    CONNECTION,
+    FRAME_CACHE,
+    ROOT,
+    SHARED_EMBED_CACHE,
+)
+from .resources import Item
 import logging
 log = logging.getLogger(__name__)
 
@@ -17,6 +37,10 @@ def includeme(config):
     config.add_request_method(lambda request: set(), '_embedded_uuids', reify=True)
     config.add_request_method(lambda request: set(), '_linked_uuids', reify=True)
     config.add_request_method(lambda request: None, '__parent__', reify=True)
+    config.add_request_method(_embed_identity, '_embed_identity', reify=True)
+    frame_cache = PersistentFrameCache.from_settings(config.registry.settings)
+    if frame_cache is not None:
+        config.registry[FRAME_CACHE] = frame_cache
 
 
 def make_subrequest(request, path):
@@ -36,8 +60,9 @@ def make_subrequest(request, path):
         query_string = ''
     env['PATH_INFO'] = path_info
     env['QUERY_STRING'] = query_string
-    subreq = request.__class__(env, method='GET', content_type=None,
-                               body=b'')
+    request_class = getattr(request, '_request_class', None) or request.__class__
+    subreq = request_class(env, method='GET', content_type=None,
+                           body=b'')
     subreq.remove_conditional_headers()
     # XXX "This does not remove headers like If-Match"
     subreq.__parent__ = request
@@ -47,6 +72,10 @@ def make_subrequest(request, path):
 
 def embed(request, *elements, **kw):
     """ as_user=True for current user
+
+    Cached results are returned as a shallow copy. Nested values are shared
+    with the embed cache and must be copied before they are modified, as
+    expand_path does.
     """
     # Should really be more careful about what gets included instead.
     # Cache cut response time from ~800ms to ~420ms.
@@ -60,16 +89,52 @@ def embed(request, *elements, **kw):
     else:
         cached = embed_cache.get(path, None)
         if cached is None:
-            cached = _embed(request, path)
+            cached = _embed_uncached(request, path)
             embed_cache[path] = cached
         result, embedded, linked = cached
-        result = quick_deepcopy(result)
+        result = _shallow_copy(result)
     request._embedded_uuids.update(embedded)
     request._linked_uuids.update(linked)
     return result
 
 
+def _shallow_copy(result):
+    if isinstance(result, dict):
+        return dict(result)
+    if isinstance(result, list):
+        return list(result)
+    return result
+
+
+def _embed_uncached(request, path):
+    """ Render path on a request embed cache miss
+
+    Consults the optional cross process caches first: the cache shared by
+    indexer workers within a snapshot, then the persistent frame cache.
+    """
+    shared_cache = request.registry.get(SHARED_EMBED_CACHE)
+    if shared_cache is not None:
+        cached = shared_cache.get(path)
+        if cached is not None:
+            return cached
+    frame_cache = request.registry.get(FRAME_CACHE)
+    cached = None
+    if frame_cache is not None:
+        cached = frame_cache.get(request, path)
+    if cached is None:
+        cached = _embed(request, path)
+        if frame_cache is not None:
+            frame_cache.set(request, path, cached)
+    if shared_cache is not None:
+        shared_cache[path] = cached
+    return cached
+
+
 def _embed(request, path, as_user='EMBED'):
+    if as_user == 'EMBED' and asbool(request.registry.settings.get('embed.fast_path', False)):
+        rendered = _embed_item_frame(request, path)
+        if rendered is not None:
+            return rendered
     subreq = make_subrequest(request, path)
     subreq.override_renderer = 'null_renderer'
     if as_user is not True:
@@ -83,6 +148,144 @@ def _embed(request, path, as_user='EMBED'):
     return result, subreq._embedded_uuids, subreq._linked_uuids
 
 
+# Frames rendered without a subrequest, see _embed_item_frame
+FAST_PATH_FRAMES = ('object', 'embedded')
+
+# Whether the EMBED user may view an item, by (uuid, tid)
+embed_permits_cache = ManagerLRUCache('snovault.embed.permits_cache', 10000)
+
+
+def _embed_identity(request):
+    """ authenticated_userid and effective_principals of the EMBED user
+    """
+    subreq = make_subrequest(request, '/')
+    if 'HTTP_COOKIE' in subreq.environ:
+        del subreq.environ['HTTP_COOKIE']
+    subreq.remote_user = 'EMBED'
+    subreq.registry = request.registry
+    return subreq.authenticated_userid, subreq.effective_principals
+
+
+def _embed_item_frame(request, path):
+    """ Render an @@object or @@embedded frame of an item directly
+
+    Skips building and dispatching a subrequest: the item is looked up
+    through the resource tree, the view permission of the EMBED user is
+    checked once per item version and the view function is called with a
+    FrameRequest.  Only views registered with the view permission, or none,
+    and no decorator, wrapper, mapper or attr are called this way, as the
+    other view derivers are skipped.  Returns None when the path is not such an
+    item frame, or is not permitted, so the caller falls back to a
+    subrequest.
+    """
+    path_info, _, query_string = path.partition('?')
+    segments = [segment for segment in path_info.split('/') if segment]
+    if not segments or not segments[-1].startswith('@@'):
+        return None
+    view_name = segments[-1][2:]
+    if view_name not in FAST_PATH_FRAMES:
+        return None
+    context = request.registry[ROOT]
+    try:
+        for segment in segments[:-1]:
+            context = context[segment]
+    except (KeyError, TypeError):
+        return None
+    if not isinstance(context, Item):
+        return None
+    identity = request._embed_identity
+    key = (str(context.uuid), context.tid)
+    permitted = embed_permits_cache.get(key)
+    if permitted is None:
+        policy = request.registry.queryUtility(IAuthorizationPolicy)
+        permitted = policy is None or bool(policy.permits(context, identity[1], 'view'))
+        embed_permits_cache[key] = permitted
+    if not permitted:
+        return None
+    frame_request = FrameRequest(request, context, view_name, query_string, identity)
+    view = request.registry.adapters.lookup(
+        (IViewClassifier, IRequest, providedBy(context)), IView, name=view_name, default=None)
+    if hasattr(view, 'match'):
+        try:
+            view = view.match(context, frame_request)
+        except PredicateMismatch:
+            return None
+    # The permission checked above, or none
+    if getattr(view, '__permission__', None) not in (None, 'view'):
+        return None
+    if view not in _plain_views(request.registry):
+        return None
+    view = getattr(view, '__original_view__', None)
+    if not isfunction(view):
+        return None
+    result = view(context, frame_request)
+    return result, frame_request._embedded_uuids, frame_request._linked_uuids
+
+
+def _plain_views(registry):
+    """ Derived FAST_PATH_FRAMES views registered without a decorator,
+    wrapper, mapper or attr, from the introspector
+    """
+    views = getattr(registry, '_snovault_plain_views', None)
+    if views is None:
+        views = set()
+        for info in registry.introspector.get_category('views'):
+            intr = info['introspectable']
+            if intr['name'] not in FAST_PATH_FRAMES:
+                continue
+            if any(intr.get(key) for key in ('decorator', 'wrapper', 'mapper', 'attr')):
+                continue
+            views.add(intr.get('derived_callable'))
+        registry._snovault_plain_views = views
+    return views
+
+
+class FrameRequest(object):
+    """ Stands in for the subrequest of an internal frame embed
+
+    Carries its own embed accounting, params and EMBED identity, and
+    delegates everything else to the request it was embedded from.
+    """
+    method = 'GET'
+    remote_user = 'EMBED'
+
+    def __init__(self, parent, context, view_name, query_string, identity):
+        self.__parent__ = parent
+        self.context = context
+        self.view_name = view_name
+        self.query_string = query_string
+        self.GET = self.params = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        self.authenticated_userid, self.effective_principals = identity
+        self._embedded_uuids = set()
+        self._linked_uuids = set()
+
+    def __getattr__(self, name):
+        return getattr(self.__parent__, name)
+
+    @property
+    def _request_class(self):
+        parent = self.__parent__
+        return getattr(parent, '_request_class', None) or parent.__class__
+
+    def embed(self, *elements, **kw):
+        return embed(self, *elements, **kw)
+
+    # Bound here rather than delegated so Item.__resource_url__ records
+    # links in this frame's _linked_uuids
+    resource_url = URLMethodsMixin.resource_url
+    resource_path = URLMethodsMixin.resource_path
+    route_url = URLMethodsMixin.route_url
+    route_path = URLMethodsMixin.route_path
+
+    def has_permission(self, permission, context=None):
+        if context is None:
+            context = self.context
+        policy = self.registry.queryUtility(IAuthorizationPolicy)
+        if policy is None:
+            return True
+        return policy.permits(context, self.effective_principals, permission)
+
+
 class NullRenderer:
     '''Sets result value directly as response.
     '''
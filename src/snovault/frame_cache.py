@@ -0,0 +1,140 @@
+'''
+Persistent cache of rendered @@object and @@embedded frames
+
+Most items are unchanged between indexing cycles, yet their frames are
+rendered again whenever something embedding them is invalidated.  With
+embed_frame_cache.path set, embed() keeps rendered frames in a sqlite file
+shared by the processes on a host and reuses them across requests and
+cycles.
+
+Entries are keyed by path and app version and record the tid of every item
+the frame embeds or links to.  A hit is only used when all those items
+still have the same tid.  Frames touching item types with reverse links
+are not cached since a new reverse link does not change any tid.
+'''
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .interfaces import CONNECTION
+from .json_renderer import json_renderer
+
+
+log = logging.getLogger(__name__)
+CACHED_FRAMES = ('@@object', '@@embedded')
+DEFAULT_MAX_ENTRIES = 100000
+# Prune least recently used entries every this many writes
+PRUNE_INTERVAL = 1000
+
+
+class PersistentFrameCache(object):
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        path = settings.get('embed_frame_cache.path')
+        if not path:
+            return None
+        max_entries = int(settings.get('embed_frame_cache.max_entries', DEFAULT_MAX_ENTRIES))
+        return cls(path, max_entries=max_entries)
+
+    @property
+    def db(self):
+        # One connection per thread and process, sqlite handles the locking
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS frames '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, atime REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS frames_atime ON frames (atime)')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @staticmethod
+    def is_cacheable(path):
+        if '?' in path:
+            return False
+        return path.rstrip('/').rsplit('/', 1)[-1] in CACHED_FRAMES
+
+    @staticmethod
+    def _key(request, path):
+        return '%s:%s' % (request.registry.settings.get('snovault.app_version'), path)
+
+    @staticmethod
+    def _dependency_tids(request, uuids):
+        '''Return {uuid: tid} or None if any item is missing or has rev links'''
+        uuids = {str(uuid) for uuid in uuids}
+        if not uuids:
+            return {}
+        # One storage call for the items not already in the item cache
+        items = request.registry[CONNECTION].get_by_uuids(uuids)
+        tids = {}
+        for item in items:
+            if item.rev:
+                return None
+            tids[str(item.uuid)] = item.tid
+        if tids.keys() != uuids:
+            return None
+        return tids
+
+    def get(self, request, path):
+        '''Return a (result, embedded, linked) embed cache entry or None'''
+        if not self.is_cacheable(path):
+            return None
+        key = self._key(request, path)
+        try:
+            row = self.db.execute('SELECT value FROM frames WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as ecp:
+            log.warning('Frame cache get failed: %r', ecp)
+            return None
+        if row is None:
+            return None
+        result, embedded, linked, tids = json.loads(row[0])
+        if self._dependency_tids(request, tids.keys()) != tids:
+            return None
+        try:
+            self.db.execute('UPDATE frames SET atime = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error:
+            pass
+        return result, set(embedded), set(linked)
+
+    def set(self, request, path, cached):
+        if not self.is_cacheable(path):
+            return
+        result, embedded, linked = cached
+        tids = self._dependency_tids(request, set(embedded) | set(linked))
+        if tids is None:
+            return
+        value = json_renderer.dumps([result, embedded, linked, tids])
+        try:
+            self.db.execute(
+                'INSERT OR REPLACE INTO frames (key, value, atime) VALUES (?, ?, ?)',
+                (self._key(request, path), value, time.time()),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_INTERVAL == 0:
+                self.prune()
+        except sqlite3.Error as ecp:
+            log.warning('Frame cache set failed: %r', ecp)
+
+    def prune(self):
+        '''Evict the least recently used entries beyond max_entries'''
+        count = self.db.execute('SELECT COUNT(*) FROM frames').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.db.execute(
+                'DELETE FROM frames WHERE key IN '
+                '(SELECT key FROM frames ORDER BY atime LIMIT ?)',
+                (excess,),
+            )
@@ -5,14 +5,18 @@ CALCULATED_PROPERTIES = 'calculated_properties'
 COLLECTIONS = 'collections'
 CONNECTION = 'connection'
 DBSESSION = 'dbsession'
+FRAME_CACHE = 'frame_cache'
+SHARED_EMBED_CACHE = 'shared_embed_cache'
 STORAGE = 'storage'
 ROOT = 'root'
 TYPES = 'types'
 UPGRADER = 'upgrader'
+UPGRADE_WRITE_BACK = 'upgrade_write_back'
 
 # Constants
 PHASE1_5_CONFIG = -15
 PHASE2_5_CONFIG = -5
+PHASE3_5_CONFIG = 5
 
 
 # Events
@@ -0,0 +1,149 @@
+"""\
+Route read only transactions to read replicas
+
+Configure replica engines with a list of urls, they take the other
+sqlalchemy.* settings of the primary:
+
+    replica.sqlalchemy.urls =
+        postgresql://replica1/snowflakes
+        postgresql://replica2/snowflakes
+
+Doomed transactions are read only (see storage.set_transaction_isolation_level)
+and run on a replica, unless:
+
+- they import a snapshot, which can only be exported from the primary;
+- the user's recent edits, recorded in the session by
+  invalidation.es_update_data, have not been replayed on the replica yet.
+
+Replicas that are down or behind are skipped for another one, or the
+primary. Whether a replica is up is checked at most every few seconds.
+Edits are only recorded with elasticsearch configured, so replicas require
+it: without it users could be shown older versions of their edits.
+
+To also run GET and HEAD requests on replicas, their transactions can be
+doomed, when no view answering those writes:
+
+    replica.doom_get = true
+"""
+import logging
+import random
+import time
+import transaction
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.settings import (
+    asbool,
+    aslist,
+)
+from sqlalchemy import (
+    exc,
+    orm,
+    text,
+)
+from .util import get_root_request
+
+
+log = logging.getLogger(__name__)
+
+REPLICA_URLS = 'replica.sqlalchemy.urls'
+
+_replayed = text("SELECT txid_visible_in_snapshot(:xid, txid_current_snapshot());")
+
+
+def includeme(config):
+    settings = config.registry.settings
+    if not aslist(settings.get(REPLICA_URLS, '')):
+        return
+    if 'elasticsearch.server' not in settings:
+        raise ConfigurationError('%s requires elasticsearch.server' % REPLICA_URLS)
+    if asbool(settings.get('replica.doom_get', False)):
+        config.add_tween(
+            'snovault.replicas.read_only_tween_factory',
+            under='pyramid_tm.tm_tween_factory')
+
+
+def read_only_tween_factory(handler, registry):
+
+    def read_only_tween(request):
+        if request.method in ('GET', 'HEAD'):
+            request.tm.doom()
+        return handler(request)
+
+    return read_only_tween
+
+
+def last_edit_xid(request):
+    """ xid of the latest transaction the user made, from the session
+    """
+    if request is None:
+        return None
+    edits = dict.get(request.session, 'edits', None)
+    if not edits:
+        return None
+    return max(xid for xid, updated, renamed in edits)
+
+
+def replayed(engine, xid=None):
+    """ Whether the replica is up and has replayed transaction xid
+    """
+    try:
+        with engine.connect() as connection:
+            if xid is None:
+                return True
+            return connection.scalar(_replayed, xid=xid)
+    except exc.DBAPIError:
+        log.warning('Replica %r unavailable', engine.url, exc_info=True)
+        return False
+
+
+class RoutingSession(orm.Session):
+    """ A session choosing a replica for read only transactions
+
+    The bind is chosen once per transaction, when the session first connects.
+    """
+    # Seconds a replica is taken to stay up or down after a check
+    status_ttl = 5
+
+    def __init__(self, replicas=(), **kw):
+        super(RoutingSession, self).__init__(**kw)
+        self.replicas = list(replicas)
+        # engine: (time checked, up)
+        self.status = {}
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if not self.replicas:
+            return super(RoutingSession, self).get_bind(mapper, clause, **kw)
+        data = transaction.get()._extension
+        bind = data.get('_snovault_bind')
+        if bind is None:
+            bind = self.read_only_bind()
+            if bind is None:
+                bind = super(RoutingSession, self).get_bind(mapper, clause, **kw)
+            data['_snovault_bind'] = bind
+        return bind
+
+    def read_only_bind(self):
+        """ A replica to run the current transaction on, or None
+        """
+        txn = transaction.get()
+        if not txn.isDoomed():
+            return None
+        if 'snapshot_id' in txn._extension:
+            # Snapshots can only be exported from and imported on the primary
+            return None
+        xid = last_edit_xid(get_root_request())
+        for replica in random.sample(self.replicas, len(self.replicas)):
+            if not self.available(replica):
+                continue
+            # Never show users an older version of their own edits
+            if xid is None or replayed(replica, xid):
+                return replica
+        return None
+
+    def available(self, replica):
+        now = time.time()
+        checked, up = self.status.get(replica, (None, False))
+        if checked is None or now - checked > self.status_ttl:
+            up = replayed(replica)
+            self.status[replica] = now, up
+        return up
@@ -1,8 +1,5 @@
 import sys
-from future.utils import (
-    raise_with_traceback,
-    itervalues,
-)
+from future.utils import raise_with_traceback
 from itertools import islice
 from past.builtins import basestring
 from pyramid.exceptions import PredicateMismatch
@@ -51,6 +48,18 @@ def remove_item_keys(item, request):
     return item
 
 
+def _iter_collection_items(context, batchsize=None):
+    """Items of a collection, loaded a batch at a time"""
+    batchsize = batchsize or 1000
+    uuids = iter(context)
+    while True:
+        batch = list(islice(uuids, batchsize))
+        if not batch:
+            return
+        for item in context.connection.get_by_uuids(batch):
+            yield item
+
+
 @view_config(context=AbstractCollection, permission='list', request_method='GET',
              name='listing_db')
 def collection_view_listing_db(context, request):
@@ -68,7 +77,7 @@ def collection_view_listing_db(context, request):
             limit = 25
 
     items = (
-        item for item in itervalues(context)
+        item for item in _iter_collection_items(context, limit)
         if request.has_permission('view', item)
     )
 
@@ -193,9 +202,13 @@ def uuid_to_path(request, obj, path):
         return
     conn = request.registry[CONNECTION]
     if isinstance(value, list):
+        items = conn.get_by_uuids(value)
+        if len(items) != len(value):
+            # Raises KeyError for the missing item
+            items = [conn[v] for v in value]
         obj[name] = [
-            request.resource_path(conn[v])
-            for v in value
+            request.resource_path(item)
+            for item in items
         ]
     else:
         obj[name] = request.resource_path(conn[value])
@@ -278,10 +291,7 @@ def item_view_filtered_object(context, request):
 def item_view_embedded(context, request):
     item_path = request.resource_path(context)
     properties = request.embed(item_path, '@@object')
-    for path in context.embedded:
-        expand_path(request, properties, path)
-    for path in context.embedded_with_frame:
-        path.expand(request, properties)
+    context.type_info.embedding_plan.expand(request, properties)
     return properties
 
 
@@ -19,6 +19,7 @@ from .interfaces import (
     ROOT,
     TYPES,
     UPGRADER,
+    UPGRADE_WRITE_BACK,
 )
 from .validation import ValidationFailure
 from .util import (
@@ -287,11 +288,19 @@ class Item(Resource):
         }
 
     def upgrade_properties(self):
-        properties = quick_deepcopy(self.properties)
-        current_version = properties.get('schema_version', '')
+        current_version = self.properties.get('schema_version', '')
         target_version = self.type_info.schema_version
         if target_version is not None and current_version != target_version:
             upgrader = self.registry[UPGRADER]
+            uuid = str(self.uuid)
+            write_back = self.registry.get(UPGRADE_WRITE_BACK)
+            if write_back is not None:
+                write_back.record(uuid)
+            # Memoized per item version, so upgrades are not repeated
+            properties = upgrader.get_upgraded(uuid, self.tid, target_version)
+            if properties is not None:
+                return properties
+            properties = quick_deepcopy(self.properties)
             try:
                 properties = upgrader.upgrade(
                     self.type_info.name, properties, current_version, target_version,
@@ -303,7 +312,10 @@ class Item(Resource):
                     'Unable to upgrade %s from %r to %r',
                     resource_path(self.__parent__, self.uuid),
                     current_version, target_version, exc_info=True)
-        return properties
+            else:
+                upgrader.set_upgraded(uuid, self.tid, target_version, properties)
+            return properties
+        return quick_deepcopy(self.properties)
 
     def __json__(self, request):
         # Record embedding objects
@@ -343,6 +355,7 @@ class Item(Resource):
 
         connection = self.registry[CONNECTION]
         connection.update(self.model, properties, sheets, unique_keys, links)
+        self.registry[UPGRADER].forget_upgraded(str(self.uuid))
 
     @calculated_property(name='@type', schema={
         "title": "Type",
@@ -107,27 +107,36 @@ def linkTo(validator, linkTo, instance, schema):
             return
 
     if schema.get('linkSubmitsFor'):
-        userid = None
-        for principal in request.effective_principals:
-            if principal.startswith('userid.'):
-                userid = principal[len('userid.'):]
-                break
-        if userid is not None:
-            user = request.root[userid]
-            submits_for = user.upgrade_properties().get('submits_for')
-            if (submits_for is not None and
-                    not any(UUID(uuid) == item.uuid for uuid in submits_for) and
-                    not request.has_permission('review') and
-                    not request.has_permission('submit_for_any')):
-                error = "%r is not in user submits_for" % instance
-                yield ValidationError(error)
-                return
+        error = submits_for_error(request, instance, item.uuid)
+        if error is not None:
+            yield ValidationError(error)
+            return
 
     # And normalize the value to a uuid
     if validator._serialize:
         validator._validated[-1] = str(item.uuid)
 
 
+def submits_for_error(request, instance, target):
+    """ Error if the user may not link to target for linkSubmitsFor, or None
+    """
+    userid = None
+    for principal in request.effective_principals:
+        if principal.startswith('userid.'):
+            userid = principal[len('userid.'):]
+            break
+    if userid is None:
+        return None
+    user = request.root[userid]
+    submits_for = user.upgrade_properties().get('submits_for')
+    if (submits_for is not None and
+            not any(UUID(uuid) == target for uuid in submits_for) and
+            not request.has_permission('review') and
+            not request.has_permission('submit_for_any')):
+        return "%r is not in user submits_for" % instance
+    return None
+
+
 def linkFrom(validator, linkFrom, instance, schema):
     # avoid circular import
     from snovault import Item, TYPES, COLLECTIONS
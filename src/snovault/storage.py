@@ -10,6 +10,7 @@ from sqlalchemy import (
     orm,
     schema,
     text,
+    tuple_,
     types,
 )
 from sqlalchemy.dialects import postgresql
@@ -91,6 +92,44 @@ class RDBStorage(object):
             return default
         return model
 
+    def get_by_uuids(self, rids):
+        '''Load the resources for rids with their links and keys
+
+        A handful of IN queries per batch instead of one query per resource.
+        Missing rids are left out of the result.
+        '''
+        rids = [uuid.UUID(str(rid)) for rid in rids]
+        session = self.DBSession()
+        models = []
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(Resource).options(
+                orm.selectinload(Resource.rels),
+                orm.selectinload(Resource.unique_keys),
+            ).filter(Resource.rid.in_(rids[start:start + self.batchsize]))
+            models.extend(query.all())
+        return models
+
+    def get_link_targets(self, source_rels):
+        '''Targets of the links for (source rid, rel) pairs
+
+        One query per batch of sources.  Returns a set of target rids.
+        '''
+        pairs = {(str(rid), rel) for rid, rel in source_rels}
+        rids = sorted({uuid.UUID(rid) for rid, rel in pairs})
+        rels = {rel for rid, rel in pairs}
+        session = self.DBSession()
+        targets = set()
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(Link.source_rid, Link.rel, Link.target_rid).filter(
+                Link.source_rid.in_(rids[start:start + self.batchsize]),
+                Link.rel.in_(rels),
+            )
+            targets.update(
+                target_rid for source_rid, rel, target_rid in query
+                if (str(source_rid), rel) in pairs
+            )
+        return targets
+
     def get_by_unique_key(self, unique_key, name, default=None, index=None):
         session = self.DBSession()
         try:
@@ -100,13 +139,36 @@ class RDBStorage(object):
         else:
             return key.resource
 
-    def get_rev_links(self, model, rel, *item_types):
+    def _rev_links_query(self, rel, item_types):
+        session = self.DBSession()
+        query = session.query(Link.target_rid, Link.source_rid).filter(Link.rel == rel)
         if item_types:
-            return [
-                link.source_rid for link in model.revs
-                if link.rel == rel and link.source.item_type in item_types]
-        else:
-            return [link.source_rid for link in model.revs if link.rel == rel]
+            query = query.join(Resource, Resource.rid == Link.source_rid).filter(
+                Resource.item_type.in_(item_types)
+            )
+        return query
+
+    def get_rev_links(self, model, rel, *item_types):
+        query = self._rev_links_query(rel, item_types).filter(
+            Link.target_rid == uuid.UUID(str(model.uuid))
+        )
+        return [source_rid for target_rid, source_rid in query]
+
+    def get_rev_links_by_targets(self, rids, rel, *item_types):
+        '''Reverse links of rel for many targets at once
+
+        Returns a dict of target uuid string to the list of source rids,
+        with every requested target present.
+        '''
+        rids = [uuid.UUID(str(rid)) for rid in rids]
+        rev_links = {str(rid): [] for rid in rids}
+        for start in range(0, len(rids), self.batchsize):
+            query = self._rev_links_query(rel, item_types).filter(
+                Link.target_rid.in_(rids[start:start + self.batchsize])
+            )
+            for target_rid, source_rid in query:
+                rev_links[str(target_rid)].append(source_rid)
+        return rev_links
 
     def __iter__(self, *item_types):
         session = self.DBSession()
@@ -166,6 +228,169 @@ class RDBStorage(object):
         msg = 'Keys conflict: %r' % conflicts
         raise HTTPConflict(msg)
 
+    def bulk_update(self, updates):
+        '''Write many items with set based queries
+
+        updates is a list of (model, properties, sheets, unique_keys, links)
+        tuples, as the arguments of update.  Existing keys and links of the
+        whole batch are read with a few IN queries and the differences are
+        written with multi-row statements, without a savepoint per item.
+
+        Items that would conflict are left out and reported instead: returns
+        a dict of uuid string to conflict message.  A key moving between
+        items of the same batch is reported as a conflict, write those items
+        with update.  New items linking to a new item left out are left out
+        too, as their link targets would be missing.
+        '''
+        session = self.DBSession()
+        models = [model for model, properties, sheets, unique_keys, links in updates]
+        rids = [model.rid for model in models]
+        conflicts = {}
+
+        new_rids = {model.rid for model in models if orm.object_session(model) is None}
+        for rid in self._existing_rids(new_rids):
+            conflicts[str(rid)] = 'UUID conflict'
+
+        desired_keys = {}
+        desired_rels = {}
+        for model, properties, sheets, unique_keys, links in updates:
+            if unique_keys is not None:
+                desired_keys[model.rid] = {
+                    (k, v) for k, values in unique_keys.items() for v in values
+                }
+            if links is not None:
+                desired_rels[model.rid] = {
+                    (k, uuid.UUID(target)) for k, targets in links.items() for target in targets
+                }
+
+        key_owners = self._key_owners(
+            rids, set().union(*desired_keys.values()) if desired_keys else ())
+        existing_keys = {rid: set() for rid in rids}
+        for pk, rid in key_owners.items():
+            if rid in existing_keys:
+                existing_keys[rid].add(pk)
+        existing_rels = self._existing_rels(rids)
+        targets = set()
+        for rels in desired_rels.values():
+            targets.update(target for rel, target in rels)
+        existing_targets = set(self._existing_rids(targets))
+
+        # Items left out may be link targets of others, so repeat until no
+        # more are left out.  Conflicts only grow, so this terminates.
+        while True:
+            conflict_count = len(conflicts)
+            valid_targets = existing_targets | {
+                rid for rid in new_rids if str(rid) not in conflicts
+            }
+            keys_add = []
+            keys_remove = []
+            rels_add = []
+            rels_remove = []
+            claimed = set()
+            applied = []
+            for model, properties, sheets, unique_keys, links in updates:
+                rid = model.rid
+                if str(rid) in conflicts:
+                    continue
+                to_add = set()
+                if rid in desired_keys:
+                    to_add = desired_keys[rid] - existing_keys[rid]
+                    taken = sorted(
+                        pk for pk in to_add
+                        if pk in claimed or key_owners.get(pk, rid) != rid
+                    )
+                    if taken:
+                        conflicts[str(rid)] = 'Keys conflict: %r' % taken
+                        continue
+                if rid in desired_rels:
+                    missing = sorted(
+                        str(target) for rel, target in desired_rels[rid]
+                        if target not in valid_targets
+                    )
+                    if missing:
+                        conflicts[str(rid)] = 'Missing link targets: %r' % missing
+                        continue
+                    existing = existing_rels.get(rid, set())
+                    rels_add.extend(
+                        (rid, rel, target) for rel, target in desired_rels[rid] - existing)
+                    rels_remove.extend(
+                        (rid, rel, target) for rel, target in existing - desired_rels[rid])
+                if rid in desired_keys:
+                    claimed.update(to_add)
+                    keys_add.extend((name, value, rid) for name, value in to_add)
+                    keys_remove.extend(existing_keys[rid] - desired_keys[rid])
+                applied.append((model, properties, sheets))
+            if len(conflicts) == conflict_count:
+                break
+
+        for model, properties, sheets in applied:
+            session.add(model)
+            self._update_properties(model, properties, sheets)
+        # Resources must exist before keys and links refer to them
+        session.flush()
+
+        for start in range(0, len(keys_remove), self.batchsize):
+            session.query(Key).filter(
+                tuple_(Key.name, Key.value).in_(keys_remove[start:start + self.batchsize])
+            ).delete(synchronize_session=False)
+        for start in range(0, len(rels_remove), self.batchsize):
+            session.query(Link).filter(
+                tuple_(Link.source_rid, Link.rel, Link.target_rid).in_(
+                    rels_remove[start:start + self.batchsize])
+            ).delete(synchronize_session=False)
+        for start in range(0, len(keys_add), self.batchsize):
+            session.execute(Key.__table__.insert().values([
+                {'name': name, 'value': value, 'rid': rid}
+                for name, value, rid in keys_add[start:start + self.batchsize]
+            ]))
+        for start in range(0, len(rels_add), self.batchsize):
+            session.execute(Link.__table__.insert().values([
+                {'source': source, 'rel': rel, 'target': target}
+                for source, rel, target in rels_add[start:start + self.batchsize]
+            ]))
+        for model, properties, sheets in applied:
+            session.expire(model, ['unique_keys', 'rels'])
+        return conflicts
+
+    def _existing_rids(self, rids):
+        rids = list(rids)
+        session = self.DBSession()
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(Resource.rid).filter(
+                Resource.rid.in_(rids[start:start + self.batchsize]))
+            for rid, in query:
+                yield rid
+
+    def _key_owners(self, rids, pks):
+        '''Owner rid of each key held by rids or named in pks
+        '''
+        session = self.DBSession()
+        owners = {}
+        rids = list(rids)
+        pks = list(pks)
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(Key.name, Key.value, Key.rid).filter(
+                Key.rid.in_(rids[start:start + self.batchsize]))
+            for name, value, rid in query:
+                owners[name, value] = rid
+        for start in range(0, len(pks), self.batchsize):
+            query = session.query(Key.name, Key.value, Key.rid).filter(
+                tuple_(Key.name, Key.value).in_(pks[start:start + self.batchsize]))
+            for name, value, rid in query:
+                owners[name, value] = rid
+        return owners
+
+    def _existing_rels(self, rids):
+        session = self.DBSession()
+        existing = {}
+        rids = list(rids)
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(Link.source_rid, Link.rel, Link.target_rid).filter(
+                Link.source_rid.in_(rids[start:start + self.batchsize]))
+            for source, rel, target in query:
+                existing.setdefault(source, set()).add((rel, target))
+        return existing
+
     def delete_by_uuid(self, rid):
         # WARNING USE WITH CARE PERMANENTLY DELETES RESOURCES
         session = self.DBSession()
@@ -180,6 +405,9 @@ class RDBStorage(object):
                 session.delete(current_propsheet)
             # now delete the resource, keys and links(via cascade)
             session.delete(model)
+            session.query(ReverseEmbed).filter(
+                ReverseEmbed.source_rid == model.rid
+            ).delete(synchronize_session=False)
             sp.commit()
         except Exception as e:
             sp.rollback()
@@ -410,12 +638,15 @@ class Link(Base):
     """ indexed relations
     """
     __tablename__ = 'links'
+    __table_args__ = (
+        # Reverse lookup of a rel, also serves lookups by target alone
+        schema.Index('ix_links_target_rel', 'target', 'rel'),
+    )
     source_rid = Column(
         'source', UUID, ForeignKey('resources.rid'), primary_key=True)
     rel = Column(types.String, primary_key=True)
     target_rid = Column(
-        'target', UUID, ForeignKey('resources.rid'), primary_key=True,
-        index=True)  # Single column index for reverse lookup
+        'target', UUID, ForeignKey('resources.rid'), primary_key=True)
 
     source = orm.relationship(
         'Resource', foreign_keys=[source_rid], backref=backref('rels', cascade='all, delete-orphan'))
@@ -423,6 +654,22 @@ class Link(Base):
         'Resource', foreign_keys=[target_rid], backref=backref('revs', cascade='all, delete-orphan'))
 
 
+class ReverseEmbed(Base):
+    """ indexed reverse dependencies of rendered index documents
+
+    Maps each uuid embedded in (rel 'embedded') or linked from (rel 'linked')
+    the index document of source, as of the last time source was indexed.
+    No foreign keys, rows are replaced whenever the source is reindexed.
+    """
+    __tablename__ = 'reverse_embeds'
+    __table_args__ = (
+        schema.Index('ix_reverse_embeds_target_rel', 'target', 'rel'),
+    )
+    source_rid = Column('source', UUID, primary_key=True)
+    rel = Column(types.String, primary_key=True)
+    target_rid = Column('target', UUID, primary_key=True)
+
+
 class PropertySheet(Base):
     '''A triple describing a resource
     '''
@@ -654,7 +901,10 @@ def add_transaction_record(session, flush_context, instances):
         # Transaction has already been recorded
         return
 
-    tid = data['tid'] = uuid.uuid4()
+    # A tid may be chosen up front with txn.setExtendedInfo('tid', tid)
+    tid = data.get('tid')
+    if tid is None:
+        tid = data['tid'] = uuid.uuid4()
     record = TransactionRecord(tid=tid)
     data['_snovault_transaction_record'] = record
     session.add(record)
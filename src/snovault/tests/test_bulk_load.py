@@ -0,0 +1,86 @@
+import pytest
+
+targets = [
+    {'name': 'one', 'uuid': '775795d3-4410-4114-836b-8eeecf1d0c2f'},
+    {'name': 'two'},
+]
+
+sources = [
+    {
+        'name': 'A',
+        'target': 'one',
+        'uuid': '16157204-8c8f-4672-a1a4-14f4b8021fcd',
+    },
+    {
+        'name': 'B',
+        'target': '/testing-link-targets/two/',
+        'uuid': '1e152917-c5fd-4aec-b74f-b0533d0cc55c',
+    },
+]
+
+
+@pytest.fixture(autouse=True)
+def autouse_external_tx(external_tx):
+    pass
+
+
+def test_bulk_load(registry, dummy_request, threadlocals, testapp):
+    import transaction
+    from snovault.bulk_load import BulkLoader
+    loader = BulkLoader(registry)
+    loader.register('testing_link_target', targets)
+    loader.register('testing_link_source', sources)
+    assert loader.resolve('one', ['TestingLinkTarget']) == targets[0]['uuid']
+    assert loader.add('testing_link_target', targets) == 2
+    assert loader.add('testing_link_source', sources) == 2
+    assert loader.errors == []
+    assert loader.write() == {'TestingLinkTarget': 2, 'TestingLinkSource': 2}
+    transaction.commit()
+
+    res = testapp.get('/testing-link-targets/two/?datastore=database')
+    two = res.json['uuid']
+    assert two == loader.resolve('two', ['TestingLinkTarget'])
+    res = testapp.get('/%s/?frame=object&datastore=database' % sources[1]['uuid'])
+    assert res.json['target'] == '/testing-link-targets/two/'
+    res = testapp.get('/testing-link-targets/one/?datastore=database')
+    assert [source['uuid'] for source in res.json['reverse']] == [sources[0]['uuid']]
+
+
+def test_bulk_load_errors(registry, dummy_request, threadlocals):
+    from snovault.bulk_load import (
+        BulkLoadError,
+        BulkLoader,
+    )
+    loader = BulkLoader(registry)
+    duplicate = [{'name': 'one'}, {'name': 'one'}]
+    missing = [{'name': 'C', 'target': 'missing'}]
+    loader.register('testing_link_target', duplicate)
+    loader.register('testing_link_source', missing)
+    assert loader.add('testing_link_target', duplicate) == 1
+    assert loader.add('testing_link_source', missing) == 0
+    assert [message.split(':')[0] for type_name, rid, message in loader.errors] == [
+        'Keys conflict', 'target',
+    ]
+    with pytest.raises(BulkLoadError):
+        loader.write()
+
+
+def test_bulk_load_existing(registry, dummy_request, threadlocals):
+    from snovault.bulk_load import (
+        BulkLoadError,
+        BulkLoader,
+    )
+    loader = BulkLoader(registry)
+    loader.register('testing_link_target', targets)
+    assert loader.add('testing_link_target', targets) == 2
+    loader.write()
+
+    again = [{'name': 'three', 'uuid': targets[0]['uuid']}, {'name': 'two'}]
+    loader = BulkLoader(registry)
+    loader.register('testing_link_target', again)
+    assert loader.add('testing_link_target', again) == 2
+    with pytest.raises(BulkLoadError):
+        loader.write()
+    assert [message for type_name, rid, message in loader.errors] == [
+        'UUID conflict', "Keys conflict: [('testing_link_target:name', 'two')]",
+    ]
@@ -0,0 +1,51 @@
+def test_estimated_size():
+    from snovault.cache import estimated_size
+    assert estimated_size('abc') == 5
+    assert estimated_size({'a': 'b'}) == 2 + 1 + 4 + 3
+    assert estimated_size(['a', 1]) == 2 + 4 + 9
+
+
+def test_lru_cache_capacity():
+    from snovault.cache import LRUCache
+    cache = LRUCache(2, threshold=0)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache['a'] == 1
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert 'a' in cache
+    assert cache.evictions == 1
+
+
+def test_lru_cache_max_bytes():
+    from snovault.cache import LRUCache
+    cache = LRUCache(100, max_bytes=30)
+    cache['a'] = 'x' * 10
+    cache['b'] = 'x' * 10
+    assert cache.bytes == 24
+    cache['c'] = 'x' * 10
+    assert 'a' not in cache
+    assert len(cache) == 2
+    assert cache.bytes == 24
+    assert cache.evictions == 1
+    cache['d'] = 'x' * 50
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_lru_cache_sizes_only_when_needed():
+    from snovault.cache import LRUCache
+    sizes = []
+
+    def sizeof(value):
+        sizes.append(value)
+        return 1
+
+    cache = LRUCache(100, sizeof=sizeof)
+    cache['a'] = 'x'
+    assert sizes == []
+    assert cache.bytes == 0
+    cache = LRUCache(100, sizeof=sizeof, track_bytes=True)
+    cache['a'] = 'x'
+    assert sizes == ['x']
+    assert cache.bytes == 1
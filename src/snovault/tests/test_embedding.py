@@ -52,6 +52,71 @@ def test_embedded_uuids_expand_target(content, dummy_request, threadlocals):
     assert dummy_request._embedded_uuids == {sources[0]['uuid'], targets[0]['uuid']}
 
 
+def test_connection_prefetch(content, connection, threadlocals):
+    loaded = connection.prefetch([sources[0]['uuid']], depth=1)
+    assert loaded == 2
+    assert sources[0]['uuid'] in connection.item_cache
+    assert targets[0]['uuid'] in connection.item_cache
+    assert targets[1]['uuid'] not in connection.item_cache
+    assert connection.prefetch([sources[0]['uuid']]) == 0
+
+
+def test_connection_rev_links_cache_cleared(content, connection, threadlocals):
+    assert connection.prefetch_rev_links([targets[0]['uuid']]) == 1
+    key = (targets[0]['uuid'], 'target', ('testing_link_source',))
+    assert key in connection.rev_links_cache
+    source = connection.get_by_uuid(sources[0]['uuid'])
+    connection.update(source.model, dict(source.properties, target=targets[1]['uuid']),
+                      links={'target': [targets[1]['uuid']]})
+    assert key not in connection.rev_links_cache
+    target = connection.get_by_uuid(targets[0]['uuid'])
+    assert connection.get_rev_links(target.model, 'target', 'TestingLinkSource') == []
+
+
+def test_connection_get_by_uuids(content, connection, threadlocals):
+    missing = '00000000-0000-0000-0000-000000000000'
+    uuids = [targets[1]['uuid'], missing, 'not-a-uuid', sources[0]['uuid'], targets[1]['uuid']]
+    items = connection.get_by_uuids(uuids)
+    assert [str(item.uuid) for item in items] == [
+        targets[1]['uuid'], sources[0]['uuid'], targets[1]['uuid'],
+    ]
+    assert sources[0]['uuid'] in connection.item_cache
+    # Uppercase and unhyphenated forms find the same items
+    items = connection.get_by_uuids([targets[0]['uuid'].upper(), targets[1]['uuid'].replace('-', '')])
+    assert [str(item.uuid) for item in items] == [targets[0]['uuid'], targets[1]['uuid']]
+
+
+def test_frame_cache(content, dummy_request, threadlocals, tmpdir):
+    from snovault.frame_cache import PersistentFrameCache
+    frame_cache = PersistentFrameCache(str(tmpdir.join('frames.sqlite')))
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    cached = ({'name': 'A'}, {sources[0]['uuid']}, {sources[0]['uuid']})
+    frame_cache.set(dummy_request, path, cached)
+    assert frame_cache.get(dummy_request, path) == cached
+    assert frame_cache.get(dummy_request, path + '?frame=page') is None
+    # Targets have reverse links, a new source would not change their tid
+    path = '/testing-link-targets/%s/@@object' % targets[0]['uuid']
+    cached = ({'name': 'one'}, {targets[0]['uuid']}, {targets[0]['uuid']})
+    frame_cache.set(dummy_request, path, cached)
+    assert frame_cache.get(dummy_request, path) is None
+
+
+def test_frame_cache_batches_dependency_lookups(content, dummy_request, threadlocals, tmpdir, mocker):
+    from snovault import CONNECTION
+    from snovault.frame_cache import PersistentFrameCache
+    frame_cache = PersistentFrameCache(str(tmpdir.join('frames.sqlite')))
+    connection = dummy_request.registry[CONNECTION]
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    dependencies = {source['uuid'] for source in sources}
+    cached = ({'name': 'A'}, dependencies, dependencies)
+    get_by_uuid = mocker.spy(connection, 'get_by_uuid')
+    get_by_uuids = mocker.spy(connection, 'get_by_uuids')
+    frame_cache.set(dummy_request, path, cached)
+    assert frame_cache.get(dummy_request, path) == cached
+    assert get_by_uuid.call_count == 0
+    assert get_by_uuids.call_count == 2
+
+
 def test_updated_source(content, testapp):
     url = '/testing-link-sources/' + sources[0]['uuid']
     res = testapp.patch_json(url, {})
@@ -72,3 +137,58 @@ def test_updated_target(content, testapp):
     url = '/testing-link-targets/' + targets[0]['uuid']
     res = testapp.patch_json(url, {})
     assert set(res.headers['X-Updated'].split(',')) == {targets[0]['uuid']}
+
+
+def test_expand_path_does_not_modify_cached(content, dummy_request, threadlocals):
+    from snovault.util import expand_path
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    properties = dummy_request.embed(path)
+    expand_path(dummy_request, properties, 'target')
+    assert properties['target']['name'] == targets[0]['name']
+    assert dummy_request.embed(path)['target'] == '/testing-link-targets/one/'
+
+
+def test_embed_item_frame(content, dummy_request, threadlocals):
+    from snovault.embed import (
+        _embed,
+        _embed_item_frame,
+    )
+    for frame in ['@@object', '@@object?skip_calculated=true', '@@embedded']:
+        path = '/testing-link-sources/%s/%s' % (sources[0]['uuid'], frame)
+        result, embedded, linked = _embed_item_frame(dummy_request, path)
+        expected, expected_embedded, expected_linked = _embed(dummy_request, path)
+        assert result == expected
+        assert embedded == expected_embedded
+        assert linked == expected_linked
+        assert targets[0]['uuid'] in linked
+    # Links are recorded on the frame, not the request it was embedded from
+    assert dummy_request._linked_uuids == set()
+    assert _embed_item_frame(dummy_request, '/testing-link-sources/@@object') is None
+    path = '/testing-link-sources/%s/@@audit' % sources[0]['uuid']
+    assert _embed_item_frame(dummy_request, path) is None
+
+
+def test_embed_item_frame_denied(content, dummy_request, threadlocals, monkeypatch):
+    from pyramid.security import Deny
+    from snovault.embed import _embed_item_frame
+    from snovault.tests.testing_views import TestingLinkSource
+    monkeypatch.setattr(
+        TestingLinkSource, '__acl__', [(Deny, 'remoteuser.EMBED', 'view')], raising=False)
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    assert _embed_item_frame(dummy_request, path) is None
+
+
+def test_embed_fast_path_setting(content, dummy_request, threadlocals, monkeypatch):
+    from snovault import embed
+    monkeypatch.setitem(dummy_request.registry.settings, 'embed.fast_path', True)
+    calls = []
+
+    def embed_item_frame(request, path):
+        calls.append(path)
+        return embed_item_frame.original(request, path)
+
+    embed_item_frame.original = embed._embed_item_frame
+    monkeypatch.setattr(embed, '_embed_item_frame', embed_item_frame)
+    dummy_request.embed('/testing-link-sources/', sources[0]['uuid'], '@@expand?expand=target')
+    assert dummy_request._embedded_uuids == {sources[0]['uuid'], targets[0]['uuid']}
+    assert '/testing-link-sources/%s/@@object' % sources[0]['uuid'] in calls
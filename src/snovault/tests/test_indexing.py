@@ -66,7 +66,7 @@ def teardown(app, dbapi_conn):
     from snovault.elasticsearch import create_mapping
     create_mapping.run(app)
     cursor = dbapi_conn.cursor()
-    cursor.execute("""TRUNCATE resources, transactions CASCADE;""")
+    cursor.execute("""TRUNCATE resources, transactions, reverse_embeds CASCADE;""")
     cursor.close()
 
 
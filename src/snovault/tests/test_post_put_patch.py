@@ -275,3 +275,76 @@ def test_retry(testapp):
     res = testapp.get(url + '/@@testing-retry?datstore=database')
     assert res.json['retry.attempts'] == 3
     assert not res.json['detached']
+
+
+def test_batch_add(testapp):
+    batch = [
+        {'@type': 'TestingLinkSource', 'name': 'A', 'target': 'three'},
+        {'@type': 'TestingLinkTarget', 'name': 'three'},
+    ]
+    res = testapp.post_json('/batch', {'@graph': batch}, status=201)
+    source_id, target_id = res.json['@graph']
+    assert target_id == '/testing-link-targets/three/'
+    target = testapp.get(target_id).json
+    assert set(res.headers['X-Updated'].split(',')) >= {target['uuid']}
+    assert testapp.get(source_id).json['target'] == target_id
+
+
+def test_batch_add_deferred(testapp):
+    # Items with child objects or attachments are written one by one
+    batch = [
+        {'@type': 'TestingLinkSource', 'name': 'C', 'target': 'five'},
+        {'@type': 'TestingLinkTarget', 'name': 'five', 'reverse': [{'name': 'D'}]},
+        {
+            '@type': 'TestingDownload',
+            'attachment3': {
+                'download': 'empty-json.json',
+                'href': 'data:application/json;base64,eyJrZXkiOiBbXX0=',
+            },
+        },
+    ]
+    res = testapp.post_json('/batch', {'@graph': batch}, status=201)
+    source_id, target_id, download_id = res.json['@graph']
+    assert target_id == '/testing-link-targets/five/'
+    assert testapp.get(source_id).json['target'] == target_id
+    reverse = testapp.get(target_id + '?frame=object&datastore=database').json['reverse']
+    assert len(reverse) == 2
+    assert source_id in reverse
+    assert testapp.get(download_id).json['attachment3']['download'] == 'empty-json.json'
+
+
+def test_batch_add_uuid_conflict(testapp):
+    existing = testapp.post_json('/testing-link-targets/', {'name': 'six'}).json['@graph'][0]
+    batch = [
+        {
+            '@type': 'TestingDownload',
+            'attachment3': {
+                'download': 'empty-json.json',
+                'href': 'data:application/json;base64,eyJrZXkiOiBbXX0=',
+            },
+        },
+        {'@type': 'TestingLinkTarget', 'name': 'seven', 'uuid': existing['uuid']},
+    ]
+    res = testapp.post_json('/batch', {'@graph': batch}, status=409)
+    assert res.json['detail'] == '%s UUID conflict' % existing['uuid']
+
+
+def test_batch_add_duplicate_keys(testapp):
+    batch = [
+        {'@type': 'TestingLinkTarget', 'name': 'eight'},
+        {'@type': 'TestingLinkTarget', 'name': 'eight'},
+    ]
+    res = testapp.post_json('/batch', {'@graph': batch}, status=422)
+    assert [error['name'] for error in res.json['errors']] == [[1]]
+    testapp.get('/testing-link-targets/eight/', status=404)
+
+
+def test_batch_add_validation_failure(testapp):
+    batch = [
+        {'@type': 'TestingLinkTarget', 'name': 'four'},
+        {'@type': 'TestingLinkSource', 'name': 'B', 'target': 'missing'},
+        {'@type': 'testing-unknown'},
+    ]
+    res = testapp.post_json('/batch', {'@graph': batch}, status=422)
+    assert sorted(error['name'] for error in res.json['errors']) == [[1], [2, '@type']]
+    testapp.get('/testing-link-targets/four/', status=404)
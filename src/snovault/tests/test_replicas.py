@@ -0,0 +1,110 @@
+import pytest
+import transaction
+from sqlalchemy import create_engine
+
+
+@pytest.fixture
+def engines():
+    return create_engine('sqlite://'), create_engine('sqlite://')
+
+
+def test_routing_session_without_replicas(engines):
+    from snovault.replicas import RoutingSession
+    primary, replica = engines
+    session = RoutingSession(bind=primary)
+    txn = transaction.begin()
+    txn.doom()
+    try:
+        assert session.get_bind() is primary
+    finally:
+        transaction.abort()
+
+
+def test_routing_session_doomed(engines):
+    from snovault.replicas import RoutingSession
+    primary, replica = engines
+    session = RoutingSession(bind=primary, replicas=[replica])
+    transaction.begin()
+    try:
+        assert session.get_bind() is primary
+    finally:
+        transaction.abort()
+    txn = transaction.begin()
+    txn.doom()
+    try:
+        assert session.get_bind() is replica
+    finally:
+        transaction.abort()
+
+
+def test_routing_session_snapshot(engines):
+    from snovault.replicas import RoutingSession
+    primary, replica = engines
+    session = RoutingSession(bind=primary, replicas=[replica])
+    txn = transaction.begin()
+    txn.doom()
+    txn.setExtendedInfo('snapshot_id', '00000003-00000002-1')
+    try:
+        assert session.get_bind() is primary
+    finally:
+        transaction.abort()
+
+
+def test_routing_session_unavailable_replica(engines, tmpdir):
+    from sqlalchemy import create_engine
+    from snovault.replicas import RoutingSession
+    primary, replica = engines
+    down = create_engine('sqlite:///%s' % tmpdir.join('missing', 'db.sqlite'))
+    for replicas, expected in [([down, replica], replica), ([down], primary)]:
+        session = RoutingSession(bind=primary, replicas=replicas)
+        txn = transaction.begin()
+        txn.doom()
+        try:
+            assert session.get_bind() is expected
+        finally:
+            transaction.abort()
+
+
+def test_routing_session_edits(engines, monkeypatch, mocker):
+    from snovault import replicas
+    primary, replica = engines
+    request = mocker.Mock(session={'edits': [[5, [], []], [7, [], []]]})
+    monkeypatch.setattr(replicas, 'get_root_request', lambda: request)
+    assert replicas.last_edit_xid(request) == 7
+    for replayed_xid, expected in [(6, primary), (7, replica)]:
+        monkeypatch.setattr(
+            replicas, 'replayed', lambda engine, xid=None: xid is None or xid <= replayed_xid)
+        session = replicas.RoutingSession(bind=primary, replicas=[replica])
+        txn = transaction.begin()
+        txn.doom()
+        try:
+            assert session.get_bind() is expected
+        finally:
+            transaction.abort()
+
+
+@pytest.mark.parametrize('method, doomed', [('GET', True), ('HEAD', True), ('POST', False)])
+def test_read_only_tween(method, doomed, mocker):
+    from snovault.replicas import read_only_tween_factory
+    request = mocker.Mock(method=method)
+    handler = mocker.Mock(return_value='response')
+    tween = read_only_tween_factory(handler, None)
+    assert tween(request) == 'response'
+    assert request.tm.doom.called is doomed
+    handler.assert_called_once_with(request)
+
+
+def test_routing_session_status_cached(engines, monkeypatch):
+    from snovault import replicas
+    primary, replica = engines
+    probes = []
+    monkeypatch.setattr(replicas, 'replayed', lambda engine, xid=None: probes.append(xid) or True)
+    session = replicas.RoutingSession(bind=primary, replicas=[replica])
+    for i in range(3):
+        txn = transaction.begin()
+        txn.doom()
+        try:
+            assert session.get_bind() is replica
+        finally:
+            transaction.abort()
+    assert probes == [None]
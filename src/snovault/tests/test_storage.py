@@ -223,6 +223,159 @@ def test_keys(session):
         session.flush()
 
 
+def test_get_by_uuids(session, storage):
+    import uuid
+    from snovault.storage import (
+        Key,
+        Link,
+        Resource,
+    )
+    source = Resource('test_item', {'': {'foo': 'bar'}})
+    target = Resource('test_item', {'': {'foo': 'baz'}})
+    session.add_all([source, target])
+    session.flush()
+    session.add(Key(rid=source.rid, name='foo', value='bar'))
+    session.add(Link(source_rid=source.rid, rel='target', target_rid=target.rid))
+    session.flush()
+    session.expire_all()
+    models = storage.get_by_uuids([str(source.rid), str(target.rid), str(uuid.uuid4())])
+    assert {model.rid for model in models} == {source.rid, target.rid}
+    model = next(model for model in models if model.rid == source.rid)
+    assert model.properties == {'foo': 'bar'}
+    assert [link.target_rid for link in model.rels] == [target.rid]
+    assert [(key.name, key.value) for key in model.unique_keys] == [('foo', 'bar')]
+
+
+def test_es_get_by_uuids():
+    import uuid
+    from snovault.elasticsearch.esstorage import ElasticSearchStorage
+
+    class FakeElasticsearch(object):
+        searches = 0
+
+        def search(self, index, body, _source=False, size=10):
+            # Elasticsearch returns 10 hits unless asked for more
+            self.searches += 1
+            return {'hits': {'hits': [
+                {'_source': {'uuid': rid, 'item_type': 'test_item'}}
+                for rid in body['query']['terms']['uuid'][:size]
+            ]}}
+
+    es = FakeElasticsearch()
+    storage = ElasticSearchStorage(es, 'snovault')
+    storage.batchsize = 5
+    uuids = [str(uuid.uuid4()) for _ in range(12)]
+    models = storage.get_by_uuids(uuids)
+    assert [model.uuid for model in models] == uuids
+    assert es.searches == 3
+    storage.batchsize = 1000
+    assert len(storage.get_by_uuids(uuids)) == 12
+
+
+def test_get_rev_links(session, storage):
+    from snovault.storage import (
+        Link,
+        Resource,
+    )
+    target = Resource('test_item', {'': {}})
+    other_target = Resource('test_item', {'': {}})
+    source = Resource('test_item', {'': {}})
+    other_source = Resource('other_item', {'': {}})
+    session.add_all([target, other_target, source, other_source])
+    session.flush()
+    session.add_all([
+        Link(source_rid=source.rid, rel='target', target_rid=target.rid),
+        Link(source_rid=other_source.rid, rel='target', target_rid=target.rid),
+        Link(source_rid=source.rid, rel='other', target_rid=target.rid),
+        Link(source_rid=source.rid, rel='target', target_rid=other_target.rid),
+    ])
+    session.flush()
+    assert set(storage.get_rev_links(target, 'target')) == {source.rid, other_source.rid}
+    assert storage.get_rev_links(target, 'target', 'test_item') == [source.rid]
+    rev_links = storage.get_rev_links_by_targets(
+        [target.rid, other_target.rid, source.rid], 'target', 'test_item')
+    assert rev_links == {
+        str(target.rid): [source.rid],
+        str(other_target.rid): [source.rid],
+        str(source.rid): [],
+    }
+
+
+def test_bulk_update(session, storage):
+    from snovault.storage import Resource
+    target = Resource('test_item', {'': {}})
+    held = Resource('test_item', {'': {}})
+    session.add_all([target, held])
+    session.flush()
+    storage.update(held, {}, unique_keys={'test:name': ['held']})
+    first = storage.create('test_item', None)
+    second = storage.create('test_item', None)
+    clashing = storage.create('test_item', None)
+    conflicts = storage.bulk_update([
+        (first, {'n': 1}, None, {'test:name': ['first']},
+         {'target': [str(target.rid)]}),
+        (second, {'n': 2}, None, {'test:name': ['second']},
+         {'target': [str(first.rid)]}),
+        (clashing, {'n': 3}, None, {'test:name': ['held']}, {}),
+    ])
+    assert conflicts == {str(clashing.rid): "Keys conflict: [('test:name', 'held')]"}
+    assert first.properties == {'n': 1}
+    assert {(key.name, key.value) for key in first.unique_keys} == {('test:name', 'first')}
+    assert [link.target_rid for link in second.rels] == [first.rid]
+
+    conflicts = storage.bulk_update([
+        (first, {'n': 4}, None, {'test:name': ['renamed']}, {}),
+    ])
+    assert conflicts == {}
+    assert first.properties == {'n': 4}
+    assert [key.value for key in first.unique_keys] == ['renamed']
+    assert first.rels == []
+
+
+def test_bulk_update_link_to_conflicting(session, storage):
+    from snovault.storage import Resource
+    held = Resource('test_item', {'': {}})
+    session.add(held)
+    session.flush()
+    storage.update(held, {}, unique_keys={'test:name': ['held']})
+    clashing = storage.create('test_item', None)
+    linking = storage.create('test_item', None)
+    conflicts = storage.bulk_update([
+        (clashing, {'n': 1}, None, {'test:name': ['held']}, {}),
+        (linking, {'n': 2}, None, {}, {'target': [str(clashing.rid)]}),
+    ])
+    assert conflicts == {
+        str(clashing.rid): "Keys conflict: [('test:name', 'held')]",
+        str(linking.rid): 'Missing link targets: %r' % [str(clashing.rid)],
+    }
+
+
+def test_reverse_embeds(session):
+    import uuid
+    from snovault.elasticsearch.reverse_embeds import (
+        COMPLETE,
+        NIL_UUID,
+        get_reverse_embeds,
+        has_reverse_embeds,
+    )
+    from snovault.storage import ReverseEmbed
+    assert not has_reverse_embeds(session)
+    source, embedded, linked = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    session.add_all([
+        ReverseEmbed(source_rid=source, rel='embedded', target_rid=embedded),
+        ReverseEmbed(source_rid=source, rel='linked', target_rid=linked),
+    ])
+    session.flush()
+    # Partially filled until a full reindex marks it complete
+    assert not has_reverse_embeds(session)
+    session.add(ReverseEmbed(source_rid=NIL_UUID, rel=COMPLETE, target_rid=NIL_UUID))
+    session.flush()
+    assert has_reverse_embeds(session)
+    assert get_reverse_embeds(session, [str(embedded)], []) == {str(source)}
+    assert get_reverse_embeds(session, [], [str(linked)]) == {str(source)}
+    assert get_reverse_embeds(session, [str(linked)], [str(embedded)]) == set()
+
+
 def test_S3BlobStorage_boto3(mocker):
     from snovault.storage import S3BlobStorage
     mocker.patch('boto3.Session.resource')
@@ -51,3 +51,76 @@ def test_declarative_config():
     assert value['step1']
     assert value['step2']
     assert value['schema_version'] == '3'
+
+
+def test_upgraded_cache():
+    from snovault.interfaces import TYPES
+    from snovault.upgrader import Upgrader
+
+    class Registry(dict):
+        settings = {'upgrader.cache_capacity': '10'}
+
+    upgrader = Upgrader(Registry({TYPES: None}))
+    upgrader.set_upgraded('uuid', 'tid1', '3', {'step1': True})
+    upgraded = upgrader.get_upgraded('uuid', 'tid1', '3')
+    assert upgraded == {'step1': True}
+    upgraded['step1'] = False
+    assert upgrader.get_upgraded('uuid', 'tid1', '3') == {'step1': True}
+    assert upgrader.get_upgraded('uuid', 'tid2', '3') is None
+    assert upgrader.get_upgraded('uuid', 'tid1', '4') is None
+    upgrader.forget_upgraded('uuid')
+    assert upgrader.get_upgraded('uuid', 'tid1', '3') is None
+
+
+def test_upgrade_write_back_pending():
+    from snovault.batchupgrade import UpgradeWriteBack
+    write_back = UpgradeWriteBack({}, interval=3600, batchsize=2, max_pending=3)
+    try:
+        for uuid in ['a', 'b', 'c', 'd']:
+            write_back.record(uuid)
+        assert list(write_back.pending) == ['a', 'b', 'c']
+        assert write_back.thread is None
+        write_back.start()
+        assert write_back.thread.daemon
+        assert write_back.pop_batch() == ['a', 'b']
+        assert write_back.pop_batch() == ['c']
+        assert write_back.pop_batch() == []
+        write_back.failed['a'] = True
+        write_back.record('a')
+        assert not write_back.pending
+        for uuid in ['b', 'c', 'd']:
+            write_back.failed[uuid] = True
+        assert len(write_back.failed) == 3
+        assert 'a' not in write_back.failed
+    finally:
+        write_back.stop()
+    assert not write_back.thread.is_alive()
+
+
+@pytest.mark.parametrize('settings', [{'indexer_worker': True}, {'batchupgrade': 'true'}])
+def test_upgrade_write_back_not_in_workers(settings):
+    from pyramid.config import Configurator
+    from snovault.interfaces import UPGRADE_WRITE_BACK
+    config = Configurator(settings=dict(settings, **{'upgrader.write_back': 'true'}))
+    config.include('snovault.batchupgrade')
+    assert UPGRADE_WRITE_BACK not in config.registry
+
+
+def test_compiled_steps(schema_upgrader):
+    schema_upgrader.compile()
+    steps, version = schema_upgrader.chains['', '3']
+    assert [step.step for step in steps] == [step1, step2]
+    assert version == '3'
+    steps, version = schema_upgrader.chains['2', '3']
+    assert [step.step for step in steps] == [step2]
+    schema_upgrader.add_upgrade_step(step1, source='3', dest='4')
+    assert schema_upgrader.chains == {}
+    value = schema_upgrader.upgrade({}, '', '4')
+    assert value == {'step1': True, 'step2': True}
+    assert ('', '4') in schema_upgrader.chains
+
+
+def test_batch_upgrade_iter_batches():
+    from snovault.batchupgrade import _iter_batches
+    batches = _iter_batches(iter(range(5)), 2)
+    assert list(batches) == [['0', '1'], ['2', '3'], ['4']]
@@ -50,6 +50,15 @@ def test_select_distinct_values_skips_calculated(dummy_request, threadlocals, po
     dummy_request.embed.assert_called_with('/testing-link-targets/one/', '@@object?skip_calculated=true')
 
 
+def test_select_distinct_values_prefetches(dummy_request, threadlocals, posted_targets_and_sources, mocker):
+    from snovault import CONNECTION
+    connection = dummy_request.registry[CONNECTION]
+    get_by_uuid = mocker.spy(connection.storage, 'get_by_uuid')
+    distinct_values = select_distinct_values(dummy_request, 'reverse.name', '/testing-link-targets/one/')
+    assert distinct_values == ['A']
+    assert get_by_uuid.call_count == 0
+
+
 def test_types_utils_ensure_list():
     from snovault.util import ensure_list_and_filter_none
     assert ensure_list_and_filter_none('abc') == ['abc']
@@ -289,3 +298,57 @@ def test_util_path_expand_exclude(dummy_request, threadlocals, posted_custom_emb
             }
         ]
     }
+
+
+def test_embedding_plan_tree():
+    from snovault.embedding_plan import EmbeddingPlan
+    from snovault.util import Path
+    plan = EmbeddingPlan(
+        ['lab', 'files.lab'],
+        [Path('files.award', include=['title']), Path('lab')],
+    )
+    assert set(plan.root.children) == {'lab', 'files'}
+    assert plan.root.children['lab'].frame == '@@object'
+    files = plan.root.children['files']
+    assert files.children['award'].frame == '@@filtered_object?include=title'
+    assert plan.depth == 2
+
+
+def test_embedding_plan_matches_expand_path(dummy_request, threadlocals, posted_custom_embed_targets_and_sources):
+    from snovault.embedding_plan import EmbeddingPlan
+    from snovault.util import (
+        Path,
+        expand_path,
+    )
+    path = '/testing-custom-embed-targets/one/@@object'
+    embedded = ['reverse.target']
+    embedded_with_frame = [Path('filtered_reverse', include=['uuid', 'status'])]
+    expected = dummy_request.embed(path)
+    for p in embedded:
+        expand_path(dummy_request, expected, p)
+    for p in embedded_with_frame:
+        p.expand(dummy_request, expected)
+    properties = dummy_request.embed(path)
+    EmbeddingPlan(embedded, embedded_with_frame).expand(dummy_request, properties)
+    assert properties == expected
+    assert properties['reverse'][0]['target']['name'] == 'one'
+    assert dummy_request.embed(path)['reverse'][0].startswith('/testing-custom-embed-sources/')
+
+
+def test_embedding_plan_cached_render_skips_storage(
+        dummy_request, threadlocals, posted_custom_embed_targets_and_sources, mocker):
+    from snovault import CONNECTION
+    from snovault.embedding_plan import EmbeddingPlan
+    path = '/testing-custom-embed-targets/one/@@object'
+    plan = EmbeddingPlan(['reverse.target'])
+    plan.expand(dummy_request, dummy_request.embed(path))
+    connection = dummy_request.registry[CONNECTION]
+    get_link_targets = mocker.spy(connection.storage, 'get_link_targets')
+    properties = dummy_request.embed(path)
+    plan.expand(dummy_request, properties)
+    assert properties['reverse'][0]['target']['name'] == 'one'
+    assert get_link_targets.call_count == 0
+    prefetch_link_targets = mocker.spy(connection, 'prefetch_link_targets')
+    dummy_request.datastore = 'elasticsearch'
+    plan.expand(dummy_request, dummy_request.embed(path))
+    assert prefetch_link_targets.call_count == 0
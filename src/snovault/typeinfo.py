@@ -1,6 +1,7 @@
 from collections import defaultdict
 from functools import reduce
 from pyramid.decorator import reify
+from .embedding_plan import EmbeddingPlan
 from .interfaces import (
     CALCULATED_PROPERTIES,
     TYPES,
@@ -57,6 +58,10 @@ class TypeInfo(AbstractTypeInfo):
         self.embedded_with_frame = factory.embedded_with_frame
         self.embedded_paths = factory.embedded_paths()
 
+    @reify
+    def embedding_plan(self):
+        return EmbeddingPlan(self.embedded, self.embedded_with_frame)
+
     @reify
     def calculated_properties(self):
         return self.registry[CALCULATED_PROPERTIES]
@@ -6,7 +6,13 @@ from pkg_resources import parse_version
 from pyramid.interfaces import (
     PHASE1_CONFIG,
 )
-from .interfaces import PHASE2_5_CONFIG
+from .cache import LRUCache
+from .interfaces import (
+    PHASE2_5_CONFIG,
+    PHASE3_5_CONFIG,
+)
+from .util import quick_deepcopy
+import threading
 import venusian
 
 
@@ -19,6 +25,9 @@ def includeme(config):
     config.add_directive(
         'set_default_upgrade_finalizer', set_default_upgrade_finalizer)
     config.add_request_method(upgrade, 'upgrade')
+    config.action(
+        'compile_upgrade_steps',
+        config.registry[UPGRADER].compile, order=PHASE3_5_CONFIG)
 
 
 class ConfigurationError(Exception):
@@ -45,6 +54,47 @@ class Upgrader(object):
         self.types = registry[TYPES]
         self.schema_upgraders = {}
         self.default_finalizer = None
+        settings = getattr(registry, 'settings', None) or {}
+        capacity = int(settings.get('upgrader.cache_capacity', 10000))
+        max_bytes = int(settings.get('upgrader.cache_max_bytes') or 0)
+        # Upgraded properties by uuid, shared by the threads of a process
+        self.upgraded_cache = LRUCache(capacity, max_bytes=max_bytes or None) if capacity else None
+        self.upgraded_cache_lock = threading.Lock()
+
+    def get_upgraded(self, uuid, tid, target_version):
+        """ A copy of the memoized upgraded properties of an item version
+        """
+        if self.upgraded_cache is None:
+            return None
+        with self.upgraded_cache_lock:
+            try:
+                cached_tid, cached_version, properties = self.upgraded_cache[uuid]
+            except KeyError:
+                return None
+        if cached_tid != tid or cached_version != target_version:
+            return None
+        return quick_deepcopy(properties)
+
+    def set_upgraded(self, uuid, tid, target_version, properties):
+        if self.upgraded_cache is None:
+            return
+        properties = quick_deepcopy(properties)
+        with self.upgraded_cache_lock:
+            self.upgraded_cache[uuid] = (tid, target_version, properties)
+
+    def forget_upgraded(self, uuid):
+        """ Drop the memo of an item written in this process
+
+        Writes within a transaction can keep the tid the same.
+        """
+        if self.upgraded_cache is None:
+            return
+        with self.upgraded_cache_lock:
+            self.upgraded_cache.pop(uuid)
+
+    def compile(self):
+        for schema_upgrader in self.schema_upgraders.values():
+            schema_upgrader.compile()
 
     def add_upgrade(self, schema_name, version, finalizer=None):
         if schema_name in self.schema_upgraders:
@@ -75,6 +125,8 @@ class SchemaUpgrader(object):
         self.__name__ = name
         self.version = version
         self.upgrade_steps = {}
+        # (current_version, target_version): (steps, version reached)
+        self.chains = {}
         self.finalizer = finalizer
 
     def add_upgrade_step(self, step, source='', dest=None):
@@ -85,10 +137,33 @@ class SchemaUpgrader(object):
         if parse_version(source) in self.upgrade_steps:
             raise ConfigurationError('duplicate step for source', source)
         self.upgrade_steps[parse_version(source)] = UpgradeStep(step, source, dest)
-
-    def upgrade(self, value, current_version='', target_version=None, **kw):
+        self.chains = {}
+
+    def compile(self):
+        """ Precompute the steps from every known version to every later one
+        """
+        self.chains = {}
+        versions = {''}
+        for step in self.upgrade_steps.values():
+            versions.update([step.source, step.dest])
+        versions.add(self.version)
+        versions = sorted(versions, key=parse_version)
+        for index, current_version in enumerate(versions):
+            for target_version in versions[index:]:
+                try:
+                    self.steps(current_version, target_version)
+                except UpgradePathNotFound:
+                    pass
+
+    def steps(self, current_version='', target_version=None):
+        """ The steps from current to target version, and the version reached
+        """
         if target_version is None:
             target_version = self.version
+        try:
+            return self.chains[current_version, target_version]
+        except KeyError:
+            pass
 
         if parse_version(current_version) > parse_version(target_version):
             raise VersionTooHigh(self.__name__, current_version, target_version)
@@ -120,6 +195,12 @@ class SchemaUpgrader(object):
             raise UpgradePathNotFound(
                 self.__name__, current_version, target_version, version)
 
+        chain = self.chains[current_version, target_version] = (tuple(steps), version)
+        return chain
+
+    def upgrade(self, value, current_version='', target_version=None, **kw):
+        steps, version = self.steps(current_version, target_version)
+
         # Apply the steps
 
         system = {}
@@ -1,6 +1,9 @@
 from past.builtins import basestring
 from pyramid.threadlocal import manager as threadlocal_manager
-from snovault.interfaces import ROOT
+from snovault.interfaces import (
+    CONNECTION,
+    ROOT,
+)
 from urllib.parse import urlencode
 
 
@@ -47,14 +50,20 @@ def expand_path(request, obj, path):
     value = obj.get(name, None)
     if value is None:
         return
+    # Values may be shared with the embed cache, so copy before writing.
     if isinstance(value, list):
+        value = obj[name] = list(value)
         for index, member in enumerate(value):
             if not isinstance(member, dict):
                 member = value[index] = request.embed(member, '@@object')
+            elif remaining:
+                member = value[index] = dict(member)
             expand_path(request, member, remaining)
     else:
         if not isinstance(value, dict):
             value = obj[name] = request.embed(value, '@@object')
+        elif remaining:
+            value = obj[name] = dict(value)
         expand_path(request, value, remaining)
 
 
@@ -79,7 +88,11 @@ def select_distinct_values(request, value_path, *from_paths):
     if isinstance(value_path, basestring):
         value_path = value_path.split('.')
     values = from_paths
+    conn = request.registry[CONNECTION]
     for name in value_path:
+        # Load members addressed by uuid with one storage call, as
+        # uuid_to_path does, rather than one per embed
+        conn.get_by_uuids(member.rstrip('/').rsplit('/', 1)[-1] for member in values)
         calculated_properties = _get_calculated_properties_from_paths(request, values)
         # Don't waste time calculating properties if the field isn't calculated.
         frame = '@@object' if name in calculated_properties else '@@object?skip_calculated=true'
@@ -176,13 +189,18 @@ class Path:
         if value is None:
             return
         if isinstance(value, list):
+            value = properties[name] = list(value)
             for index, member in enumerate(value):
                 if not isinstance(member, dict):
                     member = value[index] = request.embed(member, frame)
+                elif remaining:
+                    member = value[index] = dict(member)
                 self.expand_path_with_frame(request, member, remaining, frame)
         else:
             if not isinstance(value, dict):
                 value = properties[name] = request.embed(value, frame)
+            elif remaining:
+                value = properties[name] = dict(value)
             self.expand_path_with_frame(request, value, remaining, frame)
 
     def expand(self, request, properties):
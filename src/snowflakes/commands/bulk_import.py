@@ -0,0 +1,110 @@
+"""\
+Bulk import workbook data into a new database
+
+Rows are validated and written with Postgres COPY in a single transaction
+instead of being posted one at a time, followed by a full reindex. Meant
+for bootstrapping an environment, use import-data for updates.
+
+Examples
+
+    %(prog)s --attach $DIR_HOLDING_ATTACHMENTS \\
+        ../documents-export.zip development.ini --app-name app
+
+"""
+from pyramid.paster import get_app
+from pyramid.scripting import prepare
+from snovault.bulk_load import BulkLoader
+from snovault.commands.es_index_data import run as index_data
+from .. import loadxl
+import logging
+import sys
+import transaction
+
+EPILOG = __doc__
+
+logger = logging.getLogger(__name__)
+
+
+def read_rows(filename, docsdir, item_type, test=False, report=False):
+    try:
+        source = loadxl.read_single_sheet(filename, item_type)
+    except ValueError:
+        if report:
+            logger.error('Opening %s %s failed.', filename, item_type)
+        return
+    pipeline = loadxl.get_row_pipeline(docsdir, test)
+    for row in loadxl.combine(source, pipeline):
+        if row.get('_skip'):
+            continue
+        if row.get('_errors'):
+            if report:
+                logger.error('%s %s: %s', item_type, row.get('uuid'), row['_errors'])
+            continue
+        # Keys with leading underscores are for communicating between
+        # sections
+        yield {
+            k: v for k, v in row.items() if not k.startswith('_') and not k.startswith('@')
+        }
+
+
+def run(app, filename, docsdir, test=False):
+    env = prepare(registry=app.registry)
+    request = env['request']
+    request.root = env['root']
+    request.datastore = 'database'
+    try:
+        loader = BulkLoader(app.registry)
+        for item_type in loadxl.ORDER:
+            loader.register(item_type, read_rows(filename, docsdir, item_type, test))
+        for item_type in loadxl.ORDER:
+            count = loader.add(
+                item_type, read_rows(filename, docsdir, item_type, test, report=True))
+            logger.info('Validated %d %s rows', count, item_type)
+        if loader.errors:
+            logger.error('%d rows failed, nothing was imported', len(loader.errors))
+            transaction.abort()
+            return False
+        loader.write()
+        transaction.commit()
+    except Exception:
+        transaction.abort()
+        raise
+    finally:
+        env['closer']()
+    logger.info('Imported %d items', sum(loader.counts.values()))
+    return True
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Bulk import data", epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--test-only', action='store_true')
+    parser.add_argument('--attach', '-a', action='append', default=[],
+                        help="Directory to search for attachments")
+    parser.add_argument('--no-index', action='store_true',
+                        help="Skip the full reindex after importing")
+    parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument('inpath', help="input zip file of excel sheets.")
+    parser.add_argument('config_uri', help="path to configfile")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    options = {} if args.no_index else {'indexer': 'true'}
+    app = get_app(args.config_uri, args.app_name, options)
+
+    # Loading app will have configured from config file. Reconfigure here:
+    logging.getLogger('snowflakes').setLevel(logging.INFO)
+    logging.getLogger('snovault').setLevel(logging.INFO)
+
+    if not run(app, args.inpath, args.attach, args.test_only):
+        sys.exit(1)
+    if not args.no_index and 'elasticsearch.server' in app.registry.settings:
+        # A single full reindex rather than one per item
+        index_data(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -91,6 +91,10 @@ def main():
     parser.add_argument('--attach', '-a', action='append', default=[],
         help="Directory to search for attachments")
     parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument('--processes', type=int, default=1,
+        help="Load independent types concurrently (configfile only)")
+    parser.add_argument('--batchsize', type=int, default=100,
+        help="Rows per batch when loading concurrently")
     parser.add_argument('inpath',
         help="input zip file/directory of excel/csv/tsv sheets.")
     parser.add_argument('url',
@@ -112,6 +116,12 @@ def main():
                 assert not args.password
                 password = url.password
         testapp = remote_app(base, username, password)
+    elif args.processes > 1 and not args.method:
+        loadxl.load_all_parallel(
+            args.url, args.inpath, args.attach, args.test_only,
+            app_name=args.app_name, username=args.username,
+            processes=args.processes, batchsize=args.batchsize)
+        return
     else:
         testapp = internal_app(args.url, args.app_name, args.username)
 
@@ -140,18 +140,23 @@ def add_attachments(docsdir):
 # but it's better to check tsv into git.
 
 
+SHEET_EXTENSIONS = ('.xlsx', '.tsv', '.csv', '.json')
+
+
 def read_single_sheet(path, name=None):
-    """ Read an xlsx, csv or tsv from a zipfile or directory
+    """ Read an xlsx, csv, tsv or json from a zipfile or directory
+
+    Rows are read lazily, one at a time.
     """
     from zipfile import ZipFile
-    from . import xlreader
 
     if name is None:
         root, ext = os.path.splitext(path)
-        stream = open(path, 'r')
 
         if ext == '.xlsx':
-            return read_xl(stream)
+            return read_xl(open(path, 'rb'))
+
+        stream = open(path, 'r')
 
         if ext == '.tsv':
             return read_csv(stream, dialect='excel-tab')
@@ -165,7 +170,7 @@ def read_single_sheet(path, name=None):
         raise ValueError('Unknown file extension for %r' % path)
 
     if path.endswith('.xlsx'):
-        return cast_row_values(xlreader.DictReader(open(path, 'rb'), sheetname=name))
+        return read_xl(open(path, 'rb'), sheetname=name)
 
     if path.endswith('.zip'):
         zf = ZipFile(path)
@@ -209,9 +214,31 @@ def read_single_sheet(path, name=None):
     return []
 
 
-def read_xl(stream):
+def has_sheet(path, name):
+    """ Whether read_single_sheet has a sheet for name, without reading it
+    """
+    from zipfile import ZipFile
+
+    if path.endswith('.xlsx'):
+        from . import xlreader
+        with open(path, 'rb') as stream:
+            return name in xlreader.sheetnames(stream)
+
+    if path.endswith('.zip'):
+        with ZipFile(path) as zf:
+            names = set(zf.namelist())
+        return any(name + ext in names for ext in SHEET_EXTENSIONS)
+
+    if os.path.isdir(path):
+        root = os.path.join(path, name)
+        return any(os.path.exists(root + ext) for ext in SHEET_EXTENSIONS)
+
+    return False
+
+
+def read_xl(stream, sheetname=None):
     from . import xlreader
-    return cast_row_values(xlreader.DictReader(stream))
+    return cast_row_values(xlreader.DictReader(stream, sheetname=sheetname))
 
 
 def read_csv(stream, **kw):
@@ -219,12 +246,66 @@ def read_csv(stream, **kw):
     return cast_row_values(csv.DictReader(stream, **kw))
 
 
-def read_json(stream):
+def read_json(stream, chunk_size=2 ** 16):
+    """ Items of a json array, a single object or newline delimited json
+
+    Items are decoded one at a time as the stream is read, so memory use is
+    bounded by the largest item rather than the file.
+    """
     import json
-    obj = json.load(stream)
-    if isinstance(obj, dict):
-        return [obj]
-    return obj
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def skip_whitespace():
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            buf, pos = stream.read(chunk_size), 0
+            eof = not buf
+
+    def decode():
+        nonlocal buf, pos, eof
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                # A number may continue in the next chunk
+                if end < len(buf) or eof:
+                    pos = end
+                    return obj
+            # Read at least as much again, so large items decode in linear time
+            more = stream.read(max(chunk_size, len(buf) - pos))
+            buf, pos = buf[pos:] + more, 0
+            eof = not more
+
+    skip_whitespace()
+    if buf[pos:pos + 1] != '[':
+        while pos < len(buf):
+            yield decode()
+            skip_whitespace()
+        return
+
+    pos += 1
+    skip_whitespace()
+    if buf[pos:pos + 1] == ']':
+        return
+    while True:
+        yield decode()
+        skip_whitespace()
+        if buf[pos:pos + 1] == ']':
+            return
+        if buf[pos:pos + 1] != ',':
+            raise ValueError('Expected , or ] in json array at %r' % buf[pos:pos + 20])
+        pos += 1
+        skip_whitespace()
 
 
 ##############################################################################
@@ -298,7 +379,7 @@ def trim(value):
     return value
 
 
-def pipeline_logger(item_type, phase):
+def pipeline_logger(item_type, phase, start=0):
     def component(rows):
         created = 0
         updated = 0
@@ -306,7 +387,7 @@ def pipeline_logger(item_type, phase):
         skipped = 0
         count = 0
         for index, row in enumerate(rows):
-            row_number = index + 2  # header row
+            row_number = start + index + 2  # header row
             count = index + 1
             res = row.get('_response')
 
@@ -370,6 +451,19 @@ def find_doc(docsdir, filename):
     return path
 
 
+def data_uri(stream, mime_type, chunk_size=3 * 2 ** 16):
+    """ Base64 encode stream in chunks rather than reading it whole
+
+    chunk_size must be a multiple of 3 so the chunks encode without padding.
+    """
+    from base64 import b64encode
+    out = io.StringIO()
+    out.write('data:%s;base64,' % mime_type)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        out.write(b64encode(chunk).decode('ascii'))
+    return out.getvalue()
+
+
 def attachment(path):
     """ Create an attachment upload object from a filename
 
@@ -378,7 +472,6 @@ def attachment(path):
     import magic
     import mimetypes
     from PIL import Image
-    from base64 import b64encode
 
     filename = os.path.basename(path)
     mime_type, encoding = mimetypes.guess_type(path)
@@ -394,7 +487,7 @@ def attachment(path):
         attach = {
             'download': filename,
             'type': mime_type,
-            'href': 'data:%s;base64,%s' % (mime_type, b64encode(stream.read()).decode('ascii'))
+            'href': data_uri(stream, mime_type),
         }
 
         if mime_type in ('application/pdf', 'text/plain', 'text/tab-separated-values', 'text/html'):
@@ -433,8 +526,10 @@ def process(rows):
         pass
 
 
-def get_pipeline(testapp, docsdir, test_only, item_type, phase=None, method=None):
-    pipeline = [
+def get_row_pipeline(docsdir, test_only):
+    """ Components selecting and cleaning the rows to load
+    """
+    return [
         skip_rows_with_all_key_value(test='skip'),
         skip_rows_with_all_key_value(_test='skip'),
         skip_rows_with_all_falsey_value('test') if test_only else noop,
@@ -444,6 +539,21 @@ def get_pipeline(testapp, docsdir, test_only, item_type, phase=None, method=None
         remove_keys('schema_version'),
         add_attachments(docsdir),
     ]
+
+
+def get_request_pipeline(testapp, item_type, method, phase=None, start=0):
+    """ Components sending the rows to the app
+    """
+    return [
+        request_url(item_type, method),
+        remove_keys('uuid') if method in ('PUT', 'PATCH') else noop,
+        make_request(testapp, item_type, method),
+        pipeline_logger(item_type, phase, start),
+    ]
+
+
+def get_pipeline(testapp, docsdir, test_only, item_type, phase=None, method=None):
+    pipeline = get_row_pipeline(docsdir, test_only)
     if phase == 1:
         method = 'POST'
         pipeline.extend(PHASE1_PIPELINES.get(item_type, []))
@@ -451,20 +561,20 @@ def get_pipeline(testapp, docsdir, test_only, item_type, phase=None, method=None
         method = 'PUT'
         pipeline.extend(PHASE2_PIPELINES.get(item_type, []))
 
-    pipeline.extend([
-        request_url(item_type, method),
-        remove_keys('uuid') if method in ('PUT', 'PATCH') else noop,
-        make_request(testapp, item_type, method),
-        pipeline_logger(item_type, phase),
-    ])
+    pipeline.extend(get_request_pipeline(testapp, item_type, method, phase))
     return pipeline
 
 
 # Additional pipeline sections for item types
 
+# Links loaded in the second phase, see below
+PHASE2_LINKS = {
+    'user': ('lab', 'submits_for'),
+}
+
 PHASE1_PIPELINES = {
     'user': [
-        remove_keys('lab', 'submits_for'),
+        remove_keys(*PHASE2_LINKS['user']),
     ],
 }
 
@@ -478,7 +588,7 @@ PHASE1_PIPELINES = {
 
 PHASE2_PIPELINES = {
     'user': [
-        skip_rows_missing_all_keys('lab', 'submits_for'),
+        skip_rows_missing_all_keys(*PHASE2_LINKS['user']),
     ],
 }
 
@@ -504,6 +614,205 @@ def load_all(testapp, filename, docsdir, test=False):
         process(combine(source, pipeline))
 
 
+##############################################################################
+# Parallel loading
+#
+# Types are loaded as soon as every type they link to has been loaded, in
+# batches spread over a pool of processes each holding its own app.
+
+
+def schema_link_types(prop):
+    """ Names of the types a schema property links to
+    """
+    link_to = prop.get('linkTo')
+    if link_to:
+        for name in ([link_to] if isinstance(link_to, basestring) else link_to):
+            yield name
+    if 'items' in prop:
+        yield from schema_link_types(prop['items'])
+    for subprop in prop.get('properties', {}).values():
+        yield from schema_link_types(subprop)
+
+
+def type_dependencies(types, item_types):
+    """ Map each item type to the item types it links to
+
+    Links loaded in the second phase are left out to break cycles.
+    """
+    dependencies = {}
+    for item_type in item_types:
+        schema = types[item_type].factory.schema or {}
+        deferred = PHASE2_LINKS.get(item_type, ())
+        linked = set()
+        for name, prop in schema.get('properties', {}).items():
+            if name in deferred:
+                continue
+            for type_name in schema_link_types(prop):
+                linked.update(types[subtype].item_type for subtype in types[type_name].subtypes)
+        dependencies[item_type] = linked.intersection(item_types)
+    return dependencies
+
+
+def iter_batches(rows, batchsize=None):
+    """ Lists of at most batchsize rows, all in one list without batchsize
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if batchsize and len(batch) >= batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+testapp = None
+
+
+def _pool_initializer(config_uri, app_name=None, username=None):
+    from .commands.import_data import internal_app
+    global testapp
+    testapp = internal_app(config_uri, app_name, username)
+
+
+def _pool_worker(item_type, method, phase, start, rows):
+    sent = 0
+    loaded = 0
+    # Rows failing in the row pipeline are not sent
+    errors = sum(1 for row in rows if row.get('_errors') and not row.get('_skip'))
+    pipeline = get_request_pipeline(testapp, item_type, method, phase, start)
+    for row in combine(iter(rows), pipeline):
+        sent += 1
+        if row['_response'].status_int in (200, 201):
+            loaded += 1
+        else:
+            errors += 1
+    return item_type, phase, sent, loaded, errors
+
+
+def schedule(pool, item_types, dependencies, batches, max_pending):
+    """ Run the batches of item_types on pool, each type after those it links to
+
+    batches(item_type, phase) yields (method, rows) for each batch of a type.
+    The second phase starts once the first is done for all types. Batches are
+    read as they are submitted, at most max_pending at a time. Rows of types
+    linking to themselves may depend on earlier rows, so their batches run
+    one after the other.
+    """
+    import queue
+    import time
+
+    results = queue.Queue()
+    running = {}
+    in_flight = 0
+
+    def start(item_type, phase):
+        running[item_type, phase] = {
+            'batches': iter(batches(item_type, phase)), 'pending': 0, 'offset': 0,
+            'rows': 0, 'loaded': 0, 'errors': 0, 'start': time.time(),
+        }
+
+    def fill():
+        nonlocal in_flight
+        for (item_type, phase), stats in list(running.items()):
+            serial = item_type in dependencies[item_type]
+            while stats['batches'] is not None and in_flight < max_pending:
+                if serial and stats['pending']:
+                    break
+                try:
+                    method, rows = next(stats['batches'])
+                except StopIteration:
+                    stats['batches'] = None
+                    break
+                pool.apply_async(
+                    _pool_worker, (item_type, method, phase, stats['offset'], rows),
+                    callback=results.put, error_callback=results.put)
+                stats['pending'] += 1
+                stats['offset'] += len(rows)
+                in_flight += 1
+
+    def wait():
+        nonlocal in_flight
+        result = results.get()
+        in_flight -= 1
+        if isinstance(result, Exception):
+            raise result
+        item_type, phase, count, loaded, errors = result
+        stats = running[item_type, phase]
+        stats['pending'] -= 1
+        stats['rows'] += count
+        stats['loaded'] += loaded
+        stats['errors'] += errors
+
+    def step():
+        fill()
+        if in_flight:
+            wait()
+        for key, stats in list(running.items()):
+            if stats['batches'] is not None or stats['pending']:
+                continue
+            del running[key]
+            elapsed = time.time() - stats['start']
+            logger.info(
+                'Loaded %d of %d %s (phase %d) in %.1fs, %.1f rows/s. ERRORS: %d',
+                stats['loaded'], stats['rows'], key[0], key[1], elapsed,
+                stats['rows'] / max(elapsed, 1e-6), stats['errors'])
+            yield key
+
+    pending = list(item_types)
+    done = set()
+    while pending or running:
+        for item_type in [t for t in pending if dependencies[t] - {t} <= done]:
+            pending.remove(item_type)
+            start(item_type, 1)
+        if not running:
+            raise ValueError('Reference cycle between types: %r' % pending)
+        done.update(item_type for item_type, phase in step())
+
+    for item_type in item_types:
+        if item_type in PHASE2_PIPELINES:
+            start(item_type, 2)
+    while running:
+        list(step())
+
+
+def load_all_parallel(config_uri, filename, docsdir, test=False, app_name=None,
+                      username=None, processes=4, batchsize=100):
+    """ Load as load_all does, with independent types loaded concurrently
+    """
+    from multiprocessing import get_context
+    from multiprocessing.pool import Pool
+    from pyramid import paster
+    from snovault import TYPES
+
+    app = paster.get_app(config_uri, app_name)
+    item_types = [item_type for item_type in ORDER if has_sheet(filename, item_type)]
+    dependencies = type_dependencies(app.registry[TYPES], item_types)
+
+    def batches(item_type, phase):
+        if phase == 1:
+            method = 'POST'
+            pipeline = get_row_pipeline(docsdir, test) + PHASE1_PIPELINES.get(item_type, [])
+        else:
+            method = 'PUT'
+            pipeline = get_row_pipeline(docsdir, test) + PHASE2_PIPELINES.get(item_type, [])
+        rows = combine(read_single_sheet(filename, item_type), pipeline)
+        for batch in iter_batches(rows, batchsize):
+            yield method, batch
+
+    pool = Pool(
+        processes=processes,
+        initializer=_pool_initializer,
+        initargs=(config_uri, app_name, username),
+        context=get_context('forkserver'),
+    )
+    try:
+        schedule(pool, item_types, dependencies, batches, processes * 2)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def load_test_data(app):
     from webtest import TestApp
     environ = {
@@ -0,0 +1,136 @@
+import pytest
+
+from ..loadxl import ORDER
+
+
+def test_type_dependencies(registry):
+    from snovault import TYPES
+    from ..loadxl import type_dependencies
+    dependencies = type_dependencies(registry[TYPES], ORDER)
+    assert {'user', 'award'} <= dependencies['lab']
+    # Loaded in the second phase
+    assert 'lab' not in dependencies['user']
+    done = set()
+    pending = list(ORDER)
+    while pending:
+        ready = [t for t in pending if dependencies[t] - {t} <= done]
+        assert ready, pending
+        done.update(ready)
+        pending = [t for t in pending if t not in ready]
+
+
+def test_iter_batches():
+    from ..loadxl import iter_batches
+    assert list(iter_batches(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_batches(iter(range(5)))) == [[0, 1, 2, 3, 4]]
+    assert list(iter_batches(iter([]), 2)) == []
+
+
+def test_schedule(monkeypatch):
+    import threading
+    from multiprocessing.pool import ThreadPool
+    from .. import loadxl
+    lock = threading.Lock()
+    read = []
+    completed = []
+
+    def batches(item_type, phase):
+        for start in range(0, 10, 2):
+            with lock:
+                # Batches are read lazily, a bounded number ahead of the workers
+                assert len(read) - len(completed) < 2
+                if item_type == 'lab':
+                    assert sorted(c for c in completed if c[:2] == ('user', 1)) == sorted(
+                        c for c in read if c[:2] == ('user', 1))
+                    # Linking to itself, one batch at a time
+                    assert sorted(c for c in completed if c[0] == 'lab') == sorted(
+                        c for c in read if c[0] == 'lab')
+                read.append((item_type, phase, start))
+            yield 'POST', [{'n': start}, {'_skip': True}]
+
+    def worker(item_type, method, phase, start, rows):
+        with lock:
+            completed.append((item_type, phase, start))
+        return item_type, phase, len(rows) - 1, len(rows) - 1, 0
+
+    monkeypatch.setattr(loadxl, '_pool_worker', worker)
+    dependencies = {'user': set(), 'lab': {'user', 'lab'}}
+    pool = ThreadPool(4)
+    try:
+        loadxl.schedule(pool, ['user', 'lab'], dependencies, batches, 2)
+    finally:
+        pool.terminate()
+        pool.join()
+    assert sorted(read) == sorted(completed)
+    assert [(t, p) for t, p, s in completed[-5:]] == [('user', 2)] * 5
+    assert sorted(s for t, p, s in completed if (t, p) == ('lab', 1)) == [0, 2, 4, 6, 8]
+
+
+def test_has_sheet(tmpdir):
+    import zipfile
+    from ..loadxl import has_sheet
+    tmpdir.join('lab.tsv').write('name\n')
+    assert has_sheet(str(tmpdir), 'lab')
+    assert not has_sheet(str(tmpdir), 'user')
+    path = str(tmpdir.join('inserts.zip'))
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('user.json', '[]')
+    assert has_sheet(path, 'user')
+    assert not has_sheet(path, 'lab')
+    path = str(tmpdir.join('inserts.xlsx'))
+    with open(path, 'wb') as f:
+        f.write(xlsx([['name']]).read())
+    assert has_sheet(path, 'things')
+    assert not has_sheet(path, 'lab')
+
+
+def test_read_json():
+    import io
+    from ..loadxl import read_json
+    array = '[{"a": 1}, {"b": ["]", 2]}]'
+    lines = '{"a": 1}\n{"b": ["]", 2]}\n'
+    for text in (array, lines):
+        for chunk_size in (1, 4, 2 ** 16):
+            rows = read_json(io.StringIO(text), chunk_size)
+            assert list(rows) == [{'a': 1}, {'b': [']', 2]}]
+    assert list(read_json(io.StringIO('{"a": 1}'))) == [{'a': 1}]
+    assert list(read_json(io.StringIO(' [ ] '))) == []
+
+
+def xlsx(rows, formats=()):
+    import io
+    import openpyxl
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.title = 'things'
+    for row in rows:
+        sheet.append(row)
+    for ref, number_format in formats:
+        sheet[ref].number_format = number_format
+    stream = io.BytesIO()
+    book.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def test_read_xl():
+    import datetime
+    from ..loadxl import read_xl
+    stream = xlsx([
+        ['name', 'count:integer', 'date', 'time', 'flag'],
+        ['one', 2.0, datetime.date(2019, 1, 31), datetime.datetime(2019, 1, 1, 12, 30), True],
+        ['two'],
+    ], formats=[('C2', 'dd/mm/yyyy')])
+    assert list(read_xl(stream, sheetname='things')) == [
+        {'name': 'one', 'count': 2, 'date': '2019-01-31', 'time': '2019-01-01T12:30:00',
+         'flag': 'TRUE'},
+        {'name': 'two', 'count': None, 'date': '', 'time': '', 'flag': ''},
+    ]
+    assert list(read_xl(xlsx([['name']]), sheetname='missing')) == []
+
+
+def test_read_xl_error():
+    from ..loadxl import read_xl
+    stream = xlsx([['name'], ['#N/A']])
+    with pytest.raises(ValueError):
+        list(read_xl(stream))
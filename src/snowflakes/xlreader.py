@@ -1,57 +1,70 @@
-"""csv compatible interface for xlrd sheets
+"""csv compatible interface for xlsx sheets
+
+Workbooks are opened with openpyxl in read only mode, which parses sheets
+row by row, so memory use does not grow with the number of rows.
 """
 
 import csv
 import datetime
+import openpyxl
 import os.path
-import xlrd
 import zipfile
 
 
-def cell_value(cell, datemode):
-    ctype = cell.ctype
+def cell_value(cell):
     value = cell.value
 
-    if ctype == xlrd.XL_CELL_ERROR:
+    if cell.data_type == 'e':
         raise ValueError(repr(cell), 'cell error')
 
-    elif ctype == xlrd.XL_CELL_BOOLEAN:
+    elif value is None:
+        return ''
+
+    elif isinstance(value, bool):
         return str(value).upper()
 
-    elif ctype == xlrd.XL_CELL_NUMBER:
+    elif isinstance(value, datetime.datetime):
+        if value.time() == datetime.time():
+            return value.date().isoformat()
+        return value.isoformat()
+
+    elif isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+
+    elif isinstance(value, float):
         if value.is_integer():
             value = int(value)
         return str(value)
 
-    elif ctype == xlrd.XL_CELL_DATE:
-        value = xlrd.xldate_as_tuple(value, datemode)
-        if value[3:] == (0, 0, 0):
-            return datetime.date(*value[:3]).isoformat()
-        else:
-            return datetime.datetime(*value).isoformat()
-
-    elif ctype in (xlrd.XL_CELL_TEXT, xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
-        return value
+    elif isinstance(value, (int, str)):
+        return str(value)
 
     raise ValueError(repr(cell), 'unknown cell type')
 
 
+def sheetnames(stream):
+    book = openpyxl.load_workbook(stream, read_only=True)
+    try:
+        return book.sheetnames
+    finally:
+        book.close()
+
 
 def reader(stream, sheetname=None):
     """ Read named sheet or first and only sheet from xlsx file
     """
-    book = xlrd.open_workbook(file_contents=stream.read())
-    if sheetname is None:
-        sheet, = book.sheets()        
-    else:
-        try:
-            sheet = book.sheet_by_name(sheetname)
-        except xlrd.XLRDError:
+    book = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        if sheetname is None:
+            sheet, = book.worksheets  # Only single worksheet books are handled
+        elif sheetname in book.sheetnames:
+            sheet = book[sheetname]
+        else:
             return
-
-    datemode = sheet.book.datemode
-    for index in range(sheet.nrows):
-        yield [cell_value(cell, datemode) for cell in sheet.row(index)]
+        for row in sheet.iter_rows():
+            yield [cell_value(cell) for cell in row]
+    finally:
+        book.close()
 
 
 class DictReader:
@@ -109,15 +122,11 @@ class DictReader:
 def zipfile_to_csv(zipfilename, outpath, ext='.csv', dialect='excel', **fmtparams):
     """ For Google Drive download zips
     """
-    zf = ZipFile(zipfilename)
+    zf = zipfile.ZipFile(zipfilename)
     for name in zf.namelist():
         subpath, entry_ext = os.path.splitext(name)
         if entry_ext.lower() != '.xlsx':
             continue
-        f = zf.open(name)
-        book = xlrd.open_workbook(file_contents=f.read())
-        sheet, = book.sheets()  # Only single worksheet books are handled
-        csvfile = open(os.path.join(outpath, subpath + ext), 'w')
-        wr = csv.writer(csvfile, dialect=dialect, **fmtparams)
-        wr.writerows(list(reader(sheet)))
-
+        with zf.open(name) as f, open(os.path.join(outpath, subpath + ext), 'w') as csvfile:
+            wr = csv.writer(csvfile, dialect=dialect, **fmtparams)
+            wr.writerows(reader(f))